@@ -39,7 +39,7 @@
 # Distributed under the [MIT License](http://creativecommons.org/licenses/MIT/)
 
 _git_issius () {
-   local subcommands="comment myissues show list update pull delete new close push edit"
+   local subcommands="comment myissues show list search update pull delete new close push edit batch migrate daemon"
    local subcommand="$(__git_find_on_cmdline "$subcommands")"
    if [ -z "$subcommand" ]; then
       __gitcomp "$subcommands"
@@ -60,8 +60,14 @@ _git_issius () {
 
       show)
          case "$cur" in
+            --format=*)
+               __gitissius_complete_format
+               ;;
+            --fields=*)
+               __gitissius_complete_fields
+               ;;
             -*)
-               __gitcomp "--help --all"
+               __gitcomp "--help --all --format= --fields="
                ;;
             *)
                __gitcomp "$(__gitissius_list_issues)"
@@ -73,23 +79,41 @@ _git_issius () {
          case "$cur" in
             --filter=*)
                cur=${cur:9} # Remove the option, i.e. '--filter=', as bash would otherwise repeat it
-               # Not using __gitcomp here, since that adds an unwanted space after the colon
-               COMPREPLY=($(compgen -W "assigned_to assigned_to__not assigned_to__exact
-                                        assigned_to__startwith created_on created_on__not
-                                        created_on__exact created_on__startswith updated_to
-                                        updated_to__not updated_to__exact updated_to__startswith
-                                        reported_from reported_from__not reported_from__exact
-                                        reported_from__startswith status status__not
-                                        status__exact status__startswith id id__not id__exact
-                                        id__startswith title title__not title__exact
-                                        title__startswith type type__not type__exact
-                                        type__startswith" -S ":" -- $cur))
+               case "$cur" in
+                  *:*)
+                     # complete the value of the field, for fields with fixed options
+                     local key=${cur%%:*}
+                     COMPREPLY=($(compgen -P "$key:" -W "$(git issius complete values ${key%%__*})" -- ${cur#*:}))
+                     ;;
+                  *)
+                     # Not using __gitcomp here, since that adds an unwanted space after the colon
+                     COMPREPLY=($(compgen -W "$(__gitissius_filter_keys)" -S ":" -- $cur))
+                     ;;
+               esac
                ;;
             --sort=*)
                __gitissius_complete_sort
                ;;
+            --format=*)
+               __gitissius_complete_format
+               ;;
+            --fields=*)
+               __gitissius_complete_fields
+               ;;
             *)
-               __gitcomp "--help --sort= --filter= --all"
+               __gitcomp "--help --sort= --limit= --offset= --filter= --all --explain --format= --fields="
+               ;;
+         esac
+         ;;
+
+      daemon)
+         __gitcomp "--help --detach --stop"
+         ;;
+
+      search)
+         case "$cur" in
+            -*)
+               __gitcomp "--help --all"
                ;;
          esac
          ;;
@@ -99,8 +123,14 @@ _git_issius () {
             --sort=*)
                __gitissius_complete_sort
                ;;
+            --format=*)
+               __gitissius_complete_format
+               ;;
+            --fields=*)
+               __gitissius_complete_fields
+               ;;
             *)
-               __gitcomp "--help --sort= --all"
+               __gitcomp "--help --sort= --limit= --offset= --all --format= --fields="
                ;;
          esac
          ;;
@@ -113,20 +143,39 @@ _git_issius () {
 
 __gitissius_complete_sort () {
    cur=${cur:7} # Remove the option, i.e. '--sort=', as bash would otherwise repeat it
-   __gitcomp "assigned_to created_on updated_to reported_from status id title type"
+   # complete the last of the comma separated fields, which may start with '-'
+   local prefix=${cur%${cur##*,}}
+   cur=${cur##*,}
+   if [[ "$cur" == -* ]]; then
+      prefix="$prefix-"
+      cur=${cur#-}
+   fi
+   COMPREPLY=($(compgen -P "$prefix" -W "$(git issius complete fields)" -- "$cur"))
 }
 
-__gitissius_list_issues () {
-   # Extract valid possibilities by parsing output of `git issius list`
-   opts=$(git issius list --all | head -n -2 | tail -n +3 | awk '{ print $1 }')
+__gitissius_complete_format () {
+   cur=${cur:9} # Remove the option, i.e. '--format=', as bash would otherwise repeat it
+   COMPREPLY=($(compgen -W "table jsonl csv tsv" -- "$cur"))
+}
 
-   # If are more than one possibilities and no current input, show the complete list of issues
-   if [ ${#opts} -gt 5 -a ${#cur} -eq 0 ]; then
-      echo 1>&2
-      git issius list --all | head -n -2 1>&2
-   fi
+__gitissius_complete_fields () {
+   cur=${cur:9} # Remove the option, i.e. '--fields=', as bash would otherwise repeat it
+   # complete the last of the comma separated fields
+   local prefix=${cur%${cur##*,}}
+   cur=${cur##*,}
+   COMPREPLY=($(compgen -P "$prefix" -W "$(git issius complete fields)" -- "$cur"))
+}
 
-   echo $opts
+__gitissius_filter_keys () {
+   local field
+   for field in $(git issius complete fields); do
+      echo $field ${field}__not ${field}__exact ${field}__startswith
+   done
+}
+
+__gitissius_list_issues () {
+   # Ids of all issues starting with the current input, as short as possible
+   git issius complete ids "$cur"
 }
 
 # alias __git_find_on_cmdline for backwards compatibility
@@ -0,0 +1,161 @@
+"""
+Cache of parsed blobs, by blob name.
+
+A blob never changes, so what parsing it gives holds on every branch
+and at every commit: switching heads only parses the blobs never seen
+before. The cache lives in .git/gitissius-blobs/, in 256 buckets named
+after the first two digits of the blob names, so that a lookup only
+reads one small file.
+
+Each bucket keeps at most its share of the size of the cache and drops
+its least recently used entries first. The size grows with the tree:
+a lookup of n blobs, as building the indexes of a whole tree does,
+makes room for 2n, so that switching between heads keeps both versions
+of what changed. Buckets remember the size they were written with, so
+that small lookups later on do not shrink them. Buckets are written
+atomically, once per lookup that changed them.
+"""
+import os
+import marshal
+
+import common
+
+CACHE_NAME = 'gitissius-blobs'
+CACHE_VERSION = 2
+
+# parsed blobs kept at least, in all buckets
+DEFAULT_SIZE = 1 << 16
+
+class Bucket(object):
+    """
+    Entries of blobs whose names start with the same two digits
+    """
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.dirty = False
+        self.entries = {}
+        self.clock = 0
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as flp:
+                    version, size, entries = marshal.load(flp)
+
+            except (EOFError, ValueError, TypeError):
+                # written by another version or damaged, start over
+                return
+
+            if version == CACHE_VERSION:
+                # remember the larger of the sizes
+                self.dirty = size < self.size
+                self.size = max(self.size, size)
+                self.entries = entries
+                self.clock = max([stamp for stamp, data in entries.values()]
+                                 or [0])
+
+    def get(self, name):
+        """
+        Return the parsed blob name, or raise KeyError.
+        """
+        stamp, data = self.entries[name]
+
+        # only entries about to be dropped are marked as used, so that
+        # reading what is cached rarely writes the bucket
+        if stamp <= self.clock - self.size // 2:
+            self.clock += 1
+            self.entries[name] = (self.clock, data)
+            self.dirty = True
+
+        return data
+
+    def set(self, name, data):
+        self.clock += 1
+        self.entries[name] = (self.clock, data)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        if len(self.entries) > self.size:
+            oldest = sorted(self.entries, key=lambda x: self.entries[x][0])
+            for name in oldest[:len(self.entries) - self.size]:
+                del self.entries[name]
+
+        common.write_atomically(self.path, marshal.dumps((CACHE_VERSION,
+                                                          self.size,
+                                                          self.entries)))
+        self.dirty = False
+
+class BlobCache(object):
+    """
+    Parsed blobs, by blob name, kept in the directory path
+    """
+    def __init__(self, path, size=DEFAULT_SIZE):
+        self.path = path
+        self.bucket_size = max(1, size // 256)
+        self._buckets = {}
+
+    def reserve(self, size):
+        """
+        Make room for at least size parsed blobs.
+        """
+        bucket_size = max(1, size // 256)
+        if bucket_size <= self.bucket_size:
+            return
+
+        self.bucket_size = bucket_size
+        for bucket in self._buckets.values():
+            if bucket.size < bucket_size:
+                bucket.size = bucket_size
+                bucket.dirty = True
+
+    def bucket(self, name):
+        key = name[:2]
+        if key not in self._buckets:
+            self._buckets[key] = Bucket(os.path.join(self.path, key),
+                                        self.bucket_size)
+
+        return self._buckets[key]
+
+    def parse(self, names, read, parse):
+        """
+        Return the parsed contents of the blobs names. Only blobs not in
+        the cache are read, all at once with read(names), and parsed
+        with parse(data).
+        """
+        names = list(names)
+        parsed = [None] * len(names)
+
+        self.reserve(2 * len(names))
+
+        missing = []
+        for i, name in enumerate(names):
+            try:
+                parsed[i] = self.bucket(name).get(name)
+
+            except KeyError:
+                missing.append(i)
+
+        if missing:
+            blobs = read([names[i] for i in missing])
+            for i, data in zip(missing, blobs):
+                parsed[i] = parse(data)
+                self.bucket(names[i]).set(names[i], parsed[i])
+
+        self.save()
+
+        return parsed
+
+    def save(self):
+        """
+        Write the buckets that changed.
+        """
+        dirty = [bucket for bucket in self._buckets.values() if bucket.dirty]
+
+        if dirty and not os.path.isdir(self.path):
+            os.mkdir(self.path)
+
+        for bucket in dirty:
+            bucket.save()
@@ -0,0 +1,108 @@
+"""
+Thin client of the gitissius daemon.
+
+It only needs the standard library, so a command answered by the
+daemon never imports the modules that open the repository.
+"""
+import os
+import sys
+import json
+import socket
+
+from terminal import terminal_width
+
+SOCKET_NAME = 'gitissius.sock'
+
+def socket_path(cwd=None):
+    """
+    Return the path of the daemon socket of the repository containing
+    cwd, or None outside a repository.
+    """
+    cwd = cwd or os.getcwd()
+
+    while not os.path.exists(os.path.join(cwd, '.git')):
+        cwd, extra = os.path.split(cwd)
+
+        if not extra:
+            return None
+
+    return os.path.join(cwd, '.git', SOCKET_NAME)
+
+def connect(path):
+    """
+    Return a socket connected to the daemon listening on path, or None
+    if no daemon is running.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+
+    except socket.error:
+        sock.close()
+        return None
+
+    return sock
+
+def request(sock, message):
+    """
+    Send message to the daemon. Returns its reply and a file to read
+    what follows the reply from.
+    """
+    sock.sendall(json.dumps(message) + '\n')
+
+    rfile = sock.makefile('rb')
+    reply = rfile.readline()
+    if not reply:
+        return None, rfile
+
+    return json.loads(reply), rfile
+
+def forward(argv):
+    """
+    Run the command in argv in the daemon, if one serves the current
+    repository. Returns False if the command has to run locally and
+    exits with the status of the command if it failed.
+    """
+    if not argv:
+        return False
+
+    path = socket_path()
+    if path is None or not os.path.exists(path):
+        return False
+
+    sock = connect(path)
+    if sock is None:
+        return False
+
+    try:
+        reply, rfile = request(sock, {'args': argv,
+                                      'cwd': os.getcwd(),
+                                      'columns': terminal_width(),
+                                      })
+
+        if reply is None or reply['run'] == 'local':
+            return False
+
+        if reply['run'] == 'stdin':
+            sock.sendall(sys.stdin.read())
+
+        sock.shutdown(socket.SHUT_WR)
+
+        # stream the output as it comes, up to the exit status
+        status = 0
+        for line in iter(rfile.readline, ''):
+            output, end, trailer = line.partition('\0')
+            sys.stdout.write(output)
+
+            if end:
+                status = json.loads(trailer)['exit']
+
+        sys.stdout.flush()
+
+        if status:
+            sys.exit(status)
+
+    finally:
+        sock.close()
+
+    return True
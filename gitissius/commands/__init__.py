@@ -1,17 +1,23 @@
 import sys
-import os
 import optparse
 
 class GitissiusCommand(object):
     """
     Gitissius Generic Command Object
     """
-    aliases = []
-    help = ''
+    # commands that never prompt can be run by the daemon
+    served = False
+    read_only = True
 
     def __init__(self):
         self.parser = optparse.OptionParser()
 
+    def needs_stdin(self, args):
+        """
+        Return True if running the command with args reads stdin.
+        """
+        return False
+
     def __call__(self, args):
         (options, args) = self.parser.parse_args(args)
         return self._execute(options, args)
@@ -19,31 +25,100 @@ class GitissiusCommand(object):
     def _execute(self, options, args):
         assert False
 
-# import commands
-available_commands = []
-command = {}
-here = lambda path: os.path.join(os.path.realpath(os.path.dirname(__file__)), path)
+# command name: (module, aliases, description). Only the module of the
+# command that runs is imported, usage() needs none.
+registry = {
+    'batch': ('batch', [],
+              "Apply operations read as JSON lines in a single commit"),
+    'close': ('close', [],
+              "Close an issue"),
+    'comment': ('comment_issue', ['c'],
+                "Comment an issue"),
+    'daemon': ('daemon', [],
+               "Keep issues in memory and answer commands from there"),
+    'delete': ('delete_issue', ['d'],
+               "Delete an issue"),
+    'edit': ('edit_issue', ['e'],
+             "Edit an issue"),
+    'list': ('list_issues', ['l'],
+             "List issues"),
+    'migrate': ('migrate', [],
+                "Move issues to the sharded storage layout"),
+    'myissues': ('list_my_issues', ['my', 'mylist', 'm'],
+                 "Show issues assigned to you"),
+    'new': ('new_issue', ['new', 'add'],
+            "Create an issue"),
+    'pull': ('pull', [],
+             "Pull issues from upstream"),
+    'push': ('push', [],
+             "Push issues upstream"),
+    'search': ('search', [],
+               "Search titles, descriptions and comments of issues"),
+    'show': ('show_issue', ['s'],
+             "Show an issue"),
+    'update': ('update', ['u'],
+               "Pull issues from upstream and then push"),
+    }
+
+available_commands = sorted(registry)
+
+aliases = {}
+for name, (module, names, description) in registry.items():
+    for alias in names:
+        aliases[alias] = name
+
+_commands = {}
+
+# when run as a script, gitissius is gitissius.py and not the package
+package = __import__('gitissius')
 
-for key in ['commands', 'common', 'gitshelve', 'database']:
+for key in ['commands', 'common', 'gitshelve', 'objectstore', 'query',
+            'database', 'properties', 'sync', 'server', 'client']:
     if key in sys.modules:
         sys.modules['gitissius.%s' % key] = sys.modules[key]
+        setattr(package, key, sys.modules[key])
+
+def get_command(name):
+    """
+    Return the command called name, or by its alias name, importing its
+    module on first use. Returns None if there is no such command.
+    """
+    name = aliases.get(name, name)
+    if name not in registry:
+        return None
+
+    if name not in _commands:
+        try:
+            cmd = __import__(registry[name][0],
+                             globals(), locals(),
+                             ['Command'], -1
+                             )
+
+        except ImportError, e:
+            print "Error importing command:", name
+            print e
+            return None
+
+        _commands[name] = cmd.Command()
+
+    return _commands[name]
+
+def execute(name, args):
+    """
+    Run command name with args, reporting the errors commands raise.
+    """
+    import gitissius.common as common
+
+    cmd = get_command(name)
+    if cmd is None:
+        raise common.InvalidCommand(name)
+
+    try:
+        cmd(args)
+
+    except common.IssueIDConflict, error:
+        print " >", "Error: Conflicting IDs"
+        print error
 
-def import_commands():
-    for filename in os.listdir(here('.')):
-        (filename, ext) = (filename[:-3], filename[-3:])
-        if ext == '.py' and not filename == '__init__':
-            try:
-
-                cmd = __import__(filename,
-                                 globals(), locals(),
-                                 ['Command'], -1
-                                 )
-                available_commands.append(cmd.Command.name)
-
-                command[cmd.Command.name] = cmd.Command()
-                for alias in cmd.Command.aliases:
-                    command[alias] = cmd.Command()
-
-            except ImportError, e:
-                print "Error importing command:", filename
-                print e
+    except common.IssueIDNotFound, error:
+        print " >", "Error: ID not found", error
@@ -0,0 +1,199 @@
+import sys
+import json
+
+import gitissius.commands as commands
+import gitissius.common as common
+import gitissius.properties as properties
+
+class Command(commands.GitissiusCommand):
+    """
+    Apply a stream of operations in a single commit
+    """
+    name = "batch"
+    served = True
+    read_only = False
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser.set_usage(
+            "%prog batch [options] [file]\n\n"
+            "Reads one JSON object per line from file, or stdin:\n"
+            '  {"op": "create", "fields": {"title": "...", ...}}\n'
+            '  {"op": "set-field", "id": "...", "field": "...", "value": "..."}\n'
+            '  {"op": "close", "id": "..."}\n'
+            '  {"op": "comment", "id": "...", "description": "..."}\n'
+            '  {"op": "delete", "id": "..."}'
+            )
+        self.parser.add_option("--message", "-m",
+                               default=None,
+                               help="Commit message to use")
+
+    def needs_stdin(self, args):
+        (options, args) = self.parser.parse_args(args)
+        return not args
+
+    def _get_issue(self, issue_id):
+        # issues created earlier in this batch are not committed yet, an
+        # id they share with any other issue is as ambiguous as usual
+        issues = [self._created[key] for key in sorted(self._created)
+                  if key.startswith(issue_id)]
+
+        try:
+            issues.insert(0, common.issue_manager.get(issue_id))
+
+        except common.IssueIDNotFound:
+            pass
+
+        except common.IssueIDConflict, error:
+            issues[:0] = error.issues
+
+        if not issues:
+            raise common.IssueIDNotFound(issue_id)
+
+        elif len(issues) > 1:
+            raise common.IssueIDConflict(issues)
+
+        return issues[0]
+
+    def _set(self, obj, name, value):
+        prop = obj.properties[name]
+        if not prop.editable:
+            raise common.PropertyValidationError("%s is not editable." % \
+                                                 name.capitalize()
+                                                 )
+
+        # values end up in listings as text, anything else would break
+        # every later command reading the issue
+        if value is None and prop.allow_empty and \
+           not isinstance(prop, properties.Option):
+            value = ''
+
+        if not isinstance(value, basestring):
+            raise common.PropertyValidationError("%s must be a string." % \
+                                                 name.capitalize()
+                                                 )
+
+        prop.set_value(value)
+
+    def _save(self, issue):
+        common.git_repo[issue.path] = issue.serialize(indent=4)
+
+    def _create(self, operation):
+        from gitissius.database import Issue
+
+        issue = Issue()
+        for name, value in operation.get('fields', {}).items():
+            self._set(issue, name, value)
+
+        issue.set_value('created_on', common.now())
+        issue.set_value('updated_on', common.now())
+
+        # fields left out are stored empty, as interactive edit does
+        for name in issue.schema.names:
+            if issue.get_value(name) is None:
+                issue.set_value(name, '')
+
+        self._created[issue.get_value('id')] = issue
+        self._save(issue)
+        return "Added issue %s" % issue.get_value('id')
+
+    def _set_field(self, operation):
+        issue = self._get_issue(operation['id'])
+        self._set(issue, operation['field'], operation['value'])
+        issue.set_value('updated_on', common.now())
+        self._save(issue)
+        return "Edited issue %s" % issue.get_value('id')
+
+    def _close(self, operation):
+        issue = self._get_issue(operation['id'])
+        if issue.get_value('status') == 'closed':
+            return None
+
+        issue.set_value('status', 'closed')
+        issue.set_value('updated_on', common.now())
+        self._save(issue)
+        return "Closed issue %s" % issue.get_value('id')
+
+    def _comment(self, operation):
+        from gitissius.database import Comment
+
+        issue = self._get_issue(operation['id'])
+        comment = Comment(issue_id=issue.get_value('id'),
+                          created_on=common.now())
+        self._set(comment, 'description', operation['description'])
+        if 'reported_from' in operation:
+            self._set(comment, 'reported_from', operation['reported_from'])
+
+        common.git_repo[comment.path] = comment.serialize(indent=4)
+        return "Added comment on issue %s" % issue.get_value('id')
+
+    def _delete(self, operation):
+        issue = self._get_issue(operation['id'])
+        issue.delete()
+        self._created.pop(issue.get_value('id'), None)
+        return "Deleted issue %s" % issue.get_value('id')
+
+    def _execute(self, options, args):
+        operations = {'create': self._create,
+                      'set-field': self._set_field,
+                      'close': self._close,
+                      'comment': self._comment,
+                      'delete': self._delete,
+                      }
+
+        if args:
+            stream = open(args[0])
+
+        else:
+            stream = sys.stdin
+
+        self._created = {}
+        messages = []
+
+        try:
+            with common.git_repo.transaction(options.message):
+                for lineno, line in enumerate(stream, 1):
+                    if not line.strip():
+                        continue
+
+                    try:
+                        operation = json.loads(line)
+                        message = operations[operation['op']](operation)
+
+                    except (ValueError, KeyError, TypeError), error:
+                        raise common.BatchError(lineno, "%s: %s" % \
+                                                (error.__class__.__name__,
+                                                 error)
+                                                )
+
+                    except common.PropertyValidationError, error:
+                        raise common.BatchError(lineno, error)
+
+                    except common.IssueIDNotFound, error:
+                        raise common.BatchError(lineno,
+                                                "ID not found %s" % error)
+
+                    except common.IssueIDConflict, error:
+                        raise common.BatchError(lineno,
+                                                "Conflicting IDs\n%s" % error)
+
+                    if message:
+                        messages.append(message)
+                        common.git_repo.commit(message)
+
+        except common.BatchError, error:
+            print " >", error
+            print " >", "No changes committed"
+            return
+
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if messages:
+            print "Applied %d operations in %s" % (len(messages),
+                                                   common.git_repo.head)
+
+        else:
+            print " >", "Nothing to do"
@@ -6,8 +6,6 @@ class Command(commands.GitissiusCommand):
     Close Issue
     """
     name = "close"
-    aliases = ["c"]
-    help="Close an issue"
 
     def _execute(self, options, args):
         # find issue
@@ -20,17 +18,17 @@ class Command(commands.GitissiusCommand):
         issue = common.issue_manager.get(issue_id)
 
         # close issue
-        if issue.get_property('status').value == 'closed':
+        if issue.get_value('status') == 'closed':
             print " >", "Issue already closed"
             return
 
-        issue.get_property('status').value = 'closed'
-        issue.get_property('updated_on').value = common.now()
+        issue.set_value('status', 'closed')
+        issue.set_value('updated_on', common.now())
 
         # add to repo
         common.git_repo[issue.path] = issue.serialize(indent=4)
 
         # commit
-        common.git_repo.commit("Closed issue %s" % issue.get_property('id'))
+        common.git_repo.commit("Closed issue %s" % issue.get_value('id'))
 
-        print "Closed issue: %s" % issue.get_property('id')
+        print "Closed issue: %s" % issue.get_value('id')
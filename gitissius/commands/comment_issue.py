@@ -6,8 +6,6 @@ import gitissius.commands as commands
 class Command(commands.GitissiusCommand):
     """ Comment on an issue """
     name = "comment"
-    aliases = ["c"]
-    help = "Comment an issue"
 
     def _help(self):
         print "Usage:"
@@ -26,17 +24,17 @@ class Command(commands.GitissiusCommand):
 
         issue = common.issue_manager.get(issue_id)
 
-        print "Commenting on:", issue.get_property('title').value
+        print "Commenting on:", issue.get_value('title')
 
         # edit
-        comment = Comment(issue_id=issue.get_property('id').value)
+        comment = Comment(issue_id=issue.get_value('id'))
         comment.interactive_edit()
 
         # add to repo
         common.git_repo[comment.path] = comment.serialize(indent=4)
 
         # commit
-        common.git_repo.commit("Added comment on issue %s" % issue.get_property('id'))
+        common.git_repo.commit("Added comment on issue %s" % issue.get_value('id'))
 
-        print "Comment issue: %s" % issue.get_property('id')
+        print "Comment issue: %s" % issue.get_value('id')
 
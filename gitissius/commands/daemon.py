@@ -0,0 +1,58 @@
+import sys
+
+import gitissius.commands as commands
+import gitissius.common as common
+import gitissius.client as client
+import gitissius.server as server
+
+class Command(commands.GitissiusCommand):
+    """
+    Serve commands from memory
+    """
+    name = "daemon"
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser.add_option("--detach",
+                               action="store_true",
+                               default=False,
+                               help="Run in the background")
+        self.parser.add_option("--stop",
+                               action="store_true",
+                               default=False,
+                               help="Stop the running daemon")
+
+    def _execute(self, options, args):
+        path = client.socket_path()
+
+        if options.stop:
+            sock = client.connect(path)
+            if sock is None:
+                print " >", "No daemon running"
+                return
+
+            client.request(sock, {'stop': True})
+            sock.close()
+
+            print "Stopped daemon"
+            return
+
+        daemon = server.Server(path)
+        if not daemon.listen():
+            print " >", "A daemon is already running"
+            return
+
+        # load the issues before the first command comes in
+        common.issue_manager.update_db()
+
+        if options.detach:
+            if daemon.detach():
+                print "Serving on %s" % path
+                return
+
+        else:
+            print "Serving on %s" % path
+            sys.stdout.flush()
+
+        daemon.serve_forever()
@@ -5,8 +5,6 @@ import gitissius.common as common
 class Command(commands.GitissiusCommand):
     """ Delete an issue """
     name = "delete"
-    aliases = ["d"]
-    help = "Delete an issue"
 
     def __init__(self):
         super(Command, self).__init__()
@@ -26,16 +24,16 @@ class Command(commands.GitissiusCommand):
 
         issue = common.issue_manager.get(issue_id)
 
-        if not common.verify("Delete issue '%s' (y)? " % issue.get_property('title'), default='y'):
+        if not common.verify("Delete issue '%s' (y)? " % issue.get_value('title'), default='y'):
             print " >", "Delete canceled"
             return
 
         issue.delete()
 
         # commit
-        common.git_repo.commit("Deleted issue %s" % issue.get_property('id'))
+        common.git_repo.commit("Deleted issue %s" % issue.get_value('id'))
 
-        print "Deleted issue: %s" % issue.get_property('id')
+        print "Deleted issue: %s" % issue.get_value('id')
 
 
 
@@ -6,8 +6,6 @@ class Command(commands.GitissiusCommand):
     """ Edit an issue """
 
     name="edit"
-    aliases = ['e']
-    help="Edit an issue"
 
     def _help(self):
         """
@@ -36,6 +34,6 @@ class Command(commands.GitissiusCommand):
         common.git_repo[issue.path] = issue.serialize(indent=4)
 
         # commit
-        common.git_repo.commit("Edited issue %s" % issue.get_property('id'))
+        common.git_repo.commit("Edited issue %s" % issue.get_value('id'))
 
-        print "Edited issue: %s" % issue.get_property('id')
+        print "Edited issue: %s" % issue.get_value('id')
@@ -1,30 +1,71 @@
+import sys
+
 import gitissius.commands as commands
 import gitissius.common as common
+import gitissius.database as database
+import gitissius.query as query
 
 class Command(commands.GitissiusCommand):
     """
     List Issues
     """
     name="list"
-    aliases = ['l']
-    help="List issues"
+    served = True
 
     def __init__(self):
         super(Command, self).__init__()
 
         self.parser.add_option("--sort",
-                               help="Sort results using key")
+                               help="Sort results using keys, " \
+                               "e.g. -updated_on,severity")
+        self.parser.add_option("--limit",
+                               type="int",
+                               default=None,
+                               help="Show at most this many issues")
+        self.parser.add_option("--offset",
+                               type="int",
+                               default=0,
+                               help="Skip this many issues first")
         self.parser.add_option("--filter",
                                default=None,
-                               help="Filter result using key")
+                               help="Filter result using a query, e.g. " \
+                               "'type:bug and (severity=high or " \
+                               "created_on>2012-01-01)'")
         self.parser.add_option("--all",
                                default=False,
                                action="store_true",
                                help="List all issues, " \
                                "including closed and invalid"
                                )
+        self.parser.add_option("--explain",
+                               default=False,
+                               action="store_true",
+                               help="Show how the issues are found, " \
+                               "instead of listing them")
+        self.parser.add_option("--format",
+                               type="choice",
+                               choices=common.OUTPUT_FORMATS,
+                               default="table",
+                               help="Output format: table, jsonl, csv " \
+                               "or tsv")
+        self.parser.add_option("--fields",
+                               default=None,
+                               help="Comma separated fields to output " \
+                               "in jsonl, csv or tsv, all by default")
 
     def _execute(self, options, args):
+        if (options.limit is not None and options.limit < 0) or \
+           options.offset < 0:
+            sys.exit("--limit and --offset take positive numbers")
+
+        try:
+            fields = common.output_fields(options.fields,
+                                          database.Issue.schema,
+                                          options.format)
+
+        except ValueError, error:
+            sys.exit(str(error))
+
         if options.all:
             filters = []
 
@@ -33,17 +74,30 @@ class Command(commands.GitissiusCommand):
             filters = [{'status__not':'closed'}, {'status__not':'invalid'}]
 
         if options.filter:
-            for fltr in options.filter.split(","):
-                try:
-                    key, value = fltr.split(':')
+            try:
+                filters.append(
+                    common.issue_manager.parse_filter(options.filter))
+
+            except query.QueryError, error:
+                sys.exit("Wrong filter argument: %s" % error)
 
-                except ValueError:
-                    # filter parameters in worng format
-                    print "Wrong filter argument:", fltr
-                    return
+        if options.explain:
+            plan = common.issue_manager.plan(rules=filters)
+            common.issue_manager.run(plan)
+            print "\n".join(plan.explain())
+            return
 
-                filters.append({key:value})
+        try:
+            issues = common.issue_manager.filter(sort_key=options.sort,
+                                                 rules=filters,
+                                                 limit=options.limit,
+                                                 offset=options.offset)
 
-        common.print_issues(common.issue_manager.filter(sort_key=options.sort,
-                                                        rules=filters)
-                            )
+        except ValueError, error:
+            sys.exit(str(error))
+
+        if options.format == 'table':
+            common.print_issues(issues)
+
+        else:
+            common.write_issues(issues, options.format, fields)
@@ -1,5 +1,8 @@
+import sys
+
 import gitissius.commands as commands
 import gitissius.common as common
+import gitissius.database as database
 import gitissius.gitshelve as gitshelve
 
 class Command(commands.GitissiusCommand):
@@ -7,22 +10,52 @@ class Command(commands.GitissiusCommand):
     List MyIssues
     """
     name="myissues"
-    aliases = ['my', 'mylist', 'm']
-    help="Show issues assigned to you"
+    served = True
 
     def __init__(self):
         super(Command, self).__init__()
 
         self.parser.add_option("--sort",
-                               help="Sort results using key")
+                               help="Sort results using keys, " \
+                               "e.g. -updated_on,severity")
+        self.parser.add_option("--limit",
+                               type="int",
+                               default=None,
+                               help="Show at most this many issues")
+        self.parser.add_option("--offset",
+                               type="int",
+                               default=0,
+                               help="Skip this many issues first")
         self.parser.add_option("--all",
                                action="store_true",
                                default=False,
                                help="Show all my issues, " \
                                "including closed and invalid"
                                )
+        self.parser.add_option("--format",
+                               type="choice",
+                               choices=common.OUTPUT_FORMATS,
+                               default="table",
+                               help="Output format: table, jsonl, csv " \
+                               "or tsv")
+        self.parser.add_option("--fields",
+                               default=None,
+                               help="Comma separated fields to output " \
+                               "in jsonl, csv or tsv, all by default")
 
     def _execute(self, options, args):
+        if (options.limit is not None and options.limit < 0) or \
+           options.offset < 0:
+            sys.exit("--limit and --offset take positive numbers")
+
+        try:
+            fields = common.output_fields(options.fields,
+                                          database.Issue.schema,
+                                          options.format)
+
+        except ValueError, error:
+            sys.exit(str(error))
+
         user_email = gitshelve.git('config', 'user.email')
 
         if options.all:
@@ -34,8 +67,19 @@ class Command(commands.GitissiusCommand):
                      {'status__not': 'invalid'}
                      ]
 
-        issues = common.issue_manager.filter(rules=rules,
-                                                operator="and",
-                                                sort_key=options.sort
-                                                )
-        common.print_issues(issues)
+        try:
+            issues = common.issue_manager.filter(rules=rules,
+                                                 operator="and",
+                                                 sort_key=options.sort,
+                                                 limit=options.limit,
+                                                 offset=options.offset
+                                                 )
+
+        except ValueError, error:
+            sys.exit(str(error))
+
+        if options.format == 'table':
+            common.print_issues(issues)
+
+        else:
+            common.write_issues(issues, options.format, fields)
@@ -0,0 +1,28 @@
+import gitissius.commands as commands
+import gitissius.common as common
+import gitissius.database as database
+
+class Command(commands.GitissiusCommand):
+    """
+    Migrate issues to the current storage layout
+    """
+    name = "migrate"
+
+    def _execute(self, options, args):
+        if database.layout_version() >= database.LAYOUT_VERSION:
+            print " >", "Already using layout %d" % database.LAYOUT_VERSION
+            return
+
+        moved = 0
+        for name in common.git_repo.objects.keys():
+            if len(name) == 64 and common.git_repo.has_tree(name):
+                common.git_repo.move(name, "%s/%s" % (name[:2], name[2:]))
+                moved += 1
+
+        database.set_layout_version(database.LAYOUT_VERSION)
+
+        common.git_repo.commit("Migrated %d issues to layout %d" % \
+                               (moved, database.LAYOUT_VERSION))
+
+        print "Migrated %d issues to layout %d" % (moved,
+                                                   database.LAYOUT_VERSION)
@@ -4,8 +4,6 @@ import gitissius.commands as commands
 class Command(commands.GitissiusCommand):
     """ Create new issue """
     name = "new"
-    aliases = ["new", "add"]
-    help="Create an issue"
 
     def _execute(self, options, args):
         from gitissius.database import Issue
@@ -28,6 +26,6 @@ class Command(commands.GitissiusCommand):
         common.git_repo[issue.path] = issue.serialize(indent=4)
 
         # commit
-        common.git_repo.commit("Added issue %s" % issue.get_property('id'))
+        common.git_repo.commit("Added issue %s" % issue.get_value('id'))
 
-        print "Created issue: %s" % issue.get_property('id')
+        print "Created issue: %s" % issue.get_value('id')
@@ -1,48 +1,39 @@
 import gitissius.commands as commands
-import gitissius.gitshelve as gitshelve
 import gitissius.common as common
+import gitissius.sync as sync
 
 class Command(commands.GitissiusCommand):
     """
     Pull issues to repo
     """
     name="pull"
-    help="Pull issues from upstream"
 
-    def _execute(self, options, args):
-        # save current branch name
-        branch = gitshelve.git('name-rev', '--name-only', 'HEAD') or 'master'
+    def __init__(self):
+        super(Command, self).__init__()
 
-        # stash changes
-        try:
-            gitshelve.git('stash')
+        self.parser.set_usage("%prog pull [remote]")
 
-        except gitshelve.GitError, error:
-            if 'You do not have the initial commit yet' in error.stderr:
-                # don't worry, we just created 'gitissius' branch
-                pass
+    def _execute(self, options, args):
+        if sync.is_checked_out(common.git_repo):
+            print " >", "The gitissius branch is checked out, " \
+                  "use 'git pull' instead"
+            return
 
-            else:
-                raise
+        remote = args[0] if args else None
 
-        else:
-            # switch branches
-            gitshelve.git('checkout', 'gitissius')
+        result = sync.pull(common.git_repo, remote)
 
-        # pull updates
-        gitshelve.git('pull')
+        if result is None:
+            print " >", "No gitissius branch upstream"
 
-        # switch back to previous branch
-        gitshelve.git('checkout', branch)
+        elif result == 'up-to-date':
+            print "Already up-to-date"
 
-        # pop stashed changes
-        try:
-            gitshelve.git('stash', 'pop')
+        elif result == 'fast-forward':
+            print "Fast-forwarded to %s" % common.git_repo.head
 
-        except gitshelve.GitError, error:
-            # no worries, no stash to apply
-            pass
+        else:
+            print "Merged upstream changes in %s" % common.git_repo.head
 
         # build issue list cache
         common.issue_manager.update_db()
-
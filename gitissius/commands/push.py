@@ -1,13 +1,28 @@
 import gitissius.commands as commands
-import gitissius.gitshelve as gitshelve
+import gitissius.common as common
+import gitissius.sync as sync
 
 class Command(commands.GitissiusCommand):
     """
     Push issues to repo
     """
     name = "push"
-    aliases = []
-    help = "Push issues upstream"
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser.set_usage("%prog push [remote]")
 
     def _execute(self, options, args):
-        gitshelve.git('push')
+        remote = args[0] if args else None
+
+        result = sync.push(common.git_repo, remote)
+
+        if result == 'rejected':
+            print " >", "Upstream has new issues, pull first"
+
+        elif result == 'pushed':
+            print "Pushed %s" % common.git_repo.head
+
+        else:
+            print "Already up-to-date"
@@ -0,0 +1,38 @@
+import gitissius.commands as commands
+import gitissius.common as common
+
+class Command(commands.GitissiusCommand):
+    """
+    Search issues
+    """
+    name = "search"
+    served = True
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser.set_usage(
+            "%prog search [options] word...\n\n"
+            "Lists the issues containing all words, best matches first.\n"
+            'Words in double quotes, or an argument with spaces, form a\n'
+            "phrase that has to appear as written."
+            )
+        self.parser.add_option("--all",
+                               default=False,
+                               action="store_true",
+                               help="Search all issues, " \
+                               "including closed and invalid"
+                               )
+
+    def _execute(self, options, args):
+        if not args:
+            self.parser.print_usage()
+            return
+
+        issues = common.issue_manager.search(args)
+
+        if not options.all:
+            issues = [issue for issue in issues
+                      if issue.get_value('status') not in ('closed', 'invalid')]
+
+        common.print_issues(issues)
@@ -1,12 +1,12 @@
 import gitissius.commands as commands
 import gitissius.common as common
+import gitissius.database as database
 import sys
 
 class Command(commands.GitissiusCommand):
     """ Show an issue """
     name = "show"
-    aliases = ["s"]
-    help="Show an issue"
+    served = True
 
     def __init__(self):
         super(Command, self).__init__()
@@ -16,6 +16,17 @@ class Command(commands.GitissiusCommand):
                                default=False,
                                help="Show all details, including comments"
                                )
+        self.parser.add_option("--format",
+                               type="choice",
+                               choices=common.OUTPUT_FORMATS,
+                               default="table",
+                               help="Output format: table, jsonl, csv " \
+                               "or tsv")
+        self.parser.add_option("--fields",
+                               default=None,
+                               help="Comma separated fields to output " \
+                               "in jsonl, csv or tsv, all by default. " \
+                               "With --all, jsonl includes the comments")
 
     def _help(self):
         print "Usage:"
@@ -30,8 +41,22 @@ class Command(commands.GitissiusCommand):
             self._help()
             return
 
+        try:
+            fields = common.output_fields(options.fields,
+                                          database.Issue.schema,
+                                          options.format)
+
+        except ValueError, error:
+            print error
+            return
+
         issue = common.issue_manager.get(issue_id)
 
+        if options.format != 'table':
+            common.write_issues([issue], options.format, fields,
+                                comments=options.all)
+            return
+
         # show
         issue.printme()
 
@@ -41,3 +66,11 @@ class Command(commands.GitissiusCommand):
                 comment.printme()
 
                 print '-' * 5
+
+        else:
+            issue_id = str(issue.get_value('id'))
+            count = common.issue_manager.comment_count(issue_id)
+            if count:
+                print '-' * 5
+                print "%d comment(s), last on %s. Use --all to show them." % \
+                      (count, common.issue_manager.last_comment_on(issue_id))
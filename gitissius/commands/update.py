@@ -1,20 +1,43 @@
 import gitissius.commands as commands
-import gitissius.gitshelve as gitshelve
+import gitissius.common as common
+import gitissius.sync as sync
 
 class Command(commands.GitissiusCommand):
     """
     Pull issues from repo, then push
     """
     name="update"
-    aliases = ['u']
-    help="Pull issues from upstream and then push"
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser.set_usage("%prog update [remote]")
 
     def _execute(self, options, args):
-        from pull import Command as pull
-        from push import Command as push
+        if sync.is_checked_out(common.git_repo):
+            print " >", "The gitissius branch is checked out, " \
+                  "use 'git pull' and 'git push' instead"
+            return
+
+        remote = args[0] if args else None
+
+        pulled, pushed = sync.update(common.git_repo, remote)
+
+        if pulled == 'fast-forward':
+            print "Fast-forwarded to %s" % common.git_repo.head
+
+        elif pulled == 'merged':
+            print "Merged upstream changes in %s" % common.git_repo.head
+
+        if pushed == 'rejected':
+            print " >", "Upstream has new issues, update again"
+
+        elif pushed == 'pushed':
+            print "Pushed %s" % common.git_repo.head
 
-        # this looks funny, because we first create a Command object
-        # and then we execute it
-        pull()(None)
-        push()(None)
+        elif pulled in (None, 'up-to-date'):
+            print "Already up-to-date"
 
+        if pulled in ('fast-forward', 'merged'):
+            # build issue list cache
+            common.issue_manager.update_db()
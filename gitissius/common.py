@@ -1,8 +1,14 @@
 from datetime import datetime
 import sys
 import os
+import csv
+import json
+import tempfile
 import readline
 
+from terminal import terminal_width
+import issueindex
+
 readline.parse_and_bind('tab: complete')
 
 # needed for enabling / disabling colorama
@@ -89,26 +95,22 @@ def find_repo_root():
 
     return cwd
 
-def terminal_width():
-    """Return terminal width."""
-    width = 0
+def write_atomically(path, data):
+    """
+    Replace the contents of path with data, so that concurrent readers
+    never see a partially written file.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.',
+                               dir=os.path.dirname(path))
     try:
-        import struct, fcntl, termios
-        s = struct.pack('HHHH', 0, 0, 0, 0)
-        x = fcntl.ioctl(1, termios.TIOCGWINSZ, s)
-        width = struct.unpack('HHHH', x)[1]
-
-    except:
-        pass
-
-    if width <= 0:
-        if os.environ.has_key("COLUMNS"):
-            width = int(os.getenv("COLUMNS"))
+        with os.fdopen(fd, 'wb') as flp:
+            flp.write(data)
 
-        if width <= 0:
-            width = 80
+        os.rename(tmp, path)
 
-    return width
+    except:
+        os.remove(tmp)
+        raise
 
 def verify(text, default=None):
     while True:
@@ -129,41 +131,116 @@ def verify(text, default=None):
     else:
         return False
 
+_current_user = None
+
 def current_user():
-    return "%s <%s>" % (gitshelve.git('config', 'user.name'),
-                        gitshelve.git('config', 'user.email')
-                        )
+    """
+    Return the configured git user, as "Name <email>".
+    """
+    global _current_user
+
+    if _current_user is None:
+        _current_user = "%s <%s>" % (gitshelve.git('config', 'user.name'),
+                                     gitshelve.git('config', 'user.email')
+                                     )
+
+    return _current_user
+
+_commiters = None
+
+def _current_branch_head():
+    """
+    Return the commit of HEAD, or None on a branch with no commits yet.
+    """
+    store = git_repo.get_store()
+    if store:
+        try:
+            return store.resolve_ref('HEAD')
+
+        except objectstore.UnsupportedObject:
+            pass
+
+    try:
+        return gitshelve.git('rev-parse', '--verify', '--quiet', 'HEAD')
+
+    except gitshelve.GitError:
+        return None
 
 def get_commiters():
     """
     Return a set() of strings containing commiters of the repo
+
+    The set is computed once per process and saved in .git along with
+    the HEAD it was computed for, so later runs only scan the commits
+    made since then.
     """
-    commiters = gitshelve.git('log', '--pretty=format:"%an <%ae>"')
-    commiters = set(commiters.split('"'))
-    try:
-        commiters.remove('')
+    global _commiters
 
-    except KeyError:
-        # no '', it's ok
-        pass
-    try:
-        commiters.remove('\n')
+    if _commiters is not None:
+        return _commiters
+
+    head = _current_branch_head()
+    if head is None:
+        # nobody committed yet
+        _commiters = set()
+        return _commiters
+
+    path = os.path.join(find_repo_root(), '.git', 'gitissius.commiters')
+
+    cache = None
+    if os.path.exists(path):
+        with open(path) as flp:
+            try:
+                cache = json.load(flp)
+
+            except ValueError:
+                cache = None
+
+    if cache and cache['head'] == head:
+        _commiters = set(name.encode('utf8') for name in cache['commiters'])
+        return _commiters
+
+    commiters = set()
+    log = None
+    if cache:
+        commiters = set(name.encode('utf8') for name in cache['commiters'])
+
+        try:
+            log = gitshelve.git('log', '--pretty=format:%an <%ae>',
+                                '%s..%s' % (cache['head'], head),
+                                keep_newline=True)
 
-    except KeyError:
-        # no '\n', it's ok
-        pass
+        except gitshelve.GitError:
+            # cached head no longer exists, start over
+            commiters = set()
 
-    return commiters
+    if log is None:
+        log = gitshelve.git('log', '--pretty=format:%an <%ae>', head,
+                            keep_newline=True)
+
+    commiters.update(name for name in log.split('\n') if name)
+
+    write_atomically(path, json.dumps({'head': head,
+                                       'commiters': sorted(commiters)}))
+
+    _commiters = commiters
+    return _commiters
 
 def print_issues(issues):
     """ List issues """
+    issues = list(issues)
 
     twidth = terminal_width()
 
     # 40% for title
     title_size = int(twidth * .4)
     status_size = 8 if not colorama else 17
-    id_size = 5
+
+    # wide enough for every listed id to be unique
+    id_size = issue_manager.MIN_ID_LENGTH
+    for issue in issues:
+        id_size = max(id_size, issue_manager.unique_prefix_length(
+            issue.get_value('id')))
     type_size = 7 if not colorama else 16
     assigned_to_size = twidth - title_size - id_size - status_size - type_size
     assigned_to_size -= 13 if not colorama else -5
@@ -191,13 +268,209 @@ def print_issues(issues):
 
     print fmt.format(**table_fields)
 
-    print '-' * terminal_width()
+    print '-' * twidth
     for issue in issues:
-        print fmt.format(**issue.printmedict())
+        print fmt.format(**issue.printmedict(table_fields))
 
-    print '-' * terminal_width()
+    print '-' * twidth
     print "Total Issues: %d" % len(issues)
 
+# formats of --format, the first prints the table of print_issues
+OUTPUT_FORMATS = ['table', 'jsonl', 'csv', 'tsv']
+
+def output_fields(fields, schema, output_format):
+    """
+    Return the names of the comma separated fields, or all fields of
+    schema if there are none. Raises ValueError for unknown fields and
+    for fields given to the table, which has its own.
+    """
+    if not fields:
+        return list(schema.print_order)
+
+    if output_format == 'table':
+        raise ValueError("--fields needs --format jsonl, csv or tsv")
+
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    for name in names:
+        if name not in schema.index:
+            raise ValueError("Unknown field '%s'" % name)
+
+    return names
+
+def _json(value):
+    """
+    Return value as written in JSON lines.
+    """
+    if isinstance(value, datetime):
+        value = value.isoformat()
+
+    return json.dumps(value, sort_keys=True)
+
+def _cell(value):
+    """
+    Return value as a UTF-8 string for CSV.
+    """
+    if value is None:
+        return ''
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    if isinstance(value, unicode):
+        return value.encode('utf8')
+
+    if isinstance(value, str):
+        return value
+
+    return json.dumps(value, sort_keys=True)
+
+def _tsv_escape(text):
+    return text.replace('\\', '\\\\').replace('\t', '\\t')\
+           .replace('\n', '\\n').replace('\r', '\\r')
+
+def _tsv_cell(value):
+    return _tsv_escape(_cell(value))
+
+class CellReader(object):
+    """
+    Reads the values of fields of records of schema, converted to text
+    with convert.
+
+    Records read from the issue index are read a batch at a time, a
+    column at a time, and each distinct value of an index is converted
+    once, from the text the index stores with convert_text if given.
+    """
+    BATCH = 1024
+
+    def __init__(self, schema, fields, convert, convert_text=None):
+        self.positions = [schema.index[name] for name in fields]
+        self.convert = convert
+        self.convert_text = convert_text
+        self._columns = {}
+
+    def _index_columns(self, index):
+        """
+        Return the columns of the fields in index, with the cells of
+        the string numbers converted so far.
+        """
+        if index not in self._columns:
+            self._columns[index] = [(index.column(position), {})
+                                    for position in self.positions]
+
+        return self._columns[index]
+
+    def _convert(self, index, number):
+        if self.convert_text:
+            return self.convert_text(index.text(number))
+
+        return self.convert(index.string(number))
+
+    def _read_batch(self, records):
+        """
+        Return records with their cells.
+        """
+        result = [None] * len(records)
+
+        rows = {}
+        for i, record in enumerate(records):
+            values = record.values()
+            if isinstance(values, issueindex.Row):
+                rows.setdefault(values.index, ([], []))
+                rows[values.index][0].append(i)
+                rows[values.index][1].append(values.row)
+
+            else:
+                result[i] = [self.convert(values[position])
+                             for position in self.positions]
+
+        for index, (places, index_rows) in rows.items():
+            columns = []
+            for column, known in self._index_columns(index):
+                numbers = [column[row] for row in index_rows]
+                cells = map(known.get, numbers)
+
+                if None in cells:
+                    for j, number in enumerate(numbers):
+                        if cells[j] is None:
+                            if number not in known:
+                                known[number] = self._convert(index, number)
+
+                            cells[j] = known[number]
+
+                columns.append(cells)
+
+            for i, cells in zip(places, zip(*columns)):
+                result[i] = cells
+
+        return zip(records, result)
+
+    def read(self, records):
+        """
+        Yield each of records with its cells, as they are produced.
+        """
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == self.BATCH:
+                for item in self._read_batch(batch):
+                    yield item
+
+                batch = []
+
+        for item in self._read_batch(batch):
+            yield item
+
+def write_issues(issues, output_format, fields, comments=False):
+    """
+    Write the values of fields of issues to stdout in output_format, one
+    line per issue, as the issues are produced. JSON lines hold the
+    comments of the issues too, with comments.
+
+    CSV follows RFC 4180 and TSV escapes backslashes, tabs and line
+    breaks with backslashes. Both start with a line of field names.
+    """
+    out = sys.stdout
+
+    if output_format == 'jsonl':
+        reader = CellReader(database.Issue.schema, fields, _json)
+        keys = [json.dumps(name) + ': ' for name in fields]
+
+        if comments:
+            comment_fields = ['id'] + database.Comment.schema.print_order
+            comment_reader = CellReader(database.Comment.schema,
+                                        comment_fields, _json)
+            comment_keys = [json.dumps(name) + ': '
+                            for name in comment_fields]
+
+        for issue, cells in reader.read(issues):
+            items = [key + cell for key, cell in zip(keys, cells)]
+
+            if comments:
+                items.append('"comments": [%s]' % ', '.join(
+                    '{%s}' % ', '.join(key + cell for key, cell in
+                                       zip(comment_keys, comment_cells))
+                    for comment, comment_cells in
+                    comment_reader.read(issue.comments)))
+
+            out.write('{%s}\n' % ', '.join(items))
+
+    elif output_format == 'csv':
+        reader = CellReader(database.Issue.schema, fields, _cell, str)
+        writer = csv.writer(out)
+        writer.writerow(fields)
+        for issue, cells in reader.read(issues):
+            writer.writerow(cells)
+
+    elif output_format == 'tsv':
+        reader = CellReader(database.Issue.schema, fields, _tsv_cell,
+                            _tsv_escape)
+        out.write('\t'.join(fields) + '\n')
+        for issue, cells in reader.read(issues):
+            out.write('\t'.join(cells) + '\n')
+
+    else:
+        raise ValueError("Unknown format '%s'" % output_format)
+
 
 class GitRepoNotFound(Exception):
     pass
@@ -216,6 +489,18 @@ class PropertyValidationError(Exception):
 class IssueIDNotFound(Exception):
     pass
 
+class BatchError(Exception):
+    """
+    Raised when an operation of a batch cannot be applied
+    """
+    def __init__(self, lineno, error):
+        self.lineno = lineno
+        self.error = error
+        return super(BatchError, self).__init__()
+
+    def __str__(self):
+        return "Line %d: %s" % (self.lineno, self.error)
+
 class IssueIDConflict(Exception):
     def __init__(self, issues):
         self.issues = issues
@@ -224,31 +509,27 @@ class IssueIDConflict(Exception):
         return super(IssueIDConflict, self).__init__()
 
     def _calculate_threshold(self):
-        first = self.issues[0].get_property('id').value
-        second = self.issues[1].get_property('id').value
-
-        for i in range(len(first)):
-            if first[i] != second[i]:
-                break
-
-        return i
+        return len(os.path.commonprefix(
+            [issue.get_value('id') for issue in self.issues]
+            ))
 
     def __str__(self):
         msg = ''
         for issue in self.issues:
             msg += "[%s]%s: %s\n" %\
-                   (issue.get_property('id').value[:self._threshold],
-                    issue.get_property('id').value[self._threshold:],
-                    issue.get_property('title')
+                   (issue.get_value('id')[:self._threshold],
+                    issue.get_value('id')[self._threshold:],
+                    issue.get_value('title')
                     )
 
         return msg.strip()
 
 import gitshelve
+import objectstore
 import database
 
-# initialize gitshelve
-git_repo = gitshelve.open(branch='gitissius')
+# initialize gitshelve, it is read on first use
+git_repo = gitshelve.open(branch='gitissius', lazy=True)
 
 # initialize issue manager
 issue_manager = database.IssueManager()
@@ -0,0 +1,144 @@
+"""
+Completion of issue ids, fields and committers for shells.
+
+Answers come from a small index the issue manager writes along with
+its cache, so completing never opens the shelf, loads issues or
+imports the commands. The index is a header line with its version and
+the gitissius head it describes, a line with the JSON encoded fields
+and their option values, and then one line per issue, sorted:
+
+  <id> <shortest unique prefix of the id>
+"""
+import os
+import json
+import bisect
+
+import objectstore
+
+INDEX_NAME = 'gitissius.complete'
+INDEX_VERSION = 1
+BRANCH = 'refs/heads/gitissius'
+
+def index_path(git_dir):
+    return os.path.join(git_dir, INDEX_NAME)
+
+def format_index(head, ids, prefix_lengths, fields):
+    """
+    Return the contents of a completion index.
+    """
+    lines = ['gitissius-complete %d %s' % (INDEX_VERSION, head),
+             json.dumps(fields, sort_keys=True)]
+
+    for issue_id, length in zip(ids, prefix_lengths):
+        lines.append('%s %s' % (issue_id, issue_id[:length]))
+
+    return '\n'.join(lines) + '\n'
+
+def read_index(path):
+    """
+    Return the head, fields and issue lines of the index at path, or
+    None if there is no usable index.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as flp:
+        lines = flp.read().splitlines()
+
+    if len(lines) < 2:
+        return None
+
+    header = lines[0].split(' ')
+    if len(header) != 3 or header[0] != 'gitissius-complete' or \
+       header[1] != str(INDEX_VERSION):
+        return None
+
+    return header[2], json.loads(lines[1]), lines[2:]
+
+def current_head(git_dir):
+    """
+    Return the head of the gitissius branch, or None if there is none.
+    """
+    try:
+        return objectstore.ObjectStore(git_dir).resolve_ref(BRANCH)
+
+    except (objectstore.UnsupportedObject, IOError, OSError):
+        pass
+
+    import gitshelve
+
+    try:
+        return gitshelve.git('rev-parse', '--verify', '-q', BRANCH)
+
+    except gitshelve.GitError:
+        return None
+
+def complete_ids(lines, prefix):
+    """
+    Return the ids starting with prefix, as short as they can be while
+    still unique and starting with prefix.
+    """
+    start = bisect.bisect_left(lines, prefix)
+    end = bisect.bisect_left(lines, prefix + '\xff', start)
+
+    return [short_id if len(short_id) >= len(prefix) else issue_id[:len(prefix)]
+            for issue_id, short_id in (line.split(' ')
+                                       for line in lines[start:end])]
+
+def complete_committers(git_dir, prefix):
+    """
+    Return the committers starting with prefix, from the list kept by
+    common.get_commiters, or None if it was never computed.
+    """
+    path = os.path.join(git_dir, 'gitissius.commiters')
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as flp:
+        names = json.load(flp)['commiters']
+
+    return [name.encode('utf8') for name in names
+            if name.lower().startswith(prefix.lower())]
+
+def complete(args, git_dir=None):
+    """
+    Return the completions asked for by args:
+
+      ids [prefix]
+      fields [prefix]
+      values field [prefix]
+      committers [prefix]
+
+    or None if the index they come from is missing or out of date.
+    """
+    kind = args[0] if args else 'ids'
+    args = args[1:]
+
+    try:
+        git_dir = git_dir or objectstore.find_git_dir()
+
+    except objectstore.UnsupportedObject:
+        return []
+
+    if kind == 'committers':
+        return complete_committers(git_dir, args[0] if args else '')
+
+    index = read_index(index_path(git_dir))
+    if index is None or index[0] != current_head(git_dir):
+        return None
+
+    head, fields, lines = index
+
+    if kind == 'ids':
+        return complete_ids(lines, args[0] if args else '')
+
+    elif kind == 'fields':
+        prefix = args[0] if args else ''
+        return [name for name in sorted(fields) if name.startswith(prefix)]
+
+    elif kind == 'values' and args:
+        prefix = args[1] if len(args) > 1 else ''
+        return [value for value in fields.get(args[0], [])
+                if value.startswith(prefix)]
+
+    return []
@@ -3,11 +3,20 @@
 """
 import os.path
 import json
-import pickle
+import bisect
+import heapq
+import itertools
 import datetime
 
+import blobcache
 import common
+import completion
+import fulltext
+import gitshelve
+import issueindex
+import planner
 import properties
+import query
 
 
 
@@ -24,37 +33,162 @@ class DateTimeJSONEncoder(json.JSONEncoder):
             return super(DateTimeJSONEncoder, self).default(obj)
 
 
+class Schema(object):
+    """
+    The properties of a kind of record, shared by all its records.
+
+    Records only hold their values, in the order of the properties.
+    Property objects are built on first use, as their colours need
+    common to be set up, and only materialized per record to edit or
+    print it.
+    """
+    def __init__(self, make_properties, print_order):
+        self.make_properties = make_properties
+        self.print_order = print_order
+        self._properties = None
+        self._index = None
+
+    def new_properties(self):
+        """
+        Return a fresh list of property objects, id last.
+        """
+        return self.make_properties() + [properties.Id(name='id')]
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            self._properties = self.new_properties()
+
+        return self._properties
+
+    @property
+    def names(self):
+        return [prop.name for prop in self.properties]
+
+    @property
+    def index(self):
+        """
+        Position of the value of each property in a record.
+        """
+        if self._index is None:
+            self._index = dict((prop.name, position)
+                               for position, prop in enumerate(self.properties))
+
+        return self._index
+
+    def values(self, data):
+        """
+        Return the values of a record holding data, the missing ones
+        set to their defaults.
+        """
+        values = []
+        for prop in self.properties:
+            if prop.name in data:
+                values.append(data[prop.name])
+
+            elif callable(prop.default):
+                values.append(prop.default())
+
+            else:
+                values.append(prop.default)
+
+        return values
+
+
+_blob_cache = None
+
+def parse_blobs(shelf, names):
+    """
+    Return the JSON data of the blobs names, parsing only those never
+    parsed before.
+    """
+    global _blob_cache
+
+    if _blob_cache is None:
+        _blob_cache = blobcache.BlobCache(
+            os.path.join(common.find_repo_root(), '.git',
+                         blobcache.CACHE_NAME))
+
+    return _blob_cache.parse(names, shelf.get_blobs, json.loads)
+
+
 class DbObject(object):
     """
     Issue Object. The Mother of All
     """
+    __slots__ = ('_values', '_property_map')
+
+    # overriden by children
+    schema = None
+
     def __init__(self, *args, **kwargs):
         """
         Issue Initializer
         """
-        self._properties += [properties.Id(name='id')]
+        values = self.schema.values(kwargs)
+
+        # children tell with _id_taken(value, data) which ids a new
+        # record holding data cannot have
+        position = self.schema.index['id']
+        if 'id' not in kwargs and self.schema.properties[position].auto:
+            values[position] = self.schema.properties[position].new_value(
+                lambda value: self._id_taken(value, kwargs))
+
+        self._init(values)
+
+        # given values are validated, as if entered by the user
+        for name in self.schema.names:
+            if name in kwargs:
+                self.get_property(name).set_value(kwargs[name])
+
+    def _init(self, values):
+        self._values = values
+        self._property_map = None
+
+    def __getstate__(self):
+        return list(self.values())
+
+    def __setstate__(self, state):
+        self._init(state)
+
+    def _materialize(self, names=None):
+        """
+        Return new property objects holding the values of the record,
+        only for names if given.
+        """
+        props = self.schema.new_properties()
+        if names is not None:
+            props = [prop for prop in props if prop.name in names]
 
-        for item in self._properties:
-            if item.name in kwargs.keys():
-                item.set_value(kwargs[item.name])
+        for prop in props:
+            prop.value = self.get_value(prop.name)
 
-        # random print order. override in children
-        self._print_order = []
-        for item in self._properties:
-            self._print_order.append(item.name)
+        return props
+
+    def _print_properties(self, names=None):
+        """
+        Return property objects by name to print the record. They are
+        only kept if the record is being edited.
+        """
+        if self._property_map is not None:
+            return self._property_map
+
+        return dict((prop.name, prop) for prop in self._materialize(names))
 
     def printme(self):
-        for name in self._print_order:
-            prop = self.get_property(name)
-            prop.printme()
+        prop_map = self._print_properties()
+        for name in self.schema.print_order:
+            prop_map[name].printme()
 
-    def printmedict(self):
+    def printmedict(self, names=None):
         """
-        Return a dictionary with all properties after self.repr
+        Return a dictionary with all properties, or only names, after
+        self.repr
         """
         dic = {}
-        for prop in self._properties:
-            dic[prop.name] = prop.repr('value').encode('utf8')
+        for prop in self._print_properties(names).values():
+            if names is None or prop.name in names:
+                dic[prop.name] = prop.repr('value').encode('utf8')
 
         return dic
 
@@ -62,18 +196,65 @@ class DbObject(object):
     def path(self):
         assert False
 
+    @property
+    def properties(self):
+        """
+        The property objects of the record by name, to edit them. From
+        then on the record keeps its values in them.
+        """
+        if self._property_map is None:
+            self._property_map = dict((prop.name, prop)
+                                      for prop in self._materialize())
+            self._values = None
+
+        return self._property_map
+
     def get_property(self, name):
-        for prop in self._properties:
-            if prop.name == name:
-                return prop
+        try:
+            return self.properties[name]
+
+        except KeyError:
+            raise Exception("Property not found")
+
+    def values(self):
+        """
+        Return the values of all properties, in schema order, as a list
+        or a row of the issue index.
+        """
+        if self._values is not None:
+            return self._values
+
+        return [self._property_map[name].value for name in self.schema.names]
+
+    def get_value(self, name):
+        """
+        Return the value of property name. Raises KeyError for unknown
+        properties.
+        """
+        if self._values is None:
+            return self._property_map[name].value
+
+        return self._values[self.schema.index[name]]
+
+    def set_value(self, name, value):
+        """
+        Set the value of property name, without validating it.
+        """
+        if self._values is None:
+            self._property_map[name].value = value
+            return
+
+        if not isinstance(self._values, list):
+            # read from the index, copy before changing
+            self._values = list(self._values)
 
-        raise Exception("Property not found")
+        self._values[self.schema.index[name]] = value
 
     def interactive_edit(self):
         """
         Interactive edit of issue properties.
         """
-        for name in self._print_order:
+        for name in self.schema.print_order:
             prop = self.get_property(name)
             prop.interactive_edit()
 
@@ -81,70 +262,87 @@ class DbObject(object):
         """
         Return a json string containing all issue information
         """
-        data = {}
-        for item in self._properties:
-            item_data = item.serialize()
-            data[item_data['name']] = item_data['value']
+        data = dict(zip(self.schema.names, self.values()))
 
         return json.dumps(data, indent=indent, cls=DateTimeJSONEncoder)
 
-    @property
-    def properties(self):
-        data = {}
-        for item in self._properties:
-            data[item.name] = item
+    @classmethod
+    def load(cls, data):
+        """
+        Return a record holding data read from the repository, which
+        is not validated again.
+        """
+        obj = cls.__new__(cls)
+        obj._init(cls.schema.values(data))
+        return obj
 
-        return data
+    @classmethod
+    def load_row(cls, index, row):
+        """
+        Return a record reading its values from a row of the issue
+        index.
+        """
+        obj = cls.__new__(cls)
+        obj._init(index.row(row))
+        return obj
 
     def __str__(self):
-        return self.get_property('title')
+        return self.get_value('title')
+
+def issue_properties():
+    return [
+        properties.Text(name='title', allow_empty=False),
+        properties.Option(name='status',
+                          options={'new':{'shortcut':'n', 'color':common.get_fore_color('YELLOW')},
+                                   'assigned':{'shortcut':'a', 'color':common.get_fore_color('GREEN')},
+                                   'invalid':{'shortcut':'i', 'color':common.get_fore_color('WHITE')},
+                                   'closed':{'shortcut':'c', 'color':common.get_fore_color('WHITE')}
+                                   },
+                          default='new'),
+        properties.Option(name='type',
+                          options={'bug':{'shortcut':'b', 'color':common.get_fore_color('YELLOW')},
+                                   'feature':{'shortcut':'f', 'color':common.get_fore_color('GREEN')}
+                                   },
+                          default='bug'),
+        properties.Option(name='severity',
+                          options={'high':{'shortcut':'h', 'color':common.get_fore_color('RED')},
+                                   'medium':{'shortcut':'m', 'color':common.get_fore_color('YELLOW')},
+                                   'low':{'shortcut':'l', 'color':common.get_fore_color('WHITE')}
+                                    },
+                          default='low'),
+        properties.Text(name='assigned_to', completion=common.get_commiters),
+        properties.Text(name='reported_from', completion=common.get_commiters, default=common.current_user),
+        properties.Date(name='created_on', editable=False, auto_add_now=True),
+        properties.Date(name='updated_on', editable=False, auto_now=True),
+        properties.Description(name='description')
+        ]
 
 class Issue(DbObject):
-    def __init__(self, *args, **kwargs):
-        self._properties =  [
-            properties.Text(name='title', allow_empty=False),
-            properties.Option(name='status',
-                              options={'new':{'shortcut':'n', 'color':common.get_fore_color('YELLOW')},
-                                       'assigned':{'shortcut':'a', 'color':common.get_fore_color('GREEN')},
-                                       'invalid':{'shortcut':'i', 'color':common.get_fore_color('WHITE')},
-                                       'closed':{'shortcut':'c', 'color':common.get_fore_color('WHITE')}
-                                       },
-                              default='new'),
-            properties.Option(name='type',
-                              options={'bug':{'shortcut':'b', 'color':common.get_fore_color('YELLOW')},
-                                       'feature':{'shortcut':'f', 'color':common.get_fore_color('GREEN')}
-                                       },
-                              default='bug'),
-            properties.Option(name='severity',
-                              options={'high':{'shortcut':'h', 'color':common.get_fore_color('RED')},
-                                       'medium':{'shortcut':'m', 'color':common.get_fore_color('YELLOW')},
-                                       'low':{'shortcut':'l', 'color':common.get_fore_color('WHITE')}
-                                        },
-                              default='low'),
-            properties.Text(name='assigned_to', completion=common.get_commiters()),
-            properties.Text(name='reported_from', completion=common.get_commiters(), default=common.current_user()),
-            properties.Date(name='created_on', editable=False, auto_add_now=True),
-            properties.Date(name='updated_on', editable=False, auto_now=True),
-            properties.Description(name='description')
-            ]
-
-        self._comments = []
-        super(Issue, self).__init__(*args, **kwargs)
-
-        self._print_order = ['id', 'title', 'type', 'severity', 'reported_from', 'assigned_to',
-                             'created_on', 'updated_on', 'status', 'description'
-                             ]
+    __slots__ = ('_comments',)
+
+    schema = Schema(issue_properties,
+                    print_order=['id', 'title', 'type', 'severity', 'reported_from', 'assigned_to',
+                                 'created_on', 'updated_on', 'status', 'description'
+                                 ])
+
+    def _init(self, values):
+        super(Issue, self)._init(values)
+        # read on first use, None until then
+        self._comments = None
+
+    def _id_taken(self, value, data):
+        return value in common.issue_manager.issuedb
 
     @property
     def path(self):
-        id = self.get_property('id')
-        return "{id!s}/issue".format(**{'id':id})
+        id = self.get_value('id')
+        return "{dir}/issue".format(**{'dir': issue_dir(str(id))})
 
 
     @property
     def comments(self):
-        if not self._comments:
-            self._build_commentsdb()
+        if self._comments is None:
+            self._comments = self._build_commentsdb()
 
         return self._comments
 
@@ -155,110 +353,603 @@ class Issue(DbObject):
         del common.git_repo[self.path]
 
     def _build_commentsdb(self):
-        id = self.get_property('id')
-        comment_path = "{id}/comments/".format(**{'id':id})
+        """
+        Return the comments of the issue, oldest first.
+        """
+        id = self.get_value('id')
+        comment_path = "{dir}/comments".format(**{'dir': issue_dir(str(id))})
+        comments = []
 
-        for item in common.git_repo.keys():
-            if item.startswith(comment_path):
-                obj = Comment.load(json.loads(common.git_repo[item]))
-                self._comments.append(obj)
+        try:
+            tree = common.git_repo.get_tree(comment_path)
 
-        self._comments.sort(key=lambda x: x.get_property('created_on').value)
+        except KeyError:
+            # no comments
+            return comments
 
-        return self._comments
+        books = list(common.git_repo.walker('values', tree))
 
-    @classmethod
-    def load(cls, data):
-        return Issue(**data)
+        # comments changed but not committed yet have no blob
+        stored = [book for book in books if book.data is None]
+        for data in parse_blobs(common.git_repo,
+                                [book.name for book in stored]):
+            comments.append(Comment.load(data))
+
+        for book in books:
+            if book.data is not None:
+                comments.append(Comment.load(json.loads(book.data)))
+
+        comments.sort(key=lambda x: x.get_value('created_on'))
+
+        return comments
+
+def comment_properties():
+    return [
+        properties.Text(name='reported_from', default=common.current_user, completion=common.get_commiters,),
+        properties.Id(name="issue_id", auto=False),
+        properties.Date(name="created_on", editable=False, auto_add_now=True),
+        properties.Description(name="description"),
+        ]
 
 class Comment(DbObject):
-    def __init__(self, *args, **kwargs):
-        self._properties = [
-            properties.Text(name='reported_from', default=common.current_user(), completion=common.get_commiters(),),
-            properties.Id(name="issue_id", auto=False),
-            properties.Date(name="created_on", editable=False, auto_add_now=True),
-            properties.Description(name="description"),
-            ]
+    __slots__ = ()
 
-        super(Comment, self).__init__(*args, **kwargs)
+    schema = Schema(comment_properties,
+                    print_order=['reported_from', 'created_on', 'description'])
 
-        self._print_order = ['reported_from', 'created_on', 'description']
+    def _id_taken(self, value, data):
+        # comment ids only have to differ from those of the same issue,
+        # committed or not
+        return "{dir}/comments/{commentid!s}".\
+               format(**{'dir': issue_dir(str(data['issue_id'])),
+                         'commentid': value
+                         }) in common.git_repo
 
     @property
     def path(self):
-        issue_id = self.get_property('issue_id')
-        return "{issueid!s}/comments/{commentid!s}".\
-               format(**{'issueid': issue_id,
-                         'commentid': self.get_property('id')
+        issue_id = self.get_value('issue_id')
+        return "{dir}/comments/{commentid!s}".\
+               format(**{'dir': issue_dir(str(issue_id)),
+                         'commentid': self.get_value('id')
                          })
 
     def delete(self):
         del common.git_repo[self.path]
 
-    @classmethod
-    def load(cls, data):
-        return Comment(**data)
+# Issues used to live in <id>/ at the top of the tree (layout 1). Layout
+# 2 shards them in <id[:2]>/<id[2:]>/ so that no tree grows with the
+# number of issues. The layout in use is recorded in LAYOUT_PATH; both
+# are always readable.
+LAYOUT_PATH = '.layout'
+LAYOUT_VERSION = 2
+
+def layout_version():
+    """
+    Return the layout new issues are written in.
+    """
+    if LAYOUT_PATH not in common.git_repo:
+        return 1
+
+    return json.loads(common.git_repo[LAYOUT_PATH])['version']
+
+def set_layout_version(version):
+    common.git_repo[LAYOUT_PATH] = json.dumps({'version': version})
+
+def issue_dir(issue_id):
+    """
+    Return the tree holding an issue: wherever it already is, or
+    where the current layout places new issues.
+    """
+    sharded = "%s/%s" % (issue_id[:2], issue_id[2:])
+
+    for path in (sharded, issue_id):
+        if common.git_repo.has_tree(path):
+            return path
+
+    if layout_version() >= 2:
+        return sharded
+
+    return issue_id
+
+def issue_id_from_path(path):
+    """
+    Return the issue id if path points to an issue blob, i.e.
+    <id>/issue or <id[:2]>/<id[2:]>/issue, else None.
+    """
+    parts = path.split('/')
+    if parts[-1] != 'issue':
+        return None
+
+    if len(parts) == 2 and len(parts[0]) == 64:
+        return parts[0]
+
+    if len(parts) == 3 and len(parts[0]) == 2 and len(parts[1]) == 62:
+        return parts[0] + parts[1]
+
+    return None
+
+def comment_ids_from_path(path):
+    """
+    Return an (issue id, comment id) tuple if path points to a comment
+    blob, i.e. <issue dir>/comments/<id>, else None.
+    """
+    parts = path.split('/')
+    if len(parts) < 3 or parts[-2] != 'comments':
+        return None
+
+    issue_id = issue_id_from_path('/'.join(parts[:-2] + ['issue']))
+    if issue_id is None:
+        return None
+
+    return (issue_id, parts[-1])
+
+def is_issue_path(path):
+    """
+    Return True if path points to an issue blob.
+    """
+    return issue_id_from_path(path) is not None
+
+def owner_id(path):
+    """
+    Return the id of the issue an issue or comment blob belongs to, or
+    None.
+    """
+    issue_id = issue_id_from_path(path)
+    if issue_id is None:
+        comment_ids = comment_ids_from_path(path)
+        if comment_ids:
+            issue_id = comment_ids[0]
+
+    return issue_id
+
+def _sort_key(value):
+    # any two values compare the same way on every machine
+    return json.dumps(value, sort_keys=True, cls=DateTimeJSONEncoder)
+
+def merge_value(base, ours, theirs, theirs_newer):
+    """
+    Three-way merge of a single property value. When both sides
+    changed it, the side updated last wins, and on a tie the greater
+    value, so that every clone resolves the conflict the same way.
+    """
+    if ours == theirs or theirs == base:
+        return ours
+
+    if ours == base:
+        return theirs
+
+    if theirs_newer is None:
+        return max(ours, theirs, key=_sort_key)
+
+    return theirs if theirs_newer else ours
+
+def merge_object(cls, base, ours, theirs):
+    """
+    Merge the data of three versions of an Issue or Comment property
+    by property and return the merged object.
+    """
+    obj = cls.load(ours)
+
+    ours_on = ours.get('updated_on') or ''
+    theirs_on = theirs.get('updated_on') or ''
+    theirs_newer = None
+    if ours_on != theirs_on:
+        theirs_newer = theirs_on > ours_on
+
+    for name in cls.schema.names:
+        if name == 'updated_on':
+            obj.set_value(name, max(ours_on, theirs_on) or None)
+            continue
+
+        obj.set_value(name, merge_value(base.get(name),
+                                        ours.get(name),
+                                        theirs.get(name),
+                                        theirs_newer))
+
+    return obj
+
+def merge_changes(shelf, ours, theirs):
+    """
+    Apply the (path, old_blob, new_blob) changes made on the other
+    side since the merge base on top of shelf, which holds our side
+    and whose own changes are ours.
+
+    Only paths changed on both sides are read. Issues and comments
+    are merged property by property. Comments are united by id, and
+    deleting an issue loses against any change to it, including new
+    comments, on the other side.
+    """
+    ours = dict((path, (old, new)) for path, old, new in ours)
+    theirs = dict((path, (old, new)) for path, old, new in theirs)
+
+    kept = set()
+    for deleted, changed in ((ours, theirs), (theirs, ours)):
+        touched = set(owner_id(path)
+                      for path, (old, new) in changed.items()
+                      if new is not None)
+
+        for path, (old, new) in deleted.items():
+            if new is None and issue_id_from_path(path) in touched:
+                kept.add(issue_id_from_path(path))
+
+    conflicts = []
+    for path, (old, new) in theirs.items():
+        if path not in ours:
+            if new is None and owner_id(path) in kept:
+                continue
+
+            elif new is None:
+                if path in shelf:
+                    del shelf[path]
+
+            else:
+                shelf.set_blob(path, new)
+
+            continue
+
+        mine = ours[path][1]
+        if mine == new:
+            # same change on both sides
+            continue
+
+        if mine is None or new is None:
+            # a modification wins against a deletion
+            shelf.set_blob(path, mine or new)
+            continue
+
+        conflicts.append((path, old, mine, new))
+
+    # restore what we deleted along with issues that are kept
+    for path, (old, new) in ours.items():
+        if new is None and path not in theirs and owner_id(path) in kept:
+            shelf.set_blob(path, old)
+
+    names = set()
+    for path, old, mine, new in conflicts:
+        names.update(name for name in (old, mine, new) if name)
+
+    names = list(names)
+    blobs = dict(zip(names, shelf.get_blobs(names)))
+
+    for path, old, mine, new in conflicts:
+        if is_issue_path(path):
+            cls = Issue
+
+        elif comment_ids_from_path(path):
+            cls = Comment
+
+        else:
+            # not ours to interpret, keep the greater one
+            shelf.set_blob(path, max(mine, new, key=lambda x: blobs[x]))
+            continue
+
+        base = json.loads(blobs[old]) if old else {}
+        obj = merge_object(cls, base,
+                           json.loads(blobs[mine]),
+                           json.loads(blobs[new]))
+
+        shelf[path] = obj.serialize(indent=4)
+
+def search_text(data):
+    """
+    Return the text of an issue or comment searches look at.
+    """
+    return u'\n'.join(data.get(name) or u''
+                      for name in ('title', 'description'))
+
+class Descending(object):
+    """
+    Sorts value in descending order, among values sorting in ascending
+    order.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
 
 class IssueManager(object):
     """
     Issue manager object
     """
+    # never display ids shorter than this, even if unique
+    MIN_ID_LENGTH = 5
+
+    # fields the index keeps the issues of each value for
+    INDEXED_FIELDS = ['status', 'type', 'severity',
+                      'assigned_to', 'reported_from']
+
+    # fields the index keeps the issues sorted by
+    ORDERED_FIELDS = ['created_on', 'updated_on']
+
     def __init__(self):
+        self._index = None
         self._issuedb = None
+        self._comment_index = None
+        self._ids = None
+        self._prefix_lengths = None
+        self._search_index = None
 
     @property
     def issuedb(self):
-        if not self._issuedb:
+        if self._issuedb is None:
             self._build_issuedb()
 
         return self._issuedb
 
+    @property
+    def ids(self):
+        """
+        All issue ids, sorted.
+        """
+        if self._ids is None:
+            self._build_issuedb()
+
+        return self._ids
+
+    @property
+    def comment_index(self):
+        """
+        Creation dates of the comments, by issue and comment id.
+        """
+        if self._issuedb is None:
+            self._build_issuedb()
+
+        if self._comment_index is None:
+            # read from the index on first use
+            self._load_comment_index()
+
+        return self._comment_index
+
+    def _load_comment_index(self):
+        """
+        Read the creation dates of the comments from the index.
+        """
+        self._comment_index = {}
+        for issue_id, comment_id, created_on in self._index.comments():
+            self._comment_index.setdefault(issue_id, {})[comment_id] = \
+                created_on
+
     def _build_issuedb(self):
+        # get current head
+        current_head = common.git_repo.current_head()
+
+        index = self._load_index()
+
+        if index and index.head == current_head:
+            self._restore(index)
+            return
+
         self._issuedb = {}
+        self._comment_index = {}
+        changes = None
+        if index and index.head:
+            # only re-read issues that changed since the indexed head
+            try:
+                changes = common.git_repo.diff_trees(index.head,
+                                                     current_head)
+
+            except gitshelve.GitError:
+                # indexed head is gone, e.g. after a forced update
+                changes = None
+
+        if changes is None:
+            changes = [(key, None, book.name)
+                       for key, book in common.git_repo.iteritems()]
 
-        # get current head
+        else:
+            self._restore(index)
+            self._load_comment_index()
+
+        self._apply_changes(changes)
+        self._update_ids()
+        self._save_index(current_head)
+
+    def _restore(self, index):
+        """
+        Use the issues of index. Their values are read from it when
+        needed.
+        """
+        self._index = index
+        self._ids = [str(issue_id) for issue_id in
+                     index.values(Issue.schema.index['id'])]
+        self._issuedb = dict((issue_id, Issue.load_row(index, row))
+                             for row, issue_id in enumerate(self._ids))
+        self._prefix_lengths = index.prefix_lengths
+        self._comment_index = None
+
+    def _update_ids(self):
+        """
+        Rebuild the sorted id array and the length of the shortest
+        unique prefix of each id, which only depends on its neighbours.
+        """
+        self._ids = sorted(self._issuedb)
+        self._prefix_lengths = []
+
+        previous = 0
+        for i in range(len(self._ids)):
+            following = 0
+            if i + 1 < len(self._ids):
+                following = len(os.path.commonprefix(self._ids[i:i + 2]))
+
+            self._prefix_lengths.append(max(previous, following) + 1)
+            previous = following
+
+    def _apply_changes(self, changes):
+        """
+        Update issuedb and the comment index from a list of (path,
+        old_blob, new_blob) changes, loading all new blobs at once.
+        """
+        changed = []
+        for path, old_blob, new_blob in changes:
+            issue_id = issue_id_from_path(path)
+            comment_ids = None
+            if issue_id is None:
+                comment_ids = comment_ids_from_path(path)
+                if comment_ids is None:
+                    # neither an issue nor a comment
+                    continue
+
+            if new_blob is not None:
+                changed.append((new_blob, comment_ids))
+
+            elif comment_ids:
+                comments = self._comment_index.get(comment_ids[0], {})
+                comments.pop(comment_ids[1], None)
+                if not comments:
+                    self._comment_index.pop(comment_ids[0], None)
+
+            else:
+                self._issuedb.pop(issue_id, None)
+
+        blobs = parse_blobs(common.git_repo, [blob for blob, ids in changed])
+        for (blob, comment_ids), data in zip(changed, blobs):
+            if comment_ids:
+                # only what listings need, comments are read on demand
+                issue_id, comment_id = comment_ids
+                self._comment_index.setdefault(issue_id, {})[comment_id] = \
+                    data.get('created_on')
+
+            else:
+                obj = Issue.load(data)
+                self._issuedb[str(obj.get_value('id'))] = obj
+
+    def comment_count(self, issue_id):
+        """
+        Return the number of comments on an issue.
+        """
+        return len(self.comment_index.get(issue_id, ()))
+
+    def last_comment_on(self, issue_id):
+        """
+        Return the creation date of the latest comment on an issue, or
+        None if there are no comments.
+        """
+        comments = self.comment_index.get(issue_id)
+        if not comments:
+            return None
+
+        return max(comments.values())
+
+    def _git_dir(self):
+        return os.path.join(common.find_repo_root(), '.git')
+
+    def _load_index(self):
+        return issueindex.read_index(issueindex.index_path(self._git_dir()),
+                                     Issue.schema.names)
+
+    def _save_index(self, head):
+        git_dir = self._git_dir()
+
+        # delete the pickled caches of older versions
+        for fln in os.listdir(git_dir):
+            if fln.startswith('gitissius.') and fln.endswith('.cache'):
+                os.remove(os.path.join(git_dir, fln))
+
+        comments = []
+        for issue_id, dates in self._comment_index.items():
+            for comment_id, created_on in dates.items():
+                comments.append((issue_id, comment_id, created_on))
+
+        data = issueindex.format_index(
+            head, Issue.schema.names,
+            [self._issuedb[issue_id].values() for issue_id in self._ids],
+            self._prefix_lengths, comments,
+            [Issue.schema.index[name] for name in self.INDEXED_FIELDS],
+            [Issue.schema.index[name] for name in self.ORDERED_FIELDS])
+        common.write_atomically(issueindex.index_path(git_dir), data)
+
+        # postings of the issues just written
+        self._index = issueindex.Index(data)
+
+        self.save_completion_index(head)
+
+    def save_completion_index(self, head):
+        """
+        Write the index `git issius complete' answers from.
+        """
+        fields = {}
+        for prop in Issue.schema.properties:
+            fields[prop.name] = sorted(getattr(prop, 'options', []))
+
+        lengths = [max(length, self.MIN_ID_LENGTH)
+                   for length in self._prefix_lengths]
+
+        path = completion.index_path(self._git_dir())
+        common.write_atomically(path, completion.format_index(
+            head, self._ids, lengths, fields))
+
+    def search_index(self):
+        """
+        Return the full-text index of the issues, updated from the blobs
+        that changed since it was last used.
+        """
         current_head = common.git_repo.current_head()
+        index_path = os.path.join(self._git_dir(), fulltext.INDEX_NAME)
+
+        index = self._search_index or fulltext.read_index(index_path)
+        if index and index.head == current_head:
+            self._search_index = index
+            return index
+
+        changes = None
+        if index and index.head and \
+           index.doc_count < 2 * index.live_count + 1000:
+            try:
+                changes = common.git_repo.diff_trees(index.head, current_head)
+
+            except gitshelve.GitError:
+                # indexed head is gone, e.g. after a forced update
+                changes = None
+
+        if changes is None:
+            # start over, removed documents took too much room
+            index = None
+            changes = [(key, None, book.name)
+                       for key, book in common.git_repo.iteritems()]
+
+        changes = [(path, old, new) for path, old, new in changes
+                   if owner_id(path)]
+
+        names = set()
+        for path, old, new in changes:
+            names.update(name for name in (old, new) if name)
+
+        names = list(names)
+        texts = dict(zip(names, parse_blobs(common.git_repo, names)))
+
+        removed = []
+        added = []
+        for path, old, new in changes:
+            if old:
+                removed.append((old, search_text(texts[old])))
+
+            if new:
+                added.append((new, str(owner_id(path)),
+                              search_text(texts[new])))
+
+        data = fulltext.update(index, current_head, removed, added)
+        common.write_atomically(index_path, data)
+
+        self._search_index = fulltext.SearchIndex(data)
+        return self._search_index
+
+    def search(self, args):
+        """
+        Return the issues matching the query in args, best first.
+        """
+        results = self.search_index().search(fulltext.parse_query(args))
 
-        # check if we have cache for current head
-        path = os.path.join(common.find_repo_root(),
-                            '.git',
-                            'gitissius.%s%s.cache' %\
-                            (current_head,
-                             '.colorama' if common.colorama else ''
-                             )
-                            )
-        loaded = False
-
-        if os.path.exists(path):
-            with open(path) as flp:
-                try:
-                    self._issuedb = pickle.load(flp)
-                    loaded = True
-
-                except:
-                    loaded = False
-
-        if not loaded:
-            for issue in common.git_repo.keys():
-                if not '/comments/' in issue:
-                    # making sure that we don't treat comments as issues
-                    obj = Issue.load(json.loads(common.git_repo[issue]))
-                    self._issuedb[str(obj.get_property('id'))] = obj
-
-
-            # delete previous caches
-            for fln in os.listdir(os.path.join(common.find_repo_root(),
-                                              '.git')
-                                 ):
-                if fln.startswith('gitissius') and fln.endswith('.cache'):
-                    os.remove(os.path.join(common.find_repo_root(),
-                                           '.git',
-                                           fln)
-                              )
-
-            # create new
-            with open(path, "wb") as flp:
-                pickle.dump(self._issuedb, flp)
+        return [self.issuedb[issue_id] for score, issue_id in results
+                if issue_id in self.issuedb]
 
     def update_db(self):
         self._build_issuedb()
@@ -266,81 +957,202 @@ class IssueManager(object):
     def all(self, sort_key=None):
         return self.filter(sort_key=sort_key)
 
-    def filter(self, rules=None, operator="and", sort_key=None):
-        assert isinstance(rules, list)
-
-        matching_keys = self.issuedb.keys()
-        not_maching_keys = []
-
-        if rules:
-            for rule in rules:
-                name, value = rule.items()[0]
-                # parse operators
-                cmd = name.split("__")
-                name = cmd[0]
-
-                operators = [lambda x, y: x.lower() in y.lower()]
-
-                if "exact" in cmd[1:]:
-                    operators += [lambda x, y: x == y]
-
-                if "startswith" in cmd[1:]:
-                    operators += [lambda x, y: y.startswith(x)]
-
-                for key in matching_keys:
-                    try:
-                        result = reduce(lambda x, y: x==y==True,
-                                        map(lambda x: x(value,
-                                                        self.issuedb[key].\
-                                                        properties[name].value
-                                                        ),
-                                            operators
-                                            )
-                                        )
-
-                        if "not" in cmd[1:]:
-                            if result:
-                                not_maching_keys.append(key)
-
-                        else:
-                            if not result:
-                                not_maching_keys.append(key)
-
-                    except KeyError:
-                        print "Error searching"
-                        return []
-
-            for key in not_maching_keys:
-                try:
-                    matching_keys.remove(key)
-                except ValueError:
-                    continue
+    def filter(self, rules=None, operator="and", sort_key=None,
+               limit=None, offset=0):
+        """
+        Return an iterator over the issues matching rules, combined with
+        operator, sorted by sort_key (see order). Only limit issues are
+        produced, if given, from the offset one on. Unsorted issues are
+        produced as they are found. Raises ValueError for unknown sort
+        keys.
+        """
+        fields = self.sort_fields(sort_key)
+        rows = self._search(rules, operator)
+
+        end = None
+        if limit is not None:
+            end = offset + limit
+
+        if not fields:
+            return itertools.imap(self._record,
+                                  itertools.islice(rows, offset, end))
 
-            issues = []
-            for key in matching_keys:
-                issues.append(self.issuedb[key])
+        rows = list(rows)
+        if end is not None:
+            issues = self._first_in_order(rows, fields, end)
 
         else:
-            issues = [issue for issue in self.issuedb.values()]
+            issues = self.order([self._record(row) for row in rows], fields)
 
-        if sort_key:
-            issues = self.order(issues, sort_key)
+        return iter(issues[offset:])
 
-        return issues
+    def _search(self, rules, operator):
+        """
+        Yield the rows of the issues matching rules, in order.
+        """
+        try:
+            for row in self.plan(rules, operator).rows():
+                yield row
 
-    def order(self, issues, key):
+        except (KeyError, ValueError):
+            print "Error searching"
+
+    def parse_filter(self, text):
         """
-        Short issues by key
+        Return the condition of a filter written in the filter language
+        of query.py. Raises query.QueryError on errors.
         """
-        issues.sort(key=lambda x: x.get_property(key).value)
+        return query.parse(text, Issue.schema.names,
+                           [prop.name for prop in Issue.schema.properties
+                            if isinstance(prop, properties.Date)])
+
+    def plan(self, rules=None, operator="and"):
+        """
+        Return the plan finding the issues matching rules, which are
+        rules or conditions (see query.py), combined with operator.
+        """
+        condition = query.compile_rules(rules or [], operator)
+
+        count = len(self.ids)
+
+        # rows of the index must be the issues in memory
+        index = self._index
+        if index is not None and index.count != count:
+            index = None
+
+        return planner.Planner(index, Issue.schema.index, count,
+                               self._record).plan(condition)
+
+    def run(self, plan):
+        """
+        Return the issues plan finds.
+        """
+        return [self._record(row) for row in plan.run()]
+
+    def _record(self, row):
+        return self._issuedb[self._ids[row]]
+
+    def sort_fields(self, sort_key):
+        """
+        Return the (field, descending) pairs of sort_key, a comma
+        separated list of fields, each prefixed with '-' to sort in
+        descending order.
+        """
+        fields = []
+        for name in (sort_key or '').split(','):
+            name = name.strip()
+            if not name:
+                continue
+
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name not in Issue.schema.index:
+                raise ValueError("Unknown sort key '%s'" % name)
+
+            fields.append((name, descending))
+
+        return fields
+
+    def _sort_function(self, fields):
+        def key(issue):
+            return tuple(Descending(issue.get_value(name)) if descending
+                         else issue.get_value(name)
+                         for name, descending in fields)
+
+        return key
+
+    def order(self, issues, key, count=None):
+        """
+        Sort issues by key, a sort key or its fields, keeping only the
+        first count issues if given.
+        """
+        if not isinstance(key, list):
+            key = self.sort_fields(key)
+
+        key = self._sort_function(key)
+
+        if count is not None:
+            return heapq.nsmallest(count, issues, key=key)
+
+        issues.sort(key=key)
         return issues
 
+    def _first_in_order(self, rows, fields, count):
+        """
+        Return the first count issues of rows sorted by fields. If the
+        index keeps the issues sorted by the first field, only as many
+        issues as needed are read in that order. Otherwise the issues
+        are selected with a heap.
+        """
+        name, descending = fields[0]
+        index = self._index
+
+        order = None
+        if index is not None and index.count == len(self._ids):
+            order = index.order(Issue.schema.index[name])
+
+        if order is None:
+            return self.order((self._record(row) for row in rows), fields,
+                              count)
+
+        if descending:
+            order = reversed(order)
+
+        # all issues, or those of rows
+        wanted = None
+        if len(rows) < index.count:
+            wanted = set(rows)
+
+        # go on past count issues while the first field ties, the other
+        # fields may put those first
+        column = index.column(Issue.schema.index[name])
+        picked = []
+        for row in order:
+            if wanted is not None and row not in wanted:
+                continue
+
+            if len(picked) >= count and \
+               (not picked or column[row] != column[picked[-1]]):
+                break
+
+            picked.append(row)
+
+        picked.sort()
+        return self.order([self._record(row) for row in picked], fields,
+                          count)
+
+    def _find(self, issue_id):
+        """
+        Return the position of issue_id in the sorted id array.
+        """
+        position = bisect.bisect_left(self.ids, issue_id)
+        if position == len(self._ids) or self._ids[position] != issue_id:
+            raise common.IssueIDNotFound(issue_id)
+
+        return position
+
+    def unique_prefix_length(self, issue_id):
+        """
+        Return the length of the shortest prefix that identifies
+        issue_id, never less than MIN_ID_LENGTH.
+        """
+        try:
+            length = self._prefix_lengths[self._find(issue_id)]
+
+        except common.IssueIDNotFound:
+            # not committed yet
+            length = len(issue_id)
+
+        return max(length, self.MIN_ID_LENGTH)
+
     def get(self, issue_id):
-        matching_keys = []
+        ids = self.ids
+        position = bisect.bisect_left(ids, issue_id)
 
-        for key in self.issuedb.keys():
-            if key.startswith(issue_id):
-                matching_keys.append(key)
+        matching_keys = []
+        while position < len(ids) and ids[position].startswith(issue_id):
+            matching_keys.append(ids[position])
+            position += 1
 
         if len(matching_keys) == 0:
             raise common.IssueIDNotFound(issue_id)
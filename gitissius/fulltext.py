@@ -0,0 +1,522 @@
+"""
+Full-text search of issues and their comments.
+
+Titles and descriptions of issues and the descriptions of comments are
+split in lower case words, the terms, and kept in an inverted index in
+.git/gitissius.search. For every term the index holds the documents it
+appears in and its positions in each, so that phrases can be matched.
+A document is an issue or a comment blob. Matches are ranked per issue
+with BM25.
+
+Updating the index only reads the documents that changed: the entries
+of other terms are copied as they are, new postings are appended and
+the space of replaced ones is reclaimed when it grows larger than the
+postings in use.
+
+All numbers are little endian unsigned 32 bit integers. The file is:
+
+  header     magic, format version, the gitissius head it describes,
+             the number of issues, documents, live documents and terms,
+             the total length of the live documents, the size of the
+             term strings and of the unused postings
+  issues     the issue ids, 64 bytes each
+  documents  the names of the blobs, 20 bytes each, then a column with
+             the issue number of each document, NULL for removed ones,
+             and a column with their length in terms
+  terms      offset and length of the string, offset of the postings,
+             number of documents and number of positions of each term,
+             sorted by term
+  strings    the UTF-8 strings of the terms
+  postings   for each term, the documents it appears in, ascending, the
+             times it appears in each and its positions in them
+"""
+import re
+import sys
+import bisect
+import math
+import mmap
+import array
+import struct
+import os.path
+
+INDEX_NAME = 'gitissius.search'
+INDEX_VERSION = 1
+MAGIC = 'GISSERCH'
+
+# magic, version, head, issues, documents, live documents, terms,
+# total length, strings size, unused postings size
+HEADER = struct.Struct('<8sI40sIIIIIII')
+TERM = struct.Struct('<IIIII')
+
+NULL = 0xffffffff
+ID_SIZE = 64
+BLOB_SIZE = 20
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """
+    Return the terms of text, in order.
+    """
+    if not text:
+        return []
+
+    if isinstance(text, str):
+        text = text.decode('utf8', 'replace')
+
+    return [word.lower() for word in WORD.findall(text)]
+
+def term_positions(terms):
+    """
+    Return the positions of each of terms.
+    """
+    positions = {}
+    for position, term in enumerate(terms):
+        positions.setdefault(term, []).append(position)
+
+    return positions
+
+def parse_query(args):
+    """
+    Return the elements of a query, each a list of terms that have to
+    appear in this order. Words in double quotes, arguments with spaces
+    and words that split in many terms, like foo-bar, are phrases.
+    """
+    elements = []
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.decode('utf8', 'replace')
+
+        if '"' not in arg and len(arg.split()) > 1:
+            arg = u'"%s"' % arg
+
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', arg):
+            terms = tokenize(phrase or word)
+            if terms:
+                elements.append(terms)
+
+    return elements
+
+def _to_bytes(numbers):
+    if not isinstance(numbers, array.array) or sys.byteorder != 'little':
+        numbers = array.array('I', numbers)
+
+    if sys.byteorder != 'little':
+        numbers.byteswap()
+
+    return numbers.tostring()
+
+def _from_bytes(data):
+    numbers = array.array('I')
+    numbers.fromstring(data)
+    if sys.byteorder != 'little':
+        numbers.byteswap()
+
+    return numbers
+
+class SearchIndex(object):
+    """
+    A search index, read on demand.
+    """
+    def __init__(self, data):
+        self.data = data
+
+        (magic, self.version, head, self.issue_count, self.doc_count,
+         self.live_count, self.term_count, self.total_length,
+         self.strings_size, self.garbage) = HEADER.unpack_from(data)
+
+        self.head = head.rstrip('\0') or None
+
+        self._blobs_at = HEADER.size + ID_SIZE * self.issue_count
+        self._doc_issues_at = self._blobs_at + BLOB_SIZE * self.doc_count
+        self._lengths_at = self._doc_issues_at + 4 * self.doc_count
+        self._terms_at = self._lengths_at + 4 * self.doc_count
+        self._strings_at = self._terms_at + TERM.size * self.term_count
+        self._postings_at = self._strings_at + self.strings_size
+
+        self._doc_issues = None
+        self._lengths = None
+
+    @property
+    def size(self):
+        """
+        The size of the file, up to its postings.
+        """
+        return self._postings_at
+
+    def issue_id(self, number):
+        start = HEADER.size + ID_SIZE * number
+        return self.data[start:start + ID_SIZE]
+
+    def issue_ids(self):
+        data = self.data[HEADER.size:self._blobs_at]
+        return [data[i:i + ID_SIZE] for i in range(0, len(data), ID_SIZE)]
+
+    @property
+    def doc_issues(self):
+        if self._doc_issues is None:
+            self._doc_issues = _from_bytes(
+                self.data[self._doc_issues_at:self._lengths_at])
+
+        return self._doc_issues
+
+    @property
+    def lengths(self):
+        if self._lengths is None:
+            self._lengths = _from_bytes(
+                self.data[self._lengths_at:self._terms_at])
+
+        return self._lengths
+
+    def find_doc(self, blob):
+        """
+        Return the number of the live document of blob, or None.
+        """
+        data = self.data[self._blobs_at:self._doc_issues_at]
+        name = blob.decode('hex')
+
+        start = data.find(name)
+        while start != -1:
+            if start % BLOB_SIZE == 0 and \
+               self.doc_issues[start // BLOB_SIZE] != NULL:
+                return start // BLOB_SIZE
+
+            start = data.find(name, start + 1)
+
+        return None
+
+    def term_entry(self, number):
+        return TERM.unpack_from(self.data, self._terms_at + TERM.size * number)
+
+    def term(self, number):
+        offset, length = self.term_entry(number)[:2]
+        start = self._strings_at + offset
+        return self.data[start:start + length]
+
+    def find(self, term):
+        """
+        Return the number of the term, a UTF-8 string, or the number it
+        would have, and whether it is in the index.
+        """
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+
+            else:
+                high = middle
+
+        return low, low < self.term_count and self.term(low) == term
+
+    def postings(self, entry):
+        """
+        Return the documents, counts and positions of a term entry.
+        """
+        offset, length, postings, count, positions = entry
+        start = self._postings_at + postings
+
+        docs = _from_bytes(self.data[start:start + 4 * count])
+        start += 4 * count
+        counts = _from_bytes(self.data[start:start + 4 * count])
+        start += 4 * count
+
+        return docs, counts, _from_bytes(self.data[start:start + 4 * positions])
+
+    def term_postings(self, term):
+        number, found = self.find(term.encode('utf8'))
+        if not found:
+            return array.array('I'), array.array('I'), array.array('I')
+
+        return self.postings(self.term_entry(number))
+
+    def matches(self, terms):
+        """
+        Return (document, count) pairs of the documents that have terms,
+        in this order, and the times they appear.
+        """
+        if len(terms) == 1:
+            docs, counts, positions = self.term_postings(terms[0])
+            return zip(docs, counts)
+
+        found = []
+        for term in terms:
+            docs, counts, positions = self.term_postings(term)
+
+            # positions of the term in each document
+            by_doc = {}
+            start = 0
+            for doc, count in zip(docs, counts):
+                by_doc[doc] = (start, count)
+                start += count
+
+            found.append((by_doc, positions))
+
+        common = set(found[0][0])
+        for by_doc, positions in found[1:]:
+            common.intersection_update(by_doc)
+
+        matches = []
+        for doc in common:
+            places = None
+            for shift, (by_doc, positions) in enumerate(found):
+                start, count = by_doc[doc]
+                shifted = set(position - shift for position in
+                              positions[start:start + count])
+
+                if places is None:
+                    places = shifted
+
+                else:
+                    places.intersection_update(shifted)
+
+            if places:
+                matches.append((doc, len(places)))
+
+        return matches
+
+    def search(self, elements):
+        """
+        Return (score, issue id) tuples of the issues having all query
+        elements, best first.
+        """
+        if not elements or not self.live_count:
+            return []
+
+        average = float(self.total_length) / self.live_count
+        doc_issues = self.doc_issues
+        lengths = self.lengths
+
+        scores = None
+        for matches in sorted((self.matches(terms) for terms in elements),
+                              key=len):
+            idf = math.log(1 + (self.live_count - len(matches) + 0.5) /
+                           (len(matches) + 0.5))
+            scale = idf * (K1 + 1)
+
+            # the part of the score depending on the document length
+            norms = {}
+
+            best = {}
+            for doc, count in matches:
+                issue = doc_issues[doc]
+                if scores is not None and issue not in scores:
+                    continue
+
+                length = lengths[doc]
+                norm = norms.get(length)
+                if norm is None:
+                    norm = norms[length] = K1 * (1 - B + B * length / average)
+
+                score = scale * count / (count + norm)
+                if score > best.get(issue, 0):
+                    best[issue] = score
+
+            if scores is None:
+                scores = best
+
+            else:
+                scores = dict((issue, scores[issue] + score)
+                              for issue, score in best.iteritems())
+
+            if not scores:
+                break
+
+        results = [(score, self.issue_id(issue))
+                   for issue, score in scores.iteritems()]
+        results.sort(key=lambda x: (-x[0], x[1]))
+
+        return results
+
+def empty_index():
+    return SearchIndex(HEADER.pack(MAGIC, INDEX_VERSION, '',
+                                   0, 0, 0, 0, 0, 0, 0))
+
+def read_index(path):
+    """
+    Return the search index at path, or None if there is no usable one.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as flp:
+        try:
+            data = mmap.mmap(flp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except (mmap.error, ValueError):
+            # empty file
+            return None
+
+    if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+        return None
+
+    index = SearchIndex(data)
+    if index.version != INDEX_VERSION or len(data) < index.size:
+        return None
+
+    return index
+
+def update(index, head, removed, added):
+    """
+    Return the contents of index, or of an empty index if None, updated
+    to describe head.
+
+    removed are (blob name, text) tuples of the documents to drop and
+    added (blob name, issue id, text) tuples of the new ones.
+    """
+    if index is None:
+        index = empty_index()
+
+    issue_ids = index.issue_ids()
+    issue_numbers = dict((issue_id, number)
+                         for number, issue_id in enumerate(issue_ids))
+
+    blobs = [index.data[index._blobs_at:index._doc_issues_at]]
+    doc_issues = _from_bytes(index.data[index._doc_issues_at:index._lengths_at])
+    lengths = _from_bytes(index.data[index._lengths_at:index._terms_at])
+    live_count = index.live_count
+    total_length = index.total_length
+
+    # term: (removed documents, (document, positions) added)
+    changed = {}
+
+    for blob, text in removed:
+        doc = index.find_doc(blob)
+        if doc is None or doc_issues[doc] == NULL:
+            continue
+
+        doc_issues[doc] = NULL
+        live_count -= 1
+        total_length -= lengths[doc]
+
+        for term in set(tokenize(text)):
+            changed.setdefault(term.encode('utf8'), ([], []))[0].append(doc)
+
+    for blob, issue_id, text in added:
+        if issue_id not in issue_numbers:
+            issue_numbers[issue_id] = len(issue_ids)
+            issue_ids.append(issue_id)
+
+        terms = tokenize(text)
+        doc = len(doc_issues)
+
+        blobs.append(blob.decode('hex'))
+        doc_issues.append(issue_numbers[issue_id])
+        lengths.append(len(terms))
+        live_count += 1
+        total_length += len(terms)
+
+        for term, positions in term_positions(terms).items():
+            changed.setdefault(term.encode('utf8'), ([], []))[1].append(
+                (doc, positions))
+
+    strings = [index.data[index._strings_at:index._postings_at]]
+    strings_size = index.strings_size
+    postings = [index.data[index._postings_at:]]
+    postings_size = len(postings[0])
+    garbage = index.garbage
+
+    # new entries of the changed terms, by position in the old table
+    entries = []
+    for term in sorted(changed):
+        number, found = index.find(term)
+
+        if found:
+            entry = index.term_entry(number)
+            docs, counts, positions = index.postings(entry)
+            garbage += 4 * (2 * entry[3] + entry[4])
+            offset = entry[0]
+
+        else:
+            docs, counts, positions = [array.array('I') for i in range(3)]
+            offset = strings_size
+            strings.append(term)
+            strings_size += len(term)
+
+        # documents only get removed or appended, so postings stay
+        # sorted and are edited as arrays
+        dropped, new = changed[term]
+        for doc in sorted(dropped, reverse=True):
+            i = bisect.bisect_left(docs, doc)
+            if i == len(docs) or docs[i] != doc:
+                continue
+
+            start = sum(counts[:i])
+            del positions[start:start + counts[i]]
+            del docs[i]
+            del counts[i]
+
+        for doc, doc_positions in new:
+            docs.append(doc)
+            counts.append(len(doc_positions))
+            positions.extend(doc_positions)
+
+        entry = None
+        if docs:
+            chunk = _to_bytes(docs) + _to_bytes(counts) + _to_bytes(positions)
+            entry = TERM.pack(offset, len(term), postings_size,
+                              len(docs), len(positions))
+            postings.append(chunk)
+            postings_size += len(chunk)
+
+        entries.append((number, found, entry))
+
+    terms = []
+    term_count = 0
+    last = 0
+    for number, found, entry in entries:
+        terms.append(index.data[index._terms_at + TERM.size * last:
+                                index._terms_at + TERM.size * number])
+        term_count += number - last
+
+        if entry:
+            terms.append(entry)
+            term_count += 1
+
+        last = number + 1 if found else number
+
+    terms.append(index.data[index._terms_at + TERM.size * last:
+                            index._strings_at])
+    term_count += index.term_count - last
+
+    terms = ''.join(terms)
+    postings = ''.join(postings)
+
+    if garbage > len(postings) - garbage:
+        terms, postings = _compact(terms, term_count, postings)
+        garbage = 0
+
+    return ''.join([HEADER.pack(MAGIC, INDEX_VERSION, head or '',
+                                len(issue_ids), len(doc_issues), live_count,
+                                term_count, total_length, strings_size,
+                                garbage),
+                    ''.join(issue_ids),
+                    ''.join(blobs),
+                    _to_bytes(doc_issues),
+                    _to_bytes(lengths),
+                    terms,
+                    ''.join(strings),
+                    postings])
+
+def _compact(terms, term_count, postings):
+    """
+    Return the term table and the postings without unused postings.
+    """
+    new_terms = []
+    new_postings = []
+    size = 0
+
+    for number in range(term_count):
+        offset, length, start, count, positions = \
+            TERM.unpack_from(terms, TERM.size * number)
+
+        end = start + 4 * (2 * count + positions)
+        new_postings.append(postings[start:end])
+        new_terms.append(TERM.pack(offset, length, size, count, positions))
+        size += end - start
+
+    return ''.join(new_terms), ''.join(new_postings)
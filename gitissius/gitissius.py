@@ -9,44 +9,47 @@
 # Distributed bug tracking using git
 #
 
-import optparse
-import os
-import os.path
 import re
-import shutil
 import sys
-import string
-import locale
-import logging
-logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s',
-        level=logging.INFO)
-
-import gitshelve
-import common
-import commands
-import properties
-import database
+
+import completion
 
 VERSION = "0.1.6"
 
-locale.setlocale(locale.LC_ALL)
+def load():
+    """
+    Import the modules that open the repository. Commands answered by
+    the daemon and completions never get here.
+    """
+    global gitshelve, common, sync, server, commands, properties, database
+
+    import locale
+    import logging
+    logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s',
+            level=logging.INFO)
+
+    locale.setlocale(locale.LC_ALL)
+
+    import gitshelve
+    import common
+    import sync
+    import server
+    import commands
+    import properties
+    import database
 
 def usage(available_commands):
     USAGE = "Gitissius v%s\n\n" % VERSION
     USAGE += "Available commands: \n"
 
     for cmd in commands.available_commands:
-        _cmd = commands.command[cmd]
+        module, aliases, description = commands.registry[cmd]
         USAGE += "\t{0:12}: {1} (Aliases: {2})\n".\
-                 format(_cmd.name,
-                        _cmd.help,
-                        ', '.join(_cmd.aliases) or 'None')
+                 format(cmd, description, ', '.join(aliases) or 'None')
 
     return USAGE
 
 def initialize():
-    commands.import_commands()
-
     # check we are inside a git repo
     try:
         common.find_repo_root()
@@ -54,6 +57,14 @@ def initialize():
         print error
         sys.exit(1)
 
+    try:
+        # the usual case, answered without running git
+        common.git_repo.rev_parse('refs/heads/gitissius')
+        return
+
+    except (gitshelve.GitError, ValueError):
+        pass
+
     if len(gitshelve.git('branch').strip()) == 0:
         # user is trying to use gitissius on a repo that has no
         # branch, just exit
@@ -103,10 +114,50 @@ def initialize():
         # open the repo now, since init was done
         common.git_repo = gitshelve.open(branch='gitissius')
 
+        if not remotes:
+            # brand new tracker, start with the sharded layout
+            database.set_layout_version(database.LAYOUT_VERSION)
+            common.git_repo.commit("Using layout %d" % \
+                                   database.LAYOUT_VERSION)
+
+def complete(args):
+    """
+    Print completions for shells. Only when the completion index is
+    out of date is the repository opened, to write it again.
+    """
+    matches = completion.complete(args)
+
+    if matches is None:
+        load()
+
+        if common.git_repo.head:
+            common.issue_manager.update_db()
+            common.issue_manager.save_completion_index(common.git_repo.head)
+
+            if args[:1] == ['committers']:
+                common.get_commiters()
+
+        close()
+
+        matches = completion.complete(args) or []
+
+    if matches:
+        sys.stdout.write('\n'.join(matches) + '\n')
+
 def close():
     common.git_repo.close()
 
 def main():
+    if sys.argv[1:2] == ['complete']:
+        complete(sys.argv[2:])
+        return
+
+    import client
+
+    if client.forward(sys.argv[1:]):
+        return
+
+    load()
     initialize()
 
     try:
@@ -118,22 +169,12 @@ def main():
         sys.exit()
 
     try:
-        if command not in commands.command.keys():
-            raise common.InvalidCommand(command)
-
-        commands.command[command](sys.argv[2:])
+        commands.execute(command, sys.argv[2:])
 
     except common.InvalidCommand, e :
         print " >", "Invalid command '%s'" % e.command
         print usage(commands.available_commands)
 
-    except common.IssueIDConflict, error:
-        print " >", "Error: Conflicting IDs"
-        print error
-
-    except common.IssueIDNotFound, error:
-        print " >", "Error: ID not found", error
-
     except KeyboardInterrupt, error:
         print "\n >", "Aborted..."
 
@@ -33,6 +33,8 @@
 import re
 import os
 
+import objectstore
+
 try:
     from cStringIO import StringIO
 except:
@@ -45,6 +47,9 @@ from string import split, join
 
 verbose = False
 
+# Read refs and objects in-process when possible, instead of running git.
+native  = True
+
 ######################################################################
 
 # Utility function for calling out to Git (this script does not try to
@@ -134,6 +139,95 @@ def git(cmd, *args, **kwargs):
             return out[:-1]
 
 
+class catfile:
+    """Abstracts a long-lived `git cat-file --batch' process.  Objects are
+    requested by writing their names to its stdin and read back from its
+    stdout as length-prefixed responses, so reading many objects costs a
+    single fork instead of one per object."""
+
+    # Number of requests written before their responses are read back.
+    # Each request is a 41 byte line, so a batch always fits in the pipe
+    # buffer and writing can never block while git waits for us to read.
+    batch_size = 256
+
+    def __init__(self, repository = None):
+        self.repository = repository
+        self.proc       = None
+
+    def __repr__(self):
+        return '<gitshelve.catfile %s>' % (self.proc and self.proc.pid)
+
+    def start(self):
+        environ = None
+        if self.repository:
+            environ = os.environ.copy()
+            environ['GIT_DIR'] = self.repository
+
+        if verbose:
+            print "Command: git cat-file --batch"
+
+        self.proc = Popen(('git', 'cat-file', '--batch'), env = environ,
+                          stdin  = PIPE,
+                          stdout = PIPE,
+                          stderr = PIPE)
+
+    def read_object(self, name):
+        header = self.proc.stdout.readline()
+        if not header:
+            self.close()
+            raise GitError('cat-file', ['--batch'], {}, 'unexpected EOF')
+
+        fields = split(header[:-1], ' ')
+        if len(fields) != 3:
+            # "<name> missing" or "<name> ambiguous"
+            raise GitError('cat-file', ['--batch', name], {}, header[:-1])
+
+        size = int(fields[2])
+        data = self.proc.stdout.read(size)
+        self.proc.stdout.read(1)        # trailing LF
+        return (fields[1], data)
+
+    def get_objects(self, names):
+        """Return a list of (type, data) tuples, one for each name."""
+        if self.proc is None or self.proc.poll() is not None:
+            self.start()
+
+        objects = []
+        for start in range(0, len(names), self.batch_size):
+            batch = names[start:start + self.batch_size]
+            self.proc.stdin.write(join(batch, '\n') + '\n')
+            self.proc.stdin.flush()
+
+            # read every response even if one fails, so the next batch
+            # does not pick up stale output
+            error = None
+            for name in batch:
+                try:
+                    objects.append(self.read_object(name))
+                except GitError, error:
+                    if self.proc is None:
+                        raise
+            if error:
+                raise error
+
+        return objects
+
+    def get_blobs(self, names):
+        blobs = []
+        for name, (kind, data) in zip(names, self.get_objects(names)):
+            if kind != 'blob':
+                raise GitError('cat-file', ['--batch', name], {},
+                               'expected blob, found %s' % kind)
+            blobs.append(data)
+        return blobs
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+
 class gitbook:
     """Abstracts a reference to a data file within a Git repository.  It also
     maintains knowledge of whether the object has been modified or not."""
@@ -178,6 +272,58 @@ class gitbook:
         self.dirty = False
 
 
+def summarize(comments):
+    """Return the comment of a commit grouping the commits comments: the
+    comment itself for a single one, otherwise a summary line followed by
+    a blank line and one line per comment."""
+    if len(comments) == 1:
+        return comments[0]
+
+    return "Applied %d operations\n\n%s" % (len(comments),
+                                            join(comments, '\n'))
+
+
+class transaction:
+    """Groups all changes made to a shelf into a single commit.  Calls to
+    commit() inside the block only record their comment; the commit is
+    made when the outermost block exits, and an exception discards every
+    change made since it was entered.
+
+      with shelf.transaction("Nightly cleanup"):
+          shelf['a'] = 'foo'
+          shelf.commit("Changed a")     # deferred
+          shelf['b'] = 'bar'
+    """
+    def __init__(self, shelf, comment = None):
+        self.shelf   = shelf
+        self.comment = comment
+
+    def __enter__(self):
+        if self.shelf.transaction_depth == 0:
+            self.shelf.pending_comments = []
+        self.shelf.transaction_depth += 1
+        return self.shelf
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shelf = self.shelf
+        shelf.transaction_depth -= 1
+
+        if exc_type is not None:
+            if shelf.transaction_depth == 0:
+                # forget everything written since the transaction began
+                shelf.read_repository()
+            return False
+
+        if shelf.transaction_depth == 0:
+            comment = self.comment
+            if comment is None and shelf.pending_comments:
+                comment = summarize(shelf.pending_comments)
+            shelf.pending_comments = []
+            shelf.commit(comment)
+
+        return False
+
+
 class gitshelve(dict):
     """This class implements a Python "shelf" using a branch within a Git
     repository.  There is no "writeback" argument, meaning changes are only
@@ -188,9 +334,13 @@ class gitshelve(dict):
     other Git users, nor does it support merging)."""
     ls_tree_pat = re.compile('((\d{6}) (tree|blob)) ([0-9a-f]{40})\t(start|(.+))$')
 
-    head    = None
     dirty   = False
-    objects = None
+    loaded  = False
+    reader  = None
+    store   = None
+
+    transaction_depth = 0
+    pending_comments  = None
 
     def __init__(self, branch = 'master', repository = None,
                  keep_history = True, book_type = gitbook):
@@ -202,31 +352,92 @@ class gitshelve(dict):
         dict.__init__(self)
 
     def init_data(self):
-        self.head    = None
-        self.dirty   = False
-        self.objects = {}
+        self._head    = None
+        self.dirty    = False
+        self._objects = {}
+
+    # A shelf opened lazily reads the repository when the head or the
+    # objects are first needed.
+    def get_head(self):
+        if not self.loaded:
+            self.read_repository()
+        return self._head
+
+    def set_head(self, head):
+        self._head = head
+
+    head = property(get_head, set_head)
+
+    def get_objects(self):
+        if not self.loaded:
+            self.read_repository()
+        return self._objects
+
+    def set_objects(self, objects):
+        self._objects = objects
+
+    def del_objects(self):
+        self._objects = None
+        self.loaded   = False
+
+    objects = property(get_objects, set_objects, del_objects)
 
     def git(self, *args, **kwargs):
         if self.repository:
             kwargs['repository'] = self.repository
         return apply(git, args, kwargs)
 
-    def current_head(self):
-        x = self.git('rev-parse', self.branch)
+    def get_store(self):
+        """Return the native object store, or None if the repository
+        cannot be read without git."""
+        if self.store is None:
+            self.store = False
+            if native:
+                try:
+                    self.store = objectstore.ObjectStore(self.repository)
+                except (objectstore.UnsupportedObject, IOError, OSError):
+                    pass
+        return self.store or None
+
+    def rev_parse(self, name):
+        store = self.get_store()
+        if store:
+            try:
+                return store.resolve_ref(name)
+            except objectstore.UnsupportedObject:
+                pass
+
+        x = self.git('rev-parse', name)
         if len(x) != 40:
             raise ValueError("rev-parse went insane: %s"%x)
         return x
 
-    def update_head(self, new_head):
+    def current_head(self):
+        return self.rev_parse(self.branch)
+
+    def update_head(self, new_head, message='gitissius: commit'):
+        store = self.get_store()
+        if store:
+            try:
+                store.update_ref('refs/heads/%s' % self.branch, new_head,
+                                 self.head, self.committer(new_head),
+                                 message)
+                self.head = new_head
+                return
+            except (objectstore.UnsupportedObject, IOError, OSError):
+                pass
+
         if self.head:
-            self.git('update-ref', 'refs/heads/%s' % self.branch, new_head,
-                     self.head)
+            self.git('update-ref', '-m', message,
+                     'refs/heads/%s' % self.branch, new_head, self.head)
         else:
-            self.git('update-ref', 'refs/heads/%s' % self.branch, new_head)
+            self.git('update-ref', '-m', message,
+                     'refs/heads/%s' % self.branch, new_head)
         self.head = new_head
 
     def read_repository(self):
         self.init_data()
+        self.loaded = True
         try:
             self.head = self.current_head()
         except:
@@ -235,18 +446,8 @@ class gitshelve(dict):
         if not self.head:
             return
 
-        ls_tree = split(self.git('ls-tree', '--full-tree', '-r', '-t', '-z', self.head),
-                        '\0')
-        for line in ls_tree:
-            if not line:
-                continue
-            match = self.ls_tree_pat.match(line)
-            assert match
-
-            treep = match.group(1) == "040000 tree"
-            perm  = match.group(2)
-            name  = match.group(4)
-            path  = match.group(5)
+        for perm, kind, name, path in self.ls_tree(self.head):
+            treep = kind == 'tree'
 
             parts = split(path, os.sep)
             d     = self.objects
@@ -268,25 +469,153 @@ class gitshelve(dict):
                     raise GitError('read_repository', [], {},
                                    'Invalid mode for %s : 100644 required, %s found' %(path, perm))
 
+    def ls_tree(self, head):
+        """Return a (perm, kind, name, path) tuple for every tree and blob
+        below head, parents first."""
+        store = self.get_store()
+        if store:
+            try:
+                return list(store.walk_tree(store.commit_tree(head)))
+            except objectstore.UnsupportedObject:
+                pass
+
+        entries = []
+        ls_tree = split(self.git('ls-tree', '--full-tree', '-r', '-t', '-z', head),
+                        '\0')
+        for line in ls_tree:
+            if not line:
+                continue
+            match = self.ls_tree_pat.match(line)
+            assert match
+
+            entries.append((match.group(2), match.group(3), match.group(4),
+                            match.group(5)))
+        return entries
+
+    def diff_trees(self, old_head, new_head):
+        """Return a (path, old_name, new_name) tuple for every blob that
+        differs between the trees of two commits.  Blobs that were added
+        or removed have None as their old or new name."""
+        store = self.get_store()
+        if store:
+            try:
+                return list(store.diff_tree(store.commit_tree(old_head),
+                                            store.commit_tree(new_head)))
+            except objectstore.UnsupportedObject:
+                pass
+
+        changes = []
+        diff = split(self.git('diff-tree', '-r', '-z', '--no-renames',
+                              old_head, new_head), '\0')
+        null = '0' * 40
+        for meta, path in zip(diff[0::2], diff[1::2]):
+            fields = split(meta, ' ')
+            if fields[0] == ':160000' or fields[1] == '160000':
+                continue
+            old_name = fields[2] != null and fields[2] or None
+            new_name = fields[3] != null and fields[3] or None
+            changes.append((path, old_name, new_name))
+        return changes
+
     def open(cls, branch = 'master', repository = None,
-             keep_history = True, book_type = gitbook):
+             keep_history = True, book_type = gitbook, lazy = False):
         shelf = gitshelve(branch, repository, keep_history, book_type)
-        shelf.read_repository()
+        if not lazy:
+            shelf.read_repository()
         return shelf
 
     open = classmethod(open)
 
+    def get_reader(self):
+        if self.reader is None:
+            self.reader = catfile(self.repository)
+        return self.reader
+
     def get_blob(self, name):
-        return self.git('cat-file', 'blob', name, keep_newline = True)
+        return self.get_blobs([name])[0]
+
+    def get_blobs(self, names):
+        """Read many blobs, natively when possible and otherwise through a
+        single `git cat-file --batch'."""
+        names = list(names)
+        blobs = [None] * len(names)
+
+        missing = []
+        store = self.get_store()
+        for i in range(len(names)):
+            if store:
+                try:
+                    blobs[i] = store.read_typed(names[i], 'blob')
+                    continue
+                except objectstore.UnsupportedObject:
+                    pass
+            missing.append(i)
+
+        if missing:
+            fetched = self.get_reader().get_blobs([names[i] for i in missing])
+            for i, blob in zip(missing, fetched):
+                blobs[i] = blob
+
+        return blobs
+
+    def load_books(self, books):
+        """Fetch the data of all unloaded books in one go, so that calling
+        get_data() on them afterwards does not touch git again."""
+        pending = [book for book in books if book.data is None]
+        if not pending:
+            return
+
+        blobs = self.get_blobs([book.name for book in pending])
+        for book, blob in zip(pending, blobs):
+            book.data = book.deserialize_data(blob)
+
+    def committer(self, commit):
+        """Return the committer line of commit, for the reflog."""
+        store = self.get_store()
+        if not store:
+            return None
+        try:
+            data = store.read_typed(commit, 'commit')
+        except objectstore.UnsupportedObject:
+            return None
+
+        for line in split(data, '\n'):
+            if not line:
+                break
+            if line.startswith('committer '):
+                return line[len('committer '):]
+        return None
 
     def hash_blob(self, data):
-        return self.git('hash-object', '--stdin', input = data)
+        return objectstore.hash_object('blob', data)
 
     def make_blob(self, data):
+        store = self.get_store()
+        if store:
+            try:
+                return store.write_object('blob', data)
+            except (objectstore.UnsupportedObject, IOError, OSError):
+                pass
+
         return self.git('hash-object', '-w', '--stdin', input = data)
 
-    def make_tree(self, objects, comment_accumulator = None):
+    def write_tree(self, entries):
+        """Store a tree from a list of (mode, name, sha) entries."""
+        store = self.get_store()
+        if store:
+            try:
+                return store.write_tree(entries)
+            except (objectstore.UnsupportedObject, IOError, OSError):
+                pass
+
         buf = StringIO()
+        for mode, name, sha in entries:
+            kind = mode == '040000' and 'tree' or 'blob'
+            buf.write("%s %s %s\t%s\0" % (mode, kind, sha, name))
+        return self.git('mktree', '-z', input = buf.getvalue())
+
+    def make_tree(self, objects, comment_accumulator = None):
+        entries = []
 
         root = None
         if objects.has_key('__root__'):
@@ -310,7 +639,7 @@ class gitshelve(dict):
                     book.dirty = False
                     root = None
 
-                buf.write("100644 blob %s\t%s\0" % (book.name, path))
+                entries.append(('100644', path, book.name))
 
             else:
                 tree_root = None
@@ -321,27 +650,42 @@ class gitshelve(dict):
                 if tree_name != tree_root:
                     root = None
 
-                buf.write("040000 tree %s\t%s\0" % (tree_name, path))
+                entries.append(('040000', path, tree_name))
 
         if root is None:
-            name = self.git('mktree', '-z', input = buf.getvalue())
+            name = self.write_tree(entries)
             objects['__root__'] = name
             return name
         else:
             return root
 
-    def make_commit(self, tree_name, comment):
+    def make_commit(self, tree_name, comment, parents = None):
         if not comment: comment = ""
-        if self.head and self.keep_history:
-            name = self.git('commit-tree', tree_name, '-p', self.head,
-                            input = comment)
-        else:
-            name = self.git('commit-tree', tree_name, input = comment)
+        if parents is None:
+            parents = []
+            if self.head and self.keep_history:
+                parents = [self.head]
+
+        args = []
+        for parent in parents:
+            args += ['-p', parent]
+        name = self.git('commit-tree', tree_name, *args, **{'input': comment})
 
         self.update_head(name)
         return name
 
-    def commit(self, comment = None):
+    def transaction(self, comment = None):
+        return transaction(self, comment)
+
+    def commit(self, comment = None, parents = None):
+        """Commit all changes.  parents defaults to the current head; merges
+        pass all of the commits being merged."""
+        if self.transaction_depth:
+            # deferred until the outermost transaction exits
+            if comment:
+                self.pending_comments.append(comment)
+            return None
+
         if not self.dirty:
             return self.head
 
@@ -354,7 +698,7 @@ class gitshelve(dict):
         tree = self.make_tree(self.objects, accumulator)
         if accumulator:
             comment = accumulator.getvalue()
-        name = self.make_commit(tree, comment)
+        name = self.make_commit(tree, comment, parents)
 
         self.dirty = False
         return name
@@ -369,6 +713,12 @@ class gitshelve(dict):
     def close(self):
         if self.dirty:
             self.sync()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if self.store:
+            self.store.close()
+        self.store = None
         del self.objects        # free it up right away
 
     def dump_objects(self, fd, indent = 0, objects = None):
@@ -458,22 +808,20 @@ class gitshelve(dict):
         self.dirty = True
 
     def prune_tree(self, objects, paths):
+        """Delete the object at paths, removing trees left empty.  Only the
+        trees along paths are invalidated, so their siblings keep their
+        names and are not written again.  Returns the number of entries
+        left in objects."""
         if len(paths) > 1:
-            left = self.prune_tree(objects[paths[0]], paths[1:])
-            # do not delete if there's something left besides __root__ and
-            # paths[0]
-            has_root = '__root__' in objects[paths[0]]
-            if left > 0 or len(objects[paths[0]]) > int(has_root):
-                if '__root__' in objects:
-                    del objects['__root__']
-                for tree in objects:
-                    if '__root__' in objects[tree]:
-                        del objects[tree]['__root__']
-                return 3
-        l = len(objects[paths[0]])
-        del objects[paths[0]]
+            if self.prune_tree(objects[paths[0]], paths[1:]) == 0:
+                del objects[paths[0]]
+        else:
+            del objects[paths[0]]
+
+        if '__root__' in objects:
+            del objects['__root__']
         self.dirty = True
-        return l-1
+        return len(objects)
 
     def __delitem__(self, path):
         try:
@@ -482,9 +830,58 @@ class gitshelve(dict):
             raise KeyError(path)
 
     def __contains__(self, path):
-        d = self.get_tree(path)
+        try:
+            d = self.get_tree(path)
+        except KeyError:
+            return False
         return len(d.keys()) == 1 and d.has_key('__book__')
 
+    def has_tree(self, path):
+        try:
+            d = self.get_tree(path)
+        except KeyError:
+            return False
+        return not d.has_key('__book__')
+
+    def set_blob(self, path, name):
+        """Point path to the existing blob name, without reading it."""
+        parts = split(path, os.sep)
+        d     = self.objects
+        for part in parts:
+            if '__root__' in d:
+                del d['__root__']
+            if not d.has_key(part):
+                d[part] = {}
+            d = d[part]
+
+        d.clear()
+        d['__book__'] = self.book_type(self, path, name)
+        self.dirty = True
+
+    def move(self, src, dst):
+        """Move the blob or tree at src to dst.  The moved object keeps its
+        name, so only the trees along both paths are written again."""
+        try:
+            obj = self.get_tree(src)
+        except KeyError:
+            raise KeyError(src)
+
+        self.prune_tree(self.objects, split(src, os.sep))
+
+        parts = split(dst, os.sep)
+        d     = self.objects
+        for part in parts[:-1]:
+            if '__root__' in d:
+                del d['__root__']
+            if not d.has_key(part):
+                d[part] = {}
+            d = d[part]
+        if '__root__' in d:
+            del d['__root__']
+
+        d[parts[-1]] = obj
+        self.dirty = True
+
     def walker(self, kind, objects, path = ''):
         for item in objects.items():
             if item[0] == '__root__': continue
@@ -532,6 +929,8 @@ class gitshelve(dict):
         self.sync()                  # synchronize before persisting
         odict = self.__dict__.copy() # copy the dict since we change it
         del odict['dirty']           # remove dirty flag
+        odict.pop('reader', None)    # processes and mmaps cannot be
+        odict.pop('store', None)     # pickled
         return odict
 
     def __setstate__(self, ndict):
@@ -545,7 +944,7 @@ class gitshelve(dict):
 
 
 def open(branch = 'master', repository = None, keep_history = True,
-         book_type = gitbook):
-    return gitshelve.open(branch, repository, keep_history, book_type)
+         book_type = gitbook, lazy = False):
+    return gitshelve.open(branch, repository, keep_history, book_type, lazy)
 
 # gitshelve.py ends here
@@ -0,0 +1,350 @@
+"""
+Binary index of the issues, kept in .git/gitissius.index.
+
+It holds the values of all issue properties and the comment dates
+listings need, so that commands never read issue blobs that did not
+change. The file is mapped in memory and a command only touches the
+columns it looks at: listing issues never reads their descriptions.
+
+All numbers are little endian unsigned 32 bit integers. The file is:
+
+  header        magic, format version, the gitissius head it describes,
+                a hash of the schema and the number of columns, issues,
+                comments, strings, postings, posting rows and orders
+  columns       one per issue property, in schema order, with one entry
+                per issue, issues sorted by id. Then the length of the
+                shortest unique prefix of each id.
+  comments      three columns: issue id, comment id and creation date
+                of every comment, sorted
+  postings      for the indexed columns, one (column, string number,
+                first row, row count) entry per value, and the rows of
+                the issues with each value, in the order of the entries
+  orders        for the ordered columns, the column followed by the rows
+                of all issues sorted by its values, ties by id
+  string table  offsets of the strings in the data, plus its end, and
+                the UTF-8 data
+
+Entries in columns are string numbers. NULL stands for None and
+numbers flagged with JSON are strings holding JSON encoded values
+other than strings.
+"""
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import hashlib
+import datetime
+
+INDEX_NAME = 'gitissius.index'
+INDEX_VERSION = 3
+MAGIC = 'GISINDEX'
+
+# magic, version, head, schema hash, columns, issues, comments, strings,
+# postings, posting rows, orders
+HEADER = struct.Struct('<8sI40s40sIIIIIII')
+
+NULL = 0xffffffff
+JSON = 0x80000000
+
+def index_path(git_dir):
+    return os.path.join(git_dir, INDEX_NAME)
+
+def schema_hash(names):
+    """
+    Return the hash of the property names the columns hold.
+    """
+    return hashlib.sha1(' '.join(names)).hexdigest()
+
+def _to_bytes(numbers):
+    numbers = array.array('I', numbers)
+    if sys.byteorder != 'little':
+        numbers.byteswap()
+
+    return numbers.tostring()
+
+def _from_bytes(data):
+    numbers = array.array('I')
+    numbers.fromstring(data)
+    if sys.byteorder != 'little':
+        numbers.byteswap()
+
+    return numbers
+
+class StringTable(object):
+    """
+    Strings of an index being written, each stored once.
+    """
+    def __init__(self):
+        self.numbers = {}
+        self.offsets = [0]
+        self.data = []
+
+    def add(self, value):
+        """
+        Return the string number of value.
+        """
+        if value is None:
+            return NULL
+
+        flag = 0
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+
+        if isinstance(value, unicode):
+            value = value.encode('utf8')
+
+        elif not isinstance(value, str):
+            value = json.dumps(value, sort_keys=True)
+            flag = JSON
+
+        try:
+            return self.numbers[(flag, value)]
+
+        except KeyError:
+            number = len(self.data) | flag
+            self.numbers[(flag, value)] = number
+            self.data.append(value)
+            self.offsets.append(self.offsets[-1] + len(value))
+            return number
+
+def format_index(head, names, records, prefix_lengths, comments, indexed=(),
+                 ordered=()):
+    """
+    Return the contents of an index.
+
+    records are the values of the issues in the order of names, sorted
+    by id, comments (issue id, comment id, creation date) tuples,
+    indexed the positions of the columns to keep postings for and
+    ordered those to keep the issues sorted by.
+    """
+    strings = StringTable()
+
+    columns = [[] for name in names]
+    for values in records:
+        for column, value in zip(columns, values):
+            column.append(strings.add(value))
+
+    comment_columns = [[], [], []]
+    for comment in sorted(comments):
+        for column, value in zip(comment_columns, comment):
+            column.append(strings.add(value))
+
+    postings = []
+    rows = []
+    for position in indexed:
+        values = {}
+        for row, number in enumerate(columns[position]):
+            values.setdefault(number, []).append(row)
+
+        for number in sorted(values):
+            postings.extend([position, number, len(rows), len(values[number])])
+            rows.extend(values[number])
+
+    orders = []
+    for position in ordered:
+        column = [values[position] for values in records]
+        orders.append(position)
+        orders.extend(sorted(range(len(records)), key=column.__getitem__))
+
+    parts = [HEADER.pack(MAGIC, INDEX_VERSION, head or '', schema_hash(names),
+                         len(names), len(records), len(comments),
+                         len(strings.data), len(postings) // 4, len(rows),
+                         len(ordered))]
+
+    for column in columns + [prefix_lengths] + comment_columns:
+        parts.append(_to_bytes(column))
+
+    parts.append(_to_bytes(postings))
+    parts.append(_to_bytes(rows))
+    parts.append(_to_bytes(orders))
+
+    parts.append(_to_bytes(strings.offsets))
+    parts.extend(strings.data)
+
+    return ''.join(parts)
+
+class Index(object):
+    """
+    An index file, read on demand.
+    """
+    def __init__(self, data):
+        self.data = data
+
+        (magic, self.version, head, self.schema, self.columns,
+         self.count, self.comment_count, self.string_count,
+         self.posting_count, self.posting_row_count, self.order_count) = \
+         HEADER.unpack_from(data)
+
+        self.head = head.rstrip('\0') or None
+
+        self._columns = {}
+        self._strings = {}
+        self._string_offsets = None
+        self._postings = None
+        self._orders = None
+
+        # columns, prefix lengths and the three comment columns
+        self._postings_at = HEADER.size + 4 * (
+            self.columns * self.count + self.count + 3 * self.comment_count)
+        self._rows_at = self._postings_at + 16 * self.posting_count
+        self._orders_at = self._rows_at + 4 * self.posting_row_count
+        self._offsets_at = self._orders_at + \
+            4 * self.order_count * (self.count + 1)
+        self._data_at = self._offsets_at + 4 * (self.string_count + 1)
+
+    def _numbers(self, offset, count):
+        return _from_bytes(self.data[offset:offset + 4 * count])
+
+    def column(self, position):
+        """
+        Return the string numbers of column position, or the prefix
+        lengths for position columns.
+        """
+        if position not in self._columns:
+            self._columns[position] = self._numbers(
+                HEADER.size + 4 * position * self.count, self.count)
+
+        return self._columns[position]
+
+    def text(self, number):
+        """
+        Return string number as stored: UTF-8, JSON for values other
+        than strings and empty for None.
+        """
+        if number == NULL:
+            return ''
+
+        if self._string_offsets is None:
+            self._string_offsets = self._numbers(self._offsets_at,
+                                                 self.string_count + 1)
+
+        start = self._data_at + self._string_offsets[number & ~JSON]
+        end = self._data_at + self._string_offsets[(number & ~JSON) + 1]
+        return self.data[start:end]
+
+    def string(self, number):
+        if number == NULL:
+            return None
+
+        if number not in self._strings:
+            value = self.text(number).decode('utf8')
+
+            if number & JSON:
+                value = json.loads(value)
+
+            self._strings[number] = value
+
+        return self._strings[number]
+
+    def value(self, position, row):
+        return self.string(self.column(position)[row])
+
+    def values(self, position):
+        """
+        Return all values of column position.
+        """
+        return [self.string(number) for number in self.column(position)]
+
+    @property
+    def prefix_lengths(self):
+        return self.column(self.columns)
+
+    def comments(self):
+        """
+        Return the (issue id, comment id, creation date) tuples of all
+        comments.
+        """
+        offset = HEADER.size + 4 * (self.columns + 1) * self.count
+        columns = [self._numbers(offset + 4 * i * self.comment_count,
+                                 self.comment_count)
+                   for i in range(3)]
+
+        return [tuple(self.string(number) for number in numbers)
+                for numbers in zip(*columns)]
+
+    def postings(self, position):
+        """
+        Return the (string number, first row, row count) entries of the
+        values of column position, or None if it is not indexed.
+        """
+        if self._postings is None:
+            self._postings = {}
+            entries = self._numbers(self._postings_at, 4 * self.posting_count)
+            for i in range(0, len(entries), 4):
+                self._postings.setdefault(entries[i], []).append(
+                    tuple(entries[i + 1:i + 4]))
+
+        return self._postings.get(position)
+
+    def rows(self, start, count):
+        """
+        Return count posting rows, from the row start.
+        """
+        return self._numbers(self._rows_at + 4 * start, count)
+
+    def order(self, position):
+        """
+        Return the rows of all issues sorted by the values of column
+        position, or None if the index does not keep them.
+        """
+        if self._orders is None:
+            self._orders = {}
+            for i in range(self.order_count):
+                offset = self._orders_at + 4 * i * (self.count + 1)
+                self._orders[self._numbers(offset, 1)[0]] = offset + 4
+
+        if position not in self._orders:
+            return None
+
+        return self._numbers(self._orders[position], self.count)
+
+    def row(self, row):
+        return Row(self, row)
+
+class Row(object):
+    """
+    The values of an issue, read from the index when asked for.
+    """
+    __slots__ = ('index', 'row')
+
+    def __init__(self, index, row):
+        self.index = index
+        self.row = row
+
+    def __len__(self):
+        return self.index.columns
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.index.columns:
+            raise IndexError(position)
+
+        return self.index.value(position, self.row)
+
+def read_index(path, names):
+    """
+    Return the index at path, or None if there is no index usable
+    with the property names.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as flp:
+        try:
+            data = mmap.mmap(flp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except (mmap.error, ValueError):
+            # empty file
+            return None
+
+    if len(data) < HEADER.size:
+        return None
+
+    index = Index(data)
+    if data[:len(MAGIC)] != MAGIC or index.version != INDEX_VERSION or \
+       index.schema != schema_hash(names) or \
+       len(data) < index._data_at:
+        return None
+
+    return index
@@ -0,0 +1,685 @@
+"""
+Access to a git object database without forking git.
+
+Resolves refs (loose and packed), reads loose objects and pack files
+(index version 2, with OFS and REF deltas), writes loose objects and
+updates branch refs. Anything it does not understand raises
+UnsupportedObject, so that callers can fall back to running git.
+"""
+import os
+import re
+import mmap
+import zlib
+import struct
+import hashlib
+import binascii
+
+SHA_PAT = re.compile('^[0-9a-f]{40}$')
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {OBJ_COMMIT: 'commit',
+              OBJ_TREE: 'tree',
+              OBJ_BLOB: 'blob',
+              OBJ_TAG: 'tag',
+              }
+
+
+def hash_object(kind, data):
+    """
+    Return the sha of an object the way `git hash-object' does.
+    """
+    return hashlib.sha1('%s %d\0%s' % (kind, len(data), data)).hexdigest()
+
+
+def serialize_tree(entries):
+    """
+    Return the binary representation of a tree, given a list of
+    (mode, name, sha) entries in any order.
+    """
+    # git compares tree names as if they had a trailing slash
+    def sort_key(entry):
+        if entry[0] == '040000':
+            return entry[1] + '/'
+        return entry[1]
+
+    out = []
+    for mode, name, sha in sorted(entries, key=sort_key):
+        out.append('%s %s\0%s' % (mode.lstrip('0'), name,
+                                  binascii.unhexlify(sha)))
+
+    return ''.join(out)
+
+
+class UnsupportedObject(Exception):
+    """
+    Raised when something cannot be read natively. Callers are
+    expected to retry using git itself.
+    """
+    pass
+
+
+def find_git_dir(repository=None):
+    """
+    Return the git directory for repository, $GIT_DIR or the
+    repository containing the current directory.
+    """
+    if repository:
+        return repository
+
+    if os.environ.get('GIT_DIR'):
+        return os.environ['GIT_DIR']
+
+    cwd = os.getcwd()
+    while True:
+        path = os.path.join(cwd, '.git')
+
+        if os.path.isdir(path):
+            return path
+
+        if os.path.isfile(path):
+            # worktrees and submodules use a "gitdir: <path>" file
+            with open(path) as flp:
+                line = flp.readline().strip()
+
+            if not line.startswith('gitdir:'):
+                raise UnsupportedObject(path)
+
+            return os.path.join(cwd, line[len('gitdir:'):].strip())
+
+        cwd, extra = os.path.split(cwd)
+        if not extra:
+            raise UnsupportedObject("Unable to find a git repository.")
+
+
+def apply_delta(base, delta):
+    """
+    Apply a git delta to base and return the result.
+    """
+    def varint(pos):
+        value = shift = 0
+        while True:
+            byte = ord(delta[pos])
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    src_size, pos = varint(0)
+    dst_size, pos = varint(pos)
+
+    if src_size != len(base):
+        raise UnsupportedObject("delta base size mismatch")
+
+    out = []
+    end = len(delta)
+    while pos < end:
+        op = ord(delta[pos])
+        pos += 1
+
+        if op & 0x80:
+            # copy from base
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= ord(delta[pos]) << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= ord(delta[pos]) << (8 * i)
+                    pos += 1
+            if size == 0:
+                size = 0x10000
+            out.append(base[offset:offset + size])
+
+        elif op:
+            # insert literal data
+            out.append(delta[pos:pos + op])
+            pos += op
+
+        else:
+            raise UnsupportedObject("invalid delta opcode")
+
+    result = ''.join(out)
+    if len(result) != dst_size:
+        raise UnsupportedObject("delta result size mismatch")
+
+    return result
+
+
+class PackFile(object):
+    """
+    A pack file and its version 2 index, both mmap'ed.
+    """
+    # resolved delta bases kept around; trees and blobs of the same
+    # path tend to form long delta chains
+    cache_size = 256
+
+    def __init__(self, idx_path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[:-len('.idx')] + '.pack'
+        self._cache = {}
+
+        with open(self.idx_path, 'rb') as flp:
+            self.idx = mmap.mmap(flp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.idx[:8] != '\377tOc\x00\x00\x00\x02':
+            raise UnsupportedObject("%s: unsupported index version" %
+                                    self.idx_path)
+
+        self.fanout = struct.unpack_from('>256I', self.idx, 8)
+        self.count = self.fanout[255]
+
+        self._sha_offset = 8 + 256 * 4
+        self._crc_offset = self._sha_offset + self.count * 20
+        self._ofs_offset = self._crc_offset + self.count * 4
+        self._large_offset = self._ofs_offset + self.count * 4
+
+        with open(self.pack_path, 'rb') as flp:
+            self.pack = mmap.mmap(flp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.pack[:4] != 'PACK':
+            raise UnsupportedObject("%s: not a pack file" % self.pack_path)
+
+    def close(self):
+        self.idx.close()
+        self.pack.close()
+
+    def find(self, binsha):
+        """
+        Return the pack offset of binsha or None, using the fanout
+        table to narrow down a binary search of the sorted sha list.
+        """
+        first = ord(binsha[0])
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+
+        idx = self.idx
+        base = self._sha_offset
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = base + mid * 20
+            current = idx[pos:pos + 20]
+
+            if current < binsha:
+                lo = mid + 1
+
+            elif current > binsha:
+                hi = mid
+
+            else:
+                return self._offset(mid)
+
+        return None
+
+    def _offset(self, index):
+        offset = struct.unpack_from('>I', self.idx,
+                                    self._ofs_offset + index * 4)[0]
+        if offset & 0x80000000:
+            offset = struct.unpack_from(
+                '>Q', self.idx,
+                self._large_offset + (offset & 0x7fffffff) * 8)[0]
+
+        return offset
+
+    def _inflate(self, pos, size):
+        decompressor = zlib.decompressobj()
+        out = []
+        length = 0
+        while length < size or not out:
+            chunk = self.pack[pos:pos + 65536]
+            if not chunk:
+                raise UnsupportedObject("truncated pack")
+            pos += len(chunk)
+            data = decompressor.decompress(chunk)
+            out.append(data)
+            length += len(data)
+            if decompressor.unused_data:
+                break
+
+        return ''.join(out)
+
+    def read_at(self, offset, store):
+        """
+        Return (type, data) of the object stored at offset.
+        """
+        if offset in self._cache:
+            return self._cache[offset]
+
+        pack = self.pack
+        pos = offset
+        byte = ord(pack[pos])
+        pos += 1
+        kind = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = ord(pack[pos])
+            pos += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+
+        if kind == OBJ_OFS_DELTA:
+            byte = ord(pack[pos])
+            pos += 1
+            base_offset = byte & 0x7f
+            while byte & 0x80:
+                byte = ord(pack[pos])
+                pos += 1
+                base_offset = ((base_offset + 1) << 7) | (byte & 0x7f)
+
+            base_kind, base = self.read_at(offset - base_offset, store)
+            result = (base_kind, apply_delta(base, self._inflate(pos, size)))
+
+        elif kind == OBJ_REF_DELTA:
+            base_sha = binascii.hexlify(pack[pos:pos + 20])
+            pos += 20
+            base_kind, base = store.read_object(base_sha)
+            result = (base_kind, apply_delta(base, self._inflate(pos, size)))
+
+        elif kind in TYPE_NAMES:
+            result = (TYPE_NAMES[kind], self._inflate(pos, size))
+
+        else:
+            raise UnsupportedObject("unknown pack object type %d" % kind)
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[offset] = result
+
+        return result
+
+
+class ObjectStore(object):
+    """
+    Reader for the refs and objects of a single repository.
+    """
+    def __init__(self, repository=None):
+        self.git_dir = find_git_dir(repository)
+
+        if not os.path.isdir(os.path.join(self.git_dir, 'objects')) and \
+           not os.path.exists(os.path.join(self.git_dir, 'commondir')):
+            raise UnsupportedObject("%s is not a git directory" %
+                                    self.git_dir)
+
+        # linked worktrees share refs and objects with the main repo
+        self.common_dir = self.git_dir
+        commondir = os.path.join(self.git_dir, 'commondir')
+        if os.path.exists(commondir):
+            with open(commondir) as flp:
+                self.common_dir = os.path.join(self.git_dir,
+                                               flp.read().strip())
+
+        self._check_config()
+
+        self.object_dirs = [os.path.join(self.common_dir, 'objects')]
+        self._read_alternates(self.object_dirs[0])
+
+        self._packs = None
+        self._packed_refs = None
+        self._packed_refs_mtime = None
+
+    def _check_config(self):
+        path = os.path.join(self.common_dir, 'config')
+        if not os.path.exists(path):
+            return
+
+        with open(path) as flp:
+            config = flp.read().lower()
+
+        # sha256 repositories and reftable are handled by git
+        if re.search(r'objectformat\s*=\s*(?!sha1)', config) or \
+           re.search(r'refstorage\s*=\s*(?!files)', config):
+            raise UnsupportedObject("unsupported repository format")
+
+    def _read_alternates(self, objects_dir):
+        path = os.path.join(objects_dir, 'info', 'alternates')
+        if not os.path.exists(path):
+            return
+
+        with open(path) as flp:
+            for line in flp:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                alternate = os.path.join(objects_dir, line)
+                if alternate not in self.object_dirs:
+                    self.object_dirs.append(alternate)
+                    self._read_alternates(alternate)
+
+    def close(self):
+        for pack in self._packs or []:
+            pack.close()
+        self._packs = None
+
+    # refs
+
+    def _read_loose_ref(self, name):
+        # HEAD and other pseudo refs are per worktree
+        for base in (self.git_dir, self.common_dir):
+            path = os.path.join(base, name)
+            if os.path.isfile(path):
+                with open(path) as flp:
+                    return flp.read().strip()
+
+        return None
+
+    def _read_packed_refs(self):
+        path = os.path.join(self.common_dir, 'packed-refs')
+        try:
+            mtime = os.stat(path).st_mtime
+
+        except OSError:
+            self._packed_refs = {}
+            return self._packed_refs
+
+        if self._packed_refs is None or mtime != self._packed_refs_mtime:
+            self._packed_refs = {}
+            self._packed_refs_mtime = mtime
+            with open(path) as flp:
+                for line in flp:
+                    if line[0] in '#^':
+                        continue
+                    sha, ref = line.strip().split(' ', 1)
+                    self._packed_refs[ref] = sha
+
+        return self._packed_refs
+
+    def _read_ref(self, name, depth=0):
+        if depth > 5:
+            raise UnsupportedObject("symbolic ref loop at %s" % name)
+
+        value = self._read_loose_ref(name)
+        if value is None:
+            return self._read_packed_refs().get(name)
+
+        if value.startswith('ref:'):
+            return self._read_ref(value[4:].strip(), depth + 1)
+
+        if not SHA_PAT.match(value):
+            raise UnsupportedObject("bad ref %s" % name)
+
+        return value
+
+    def resolve_ref(self, name):
+        """
+        Resolve name the way `git rev-parse' does for plain ref names.
+        """
+        if SHA_PAT.match(name):
+            return name
+
+        for fmt in ('%s', 'refs/%s', 'refs/tags/%s', 'refs/heads/%s',
+                    'refs/remotes/%s', 'refs/remotes/%s/HEAD'):
+            sha = self._read_ref(fmt % name)
+            if sha:
+                return sha
+
+        # revision expressions, abbreviations and friends
+        raise UnsupportedObject(name)
+
+    def update_ref(self, name, new, old=None, ident=None, message=None):
+        """
+        Point ref name to new, provided it currently points to old,
+        taking the same lock file git does. When the ref has a reflog
+        and ident is given, an entry with message is appended to it.
+        """
+        path = os.path.join(self.common_dir, name)
+        lock = path + '.lock'
+
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        try:
+            fd = os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666)
+
+        except OSError:
+            # somebody else holds the lock, let git report it
+            raise UnsupportedObject("%s is locked" % name)
+
+        try:
+            if os.path.islink(path) or \
+               (self._read_loose_ref(name) or '').startswith('ref:'):
+                raise UnsupportedObject("%s is a symbolic ref" % name)
+
+            if old is not None and self._read_ref(name) != old:
+                raise UnsupportedObject("%s has moved" % name)
+
+            os.write(fd, new + '\n')
+            os.close(fd)
+            fd = None
+            os.rename(lock, path)
+
+        finally:
+            if fd is not None:
+                os.close(fd)
+                os.remove(lock)
+
+        log = os.path.join(self.common_dir, 'logs', name)
+        if ident and os.path.exists(log):
+            entry = '%s %s %s' % (old or '0' * 40, new, ident)
+            if message:
+                entry += '\t' + message
+
+            with open(log, 'a') as flp:
+                flp.write(entry + '\n')
+
+    # objects
+
+    def write_object(self, kind, data):
+        """
+        Store data as a loose object and return its sha. Objects that
+        already exist are not written again.
+        """
+        sha = hash_object(kind, data)
+        objects_dir = self.object_dirs[0]
+        path = os.path.join(objects_dir, sha[:2], sha[2:])
+
+        if os.path.exists(path):
+            return sha
+
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        # same compression level as git's core.loosecompression default
+        compressed = zlib.compress('%s %d\0%s' % (kind, len(data), data), 1)
+
+        # only writers pay for importing tempfile
+        import tempfile
+
+        fd, tmp = tempfile.mkstemp(prefix='tmp_obj_', dir=objects_dir)
+        try:
+            os.write(fd, compressed)
+        finally:
+            os.close(fd)
+
+        os.chmod(tmp, 0444)
+        os.rename(tmp, path)
+
+        return sha
+
+    def write_tree(self, entries):
+        """
+        Store a tree built from (mode, name, sha) entries.
+        """
+        return self.write_object('tree', serialize_tree(entries))
+
+    @property
+    def packs(self):
+        if self._packs is None:
+            self._packs = []
+            for objects_dir in self.object_dirs:
+                pack_dir = os.path.join(objects_dir, 'pack')
+                if not os.path.isdir(pack_dir):
+                    continue
+                for filename in sorted(os.listdir(pack_dir)):
+                    if filename.endswith('.idx'):
+                        try:
+                            self._packs.append(
+                                PackFile(os.path.join(pack_dir, filename))
+                                )
+                        except (IOError, OSError, ValueError):
+                            # pack removed under our feet or empty
+                            continue
+
+        return self._packs
+
+    def _read_loose(self, sha):
+        for objects_dir in self.object_dirs:
+            path = os.path.join(objects_dir, sha[:2], sha[2:])
+            try:
+                with open(path, 'rb') as flp:
+                    data = zlib.decompress(flp.read())
+
+            except IOError:
+                continue
+
+            header, data = data.split('\0', 1)
+            kind, size = header.split(' ')
+            if int(size) != len(data):
+                raise UnsupportedObject("corrupt loose object %s" % sha)
+
+            return (kind, data)
+
+        return None
+
+    def _read_packed(self, sha):
+        binsha = binascii.unhexlify(sha)
+        for pack in self.packs:
+            offset = pack.find(binsha)
+            if offset is not None:
+                return pack.read_at(offset, self)
+
+        return None
+
+    def read_object(self, sha):
+        """
+        Return (type, data) for the object named by sha.
+        """
+        try:
+            result = self._read_loose(sha) or self._read_packed(sha)
+
+            if result is None:
+                # a repack may have happened since we listed the packs
+                self.close()
+                result = self._read_packed(sha)
+
+        except (zlib.error, struct.error, IndexError, ValueError), error:
+            # corrupt or unexpected data, let git deal with it
+            raise UnsupportedObject("%s: %s" % (sha, error))
+
+        if result is None:
+            raise UnsupportedObject("object %s not found" % sha)
+
+        return result
+
+    def read_typed(self, sha, kind):
+        obj_kind, data = self.read_object(sha)
+        if obj_kind != kind:
+            raise UnsupportedObject("%s is a %s, expected %s" %
+                                    (sha, obj_kind, kind))
+        return data
+
+    def commit_tree(self, sha):
+        """
+        Return the tree sha of a commit.
+        """
+        data = self.read_typed(sha, 'commit')
+        if not data.startswith('tree '):
+            raise UnsupportedObject("malformed commit %s" % sha)
+
+        return data[5:45]
+
+    def read_tree(self, sha):
+        """
+        Return a list of (mode, name, sha) entries of a tree.
+        """
+        data = self.read_typed(sha, 'tree')
+        entries = []
+        pos = 0
+        end = len(data)
+        while pos < end:
+            space = data.index(' ', pos)
+            nul = data.index('\0', space)
+            mode = data[pos:space]
+            name = data[space + 1:nul]
+            entries.append((mode.rjust(6, '0'), name,
+                            binascii.hexlify(data[nul + 1:nul + 21])))
+            pos = nul + 21
+
+        return entries
+
+    def walk_tree(self, sha, path=''):
+        """
+        Yield (mode, type, sha, path) for every entry below tree sha,
+        parents before children, like `git ls-tree -r -t'.
+        """
+        for mode, name, entry_sha in self.read_tree(sha):
+            if path:
+                name = path + '/' + name
+
+            if mode == '040000':
+                yield (mode, 'tree', entry_sha, name)
+                for item in self.walk_tree(entry_sha, name):
+                    yield item
+
+            elif mode == '160000':
+                # submodule
+                yield (mode, 'commit', entry_sha, name)
+
+            else:
+                yield (mode, 'blob', entry_sha, name)
+
+    def diff_tree(self, old, new, path=''):
+        """
+        Yield (path, old_sha, new_sha) for every blob that differs
+        between trees old and new. Either tree may be None, and so may
+        the sha of a blob that only exists on one side. Subtrees with
+        the same sha on both sides are skipped without being read.
+        """
+        if old == new:
+            return
+
+        old_entries = {}
+        if old:
+            for mode, name, sha in self.read_tree(old):
+                old_entries[name] = (mode, sha)
+
+        new_entries = {}
+        if new:
+            for mode, name, sha in self.read_tree(new):
+                new_entries[name] = (mode, sha)
+
+        for name in sorted(set(old_entries) | set(new_entries)):
+            old_entry = old_entries.get(name)
+            new_entry = new_entries.get(name)
+            if old_entry == new_entry:
+                continue
+
+            if path:
+                name = path + '/' + name
+
+            old_tree = old_blob = new_tree = new_blob = None
+            if old_entry:
+                if old_entry[0] == '040000':
+                    old_tree = old_entry[1]
+                elif old_entry[0] != '160000':
+                    old_blob = old_entry[1]
+
+            if new_entry:
+                if new_entry[0] == '040000':
+                    new_tree = new_entry[1]
+                elif new_entry[0] != '160000':
+                    new_blob = new_entry[1]
+
+            if old_tree or new_tree:
+                for item in self.diff_tree(old_tree, new_tree, name):
+                    yield item
+
+            if old_blob != new_blob:
+                yield (name, old_blob, new_blob)
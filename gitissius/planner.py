@@ -0,0 +1,343 @@
+"""
+Planning of issue filters.
+
+A filter (see query.py) runs as a tree of steps, each producing the
+sorted rows of issues in the issue index:
+
+  scan     all rows
+  lookup   the rows of the values of an indexed field a condition
+           accepts, read from the postings of the index
+  union    the rows of any of its steps
+  check    the rows of its step passing a condition, checked on the
+           index columns if all its fields are indexed, or else on the
+           issues themselves
+
+A condition made only of conditions on indexed fields is looked up. In
+a conjunction, the lookup expected to produce the fewest rows drives
+and the other conditions check its rows, cheapest first: those of the
+index, then the most selective. Conditions that cannot be looked up
+are checked on a scan.
+
+Rows stream through the steps as they are found, so that the first
+issues can be shown before the last ones are checked. Only a lookup
+of several values gathers its rows first, to sort them.
+
+Lookups know how many rows they produce. Checks on the issues are
+guessed to keep a third of the rows, as planners do for conditions they
+know nothing about.
+"""
+import heapq
+import itertools
+
+import query
+
+# share of the rows a check on the issues is guessed to keep
+GUESS = 1.0 / 3
+
+
+class Step(object):
+    """
+    A step of a plan
+    """
+    estimate = 0
+    actual = None
+    children = ()
+
+    def run(self):
+        """
+        Return the rows the step produces, in order.
+        """
+        return list(self.rows())
+
+    def rows(self):
+        """
+        Yield the rows the step produces, in order, counting them.
+        """
+        self.actual = 0
+        for row in self._rows():
+            self.actual += 1
+            yield row
+
+    def explain(self, depth=0):
+        """
+        Return lines describing the step and its children, with the
+        number of rows they were expected to produce and, once run, the
+        number they produced.
+        """
+        actual = '-' if self.actual is None else self.actual
+        lines = ['%s%s  (estimated %d rows, actual %s)' % (
+            '  ' * depth, self.describe(), round(self.estimate), actual)]
+
+        for child in self.children:
+            lines.extend(child.explain(depth + 1))
+
+        return lines
+
+
+class Scan(Step):
+    def __init__(self, count):
+        self.count = count
+        self.estimate = count
+
+    def describe(self):
+        return 'scan all issues'
+
+    def _rows(self):
+        return xrange(self.count)
+
+
+class Lookup(Step):
+    def __init__(self, index, condition, postings, values):
+        self.index = index
+        self.condition = condition
+        self.postings = postings
+        self.values = values
+        self.estimate = sum(count for start, count in postings)
+
+    def describe(self):
+        return 'look up %s in the index (%d of %d values)' % (
+            self.condition, len(self.postings), self.values)
+
+    def _rows(self):
+        if len(self.postings) == 1:
+            start, count = self.postings[0]
+            return iter(self.index.rows(start, count))
+
+        rows = []
+        for start, count in self.postings:
+            rows.extend(self.index.rows(start, count))
+
+        rows.sort()
+        return iter(rows)
+
+
+class Union(Step):
+    def __init__(self, children, count):
+        self.children = children
+        self.estimate = min(count, sum(child.estimate for child in children))
+
+    def describe(self):
+        return 'union'
+
+    def _rows(self):
+        # rows in more than one child come out next to each other
+        return (row for row, same in itertools.groupby(
+            heapq.merge(*[child.rows() for child in self.children])))
+
+
+class Check(Step):
+    def __init__(self, child, condition, test, on_index, selectivity):
+        self.children = [child]
+        self.condition = condition
+        self.test = test
+        self.on_index = on_index
+        self.estimate = child.estimate * selectivity
+
+    def describe(self):
+        return 'check %s on the %s' % (
+            self.condition, 'index' if self.on_index else 'issues')
+
+    def _rows(self):
+        return itertools.ifilter(self.test, self.children[0].rows())
+
+
+class Planner(object):
+    """
+    Plans filters over the rows of an issue index.
+
+    index is the index, or None if it cannot be used, positions the
+    column of each field, count the number of rows and record(row) the
+    issue of a row.
+    """
+    def __init__(self, index, positions, count, record):
+        self.index = index
+        self.positions = positions
+        self.count = count
+        self.record = record
+        self._accepted = {}
+
+    def accepted(self, condition):
+        """
+        Return the string numbers of the values of the field of
+        condition it accepts, their (first row, row count) postings and
+        the number of distinct values, or None if the field is not
+        indexed.
+        """
+        if condition in self._accepted:
+            return self._accepted[condition]
+
+        result = None
+        position = self.positions.get(condition.field)
+        if self.index is not None and position is not None:
+            entries = self.index.postings(position)
+
+            if entries is not None:
+                numbers = set()
+                postings = []
+                for number, start, count in entries:
+                    if condition.match(self.index.string(number)):
+                        numbers.add(number)
+                        postings.append((start, count))
+
+                result = numbers, postings, len(entries)
+
+        self._accepted[condition] = result
+        return result
+
+    def lookup(self, condition):
+        """
+        Return a step producing the rows condition accepts without
+        scanning, or None if there is none.
+        """
+        if isinstance(condition, query.Condition):
+            accepted = self.accepted(condition)
+            if accepted is None:
+                return None
+
+            numbers, postings, values = accepted
+            return Lookup(self.index, condition, postings, values)
+
+        if isinstance(condition, query.Or):
+            steps = [self.lookup(c) for c in condition.conditions]
+            if not steps or [step for step in steps if step is None]:
+                return None
+
+            return Union(steps, self.count)
+
+        conditions = self.merge(condition.conditions)
+        steps = [self.lookup(c) for c in conditions]
+
+        candidates = [(step.estimate, i) for i, step in enumerate(steps)
+                      if step is not None]
+        if not candidates:
+            return None
+
+        estimate, driver = min(candidates)
+        return self.checks(steps[driver], [c for i, c in enumerate(conditions)
+                                           if i != driver])
+
+    def merge(self, conditions):
+        """
+        Return the conditions of a conjunction, with those of nested
+        conjunctions, and those on the same field merged into one so
+        that its values are looked up once.
+        """
+        flat = []
+        for condition in conditions:
+            if isinstance(condition, query.And):
+                flat.extend(self.merge(condition.conditions))
+
+            else:
+                flat.append(condition)
+
+        conditions = flat
+
+        fields = {}
+        for condition in conditions:
+            if isinstance(condition, query.Condition):
+                fields.setdefault(condition.field, []).append(condition)
+
+        merged = []
+        for condition in conditions:
+            if not isinstance(condition, query.Condition):
+                merged.append(condition)
+
+            elif fields[condition.field][0] is condition:
+                merged.append(query.all_of(fields[condition.field]))
+
+        return merged
+
+    def column_test(self, condition):
+        """
+        Return a function telling whether the issue of a row passes
+        condition, reading only index columns, or None if a field of
+        condition is not indexed.
+        """
+        if isinstance(condition, query.Condition):
+            accepted = self.accepted(condition)
+            if accepted is None:
+                return None
+
+            numbers = accepted[0]
+            column = self.index.column(self.positions[condition.field])
+            return lambda row: column[row] in numbers
+
+        tests = [self.column_test(c) for c in condition.conditions]
+        if [test for test in tests if test is None]:
+            return None
+
+        if isinstance(condition, query.Or):
+            return lambda row: any(test(row) for test in tests)
+
+        return lambda row: all(test(row) for test in tests)
+
+    def record_test(self, condition):
+        """
+        Return a function telling whether the issue of a row passes
+        condition.
+        """
+        record = self.record
+        return lambda row: condition(record(row))
+
+    def selectivity(self, condition):
+        """
+        Return the share of the issues condition is expected to accept.
+        """
+        if isinstance(condition, query.Condition):
+            accepted = self.accepted(condition)
+            if accepted is None:
+                return GUESS
+
+            return float(sum(count for start, count in accepted[1])) / \
+                max(self.count, 1)
+
+        shares = [self.selectivity(c) for c in condition.conditions]
+
+        result = 1.0
+        if isinstance(condition, query.Or):
+            for share in shares:
+                result *= 1 - share
+
+            return 1 - result
+
+        for share in shares:
+            result *= share
+
+        return result
+
+    def checks(self, step, conditions):
+        """
+        Return step followed by checks of conditions.
+        """
+        ordered = []
+        for condition in conditions:
+            test = self.column_test(condition)
+            on_index = test is not None
+
+            if not on_index:
+                test = self.record_test(condition)
+
+            ordered.append((not on_index, self.selectivity(condition),
+                            condition, test))
+
+        ordered.sort(key=lambda check: check[:2])
+        for issues, selectivity, condition, test in ordered:
+            step = Check(step, condition, test, not issues, selectivity)
+
+        return step
+
+    def plan(self, condition):
+        """
+        Return the plan of condition.
+        """
+        step = self.lookup(condition)
+        if step is not None:
+            return step
+
+        if isinstance(condition, query.And):
+            conditions = self.merge(condition.conditions)
+
+        else:
+            conditions = [condition]
+
+        return self.checks(Scan(self.count), conditions)
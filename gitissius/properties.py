@@ -1,5 +1,5 @@
+import os
 import common
-import hashlib
 import readline
 import logging
 
@@ -17,8 +17,11 @@ class DbProperty(object):
         self.name = name
         self.editable = editable
         self.allow_empty = allow_empty
+        # completion and default may be callables, evaluated only when
+        # they are actually needed
         self.completion = completion
-        self.value = default
+        self.default = default
+        self.value = None if callable(default) else default
 
         # if colorama is presend set colors
         if common.colorama:
@@ -48,6 +51,22 @@ class DbProperty(object):
     def printme(self):
         print "%s: %s" % (self.repr('repr_name'), self.repr('value'))
 
+    def get_completion(self):
+        if callable(self.completion):
+            return self.completion()
+
+        return self.completion
+
+    def set_default(self):
+        """
+        Set value to the default, computing it if needed.
+        """
+        if callable(self.default):
+            self.value = self.default()
+
+        else:
+            self.value = self.default
+
     @common.disable_colorama
     def interactive_edit(self):
         """
@@ -58,7 +77,7 @@ class DbProperty(object):
         if not self.editable:
             return
 
-        readline.set_completer(common.SimpleCompleter(self.completion).complete)
+        readline.set_completer(common.SimpleCompleter(self.get_completion()).complete)
         while True:
             value = raw_input("%s (%s): " % \
                               (self.repr_name, self.value)
@@ -147,7 +166,7 @@ class Option(DbProperty):
         shortcut gets used, convert it to a proper value. Validate
         provided input.
         """
-        readline.set_completer(common.SimpleCompleter(self.completion).complete)
+        readline.set_completer(common.SimpleCompleter(self.get_completion()).complete)
 
         if not default:
             default = self.value
@@ -252,31 +271,19 @@ class Id(DbProperty):
         """
         IdProperty Initializer
         """
+        # generated by records not given one, see DbObject
         super(Id, self).__init__(name=name, editable=editable)
         self.auto = auto
 
-        if self.auto:
-            self.value = self._gen_id()
-
-    def _gen_id(self):
-        # generate id
-        value = ''
-
+    def new_value(self, taken):
+        """
+        Return a new random id, for which taken(id) is False.
+        """
         while True:
-            value = hashlib.sha256(
-                value + str(common.now())
-                ).hexdigest()
-
-            # check if in collection
-            if len(common.git_repo.keys()) == 0:
-                break
-
-            elif not reduce(lambda x, y: x or y,
-                            map(lambda x: value in x, common.git_repo.keys())
-                            ):
-                break
+            value = os.urandom(32).encode('hex')
 
-        return value
+            if not taken(value):
+                return value
 
 class Text(DbProperty):
     pass
@@ -0,0 +1,461 @@
+"""
+Issue filters: rules, conditions and the filter language.
+
+A rule is a single item dictionary {'<field>[__<op>...]': value}, as
+accepted by IssueManager.filter. Rules, and filters written in the
+filter language, are compiled once into conditions: objects that take
+an issue and return True or False. A condition on a single field tests
+its value with its match method, which lets the planner (see
+planner.py) try each distinct value of an indexed field once instead
+of every issue.
+
+The filter language combines conditions with and, or, not and
+parentheses. A comma stands for and.
+
+  <field>[__<op>...]:<value>   a rule
+  <field> = <value>            the field is value, != negates
+  <field> < <value>            also <=, > and >=, comparing text
+  <field> in (<value>, ...)    the field is one of the values
+  <field> ~ <regex>            the field matches a regular expression,
+                               case insensitively
+
+Values holding spaces, commas, parentheses or quotes are quoted with
+single or double quotes, and backslashes escape quotes inside them.
+Dates are compared as written in the issues: the value of a date field
+is read as YYYY-MM-DD[THH:MM[:SS]], a date alone standing for its
+midnight.
+
+Filters of older versions, rules separated by commas with values
+holding anything but commas and colons, are still understood.
+"""
+import re
+import datetime
+import operator as operators
+
+OPERATORS = ['not', 'exact', 'startswith']
+
+COMPARISONS = {'=': operators.eq,
+               '!=': operators.ne,
+               '<': operators.lt,
+               '<=': operators.le,
+               '>': operators.gt,
+               '>=': operators.ge,
+               }
+
+DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S']
+
+
+class QueryError(ValueError):
+    """
+    Raised on filters that cannot be parsed
+    """
+    pass
+
+
+def text(value):
+    """
+    Return value as a string suitable for matching.
+    """
+    if value is None:
+        return u''
+
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    return value
+
+
+class Condition(object):
+    """
+    A test on the value of one field
+    """
+    def __init__(self, field, match, description):
+        self.field = field
+        self.match = match
+        self.description = description
+
+    def __call__(self, issue):
+        return self.match(issue.get_value(self.field))
+
+    def negated(self):
+        match = self.match
+        return Condition(self.field, lambda value: not match(value),
+                         'not ' + self.description)
+
+    def __str__(self):
+        return self.description
+
+
+class And(object):
+    """
+    Issues matching all conditions
+    """
+    def __init__(self, conditions):
+        self.conditions = conditions
+
+    def __call__(self, issue):
+        for condition in self.conditions:
+            if not condition(issue):
+                return False
+        return True
+
+    def negated(self):
+        return Or([condition.negated() for condition in self.conditions])
+
+    def __str__(self):
+        if not self.conditions:
+            return 'all issues'
+
+        return '(%s)' % ' and '.join(str(c) for c in self.conditions)
+
+
+class Or(object):
+    """
+    Issues matching any of the conditions
+    """
+    def __init__(self, conditions):
+        self.conditions = conditions
+
+    def __call__(self, issue):
+        for condition in self.conditions:
+            if condition(issue):
+                return True
+        return False
+
+    def negated(self):
+        return And([condition.negated() for condition in self.conditions])
+
+    def __str__(self):
+        return '(%s)' % ' or '.join(str(c) for c in self.conditions)
+
+
+def quote(value):
+    """
+    Return value as written in a filter.
+    """
+    if _BARE.match(value) and _BARE.match(value).end() == len(value):
+        return value
+
+    return '"%s"' % re.sub(r'(["\\])', r'\\\1', value)
+
+
+def compile_rule(rule):
+    """
+    Return the condition of a single rule, or rule itself if it is a
+    condition already.
+
+    Every rule matches values containing the given value, case
+    insensitively. '__exact' and '__startswith' further require an
+    exact or prefix match, and '__not' negates the result.
+    """
+    if not isinstance(rule, dict):
+        return rule
+
+    name, value = rule.items()[0]
+    ops = name.split('__')
+    name = ops[0]
+
+    for op in ops[1:]:
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator '%s'" % op)
+
+    needle = value.lower()
+    exact = 'exact' in ops
+    startswith = 'startswith' in ops
+    negate = 'not' in ops
+
+    def match(field):
+        field = text(field)
+        result = needle in field.lower()
+
+        if result and exact:
+            result = field == value
+
+        if result and startswith:
+            result = field.startswith(value)
+
+        return result != negate
+
+    return Condition(name, match, '%s:%s' % (rule.keys()[0], quote(value)))
+
+
+def compile_rules(rules, operator='and'):
+    """
+    Return a single condition combining rules with operator, 'and' or
+    'or'. Evaluation stops at the first rule that decides the result.
+    """
+    return combine([compile_rule(rule) for rule in rules], operator)
+
+
+def combine(conditions, operator='and'):
+    """
+    Return a single condition combining conditions with operator.
+    """
+    if not conditions:
+        return And([])
+
+    if len(conditions) == 1:
+        return conditions[0]
+
+    if operator == 'and':
+        return And(conditions)
+
+    elif operator == 'or':
+        return Or(conditions)
+
+    raise ValueError("Unknown operator '%s'" % operator)
+
+
+def all_of(conditions):
+    """
+    Return a single condition out of conditions on the same field.
+    """
+    matches = [condition.match for condition in conditions]
+
+    def match(field_value):
+        for test in matches:
+            if not test(field_value):
+                return False
+        return True
+
+    return Condition(conditions[0].field, match,
+                     ' and '.join(str(c) for c in conditions))
+
+
+def compare(field, op, value):
+    """
+    Return the condition comparing field to value with op.
+    """
+    test = COMPARISONS[op]
+    ordering = op not in ('=', '!=')
+
+    def match(field_value):
+        if ordering and field_value is None:
+            return False
+
+        return test(text(field_value), value)
+
+    return Condition(field, match, '%s %s %s' % (field, op, quote(value)))
+
+
+def one_of(field, values):
+    """
+    Return the condition of field being one of values.
+    """
+    values = list(values)
+    accepted = set(values)
+
+    def match(field_value):
+        return text(field_value) in accepted
+
+    return Condition(field, match, '%s in (%s)' % (
+        field, ', '.join(quote(value) for value in values)))
+
+
+def search(field, pattern):
+    """
+    Return the condition of field matching the regular expression
+    pattern.
+    """
+    try:
+        regex = re.compile(pattern, re.IGNORECASE | re.UNICODE)
+
+    except re.error, error:
+        raise QueryError("Bad regular expression '%s': %s" % (pattern, error))
+
+    def match(field_value):
+        return regex.search(text(field_value)) is not None
+
+    return Condition(field, match, '%s ~ %s' % (field, quote(pattern)))
+
+
+def parse_date(value):
+    """
+    Return the date value, as written in issues.
+    """
+    for fmt in DATE_FORMATS:
+        try:
+            return unicode(datetime.datetime.strptime(value, fmt).isoformat())
+
+        except ValueError:
+            pass
+
+    raise QueryError("Bad date '%s', expected YYYY-MM-DD[THH:MM[:SS]]" % value)
+
+
+_SPACE = re.compile(r'\s*')
+_END = re.compile(r'$')
+_FIELD = re.compile(r'[A-Za-z_]\w*')
+_OPERATOR = re.compile(r'<=|>=|!=|<|>|=|~|:')
+_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'')
+_BARE = re.compile(r'[^\s(),"\']+')
+_OPEN = re.compile(r'\(')
+_CLOSE = re.compile(r'\)')
+_COMMA = re.compile(r',')
+
+
+class Parser(object):
+    """
+    Recursive descent parser of the filter language
+    """
+    def __init__(self, text, fields=None, dates=()):
+        self.text = text
+        self.position = 0
+        self.fields = fields
+        self.dates = dates
+
+    def error(self, message):
+        raise QueryError('%s at column %d of filter: %s' % (
+            message, self.position + 1, self.text))
+
+    def accept(self, pattern):
+        """
+        Return the match of pattern after any spaces, moving past it,
+        or None.
+        """
+        self.position = _SPACE.match(self.text, self.position).end()
+
+        match = pattern.match(self.text, self.position)
+        if match:
+            self.position = match.end()
+
+        return match
+
+    def keyword(self, word):
+        return self.accept(re.compile(r'%s\b' % word, re.IGNORECASE))
+
+    def parse(self):
+        condition = self.disjunction()
+
+        if not self.accept(_END):
+            self.error('Unexpected text')
+
+        return condition
+
+    def disjunction(self):
+        conditions = [self.conjunction()]
+        while self.keyword('or'):
+            conditions.append(self.conjunction())
+
+        return combine(conditions, 'or')
+
+    def conjunction(self):
+        conditions = [self.negation()]
+        while self.keyword('and') or self.accept(_COMMA):
+            conditions.append(self.negation())
+
+        return combine(conditions, 'and')
+
+    def negation(self):
+        if self.keyword('not'):
+            return self.negation().negated()
+
+        if self.accept(_OPEN):
+            condition = self.disjunction()
+            if not self.accept(_CLOSE):
+                self.error("Missing ')'")
+
+            return condition
+
+        return self.condition()
+
+    def condition(self):
+        match = self.accept(_FIELD)
+        if not match:
+            self.error('Expected a field')
+
+        name = match.group()
+        field = name.split('__')[0]
+        if self.fields is not None and field not in self.fields:
+            self.error("Unknown field '%s'" % field)
+
+        if name == field and self.keyword('in'):
+            if not self.accept(_OPEN):
+                self.error("Expected '('")
+
+            values = [self.value(field)]
+            while self.accept(_COMMA):
+                values.append(self.value(field))
+
+            if not self.accept(_CLOSE):
+                self.error("Expected ')'")
+
+            return one_of(field, values)
+
+        match = self.accept(_OPERATOR)
+        if not match:
+            self.error('Expected an operator')
+
+        op = match.group()
+        if op == ':':
+            try:
+                return compile_rule({name: self.value()})
+
+            except ValueError, error:
+                self.error(str(error))
+
+        if name != field:
+            self.error("Operators of rules only go with ':'")
+
+        if op == '~':
+            return search(field, self.value())
+
+        return compare(field, op, self.value(field))
+
+    def value(self, field=None):
+        """
+        Return the next value, as a date if it is the value of a date
+        field.
+        """
+        match = self.accept(_QUOTED)
+        if match:
+            value = match.group(1)
+            if value is None:
+                value = match.group(2)
+
+            value = re.sub(r'\\(.)', r'\1', value)
+
+        else:
+            match = self.accept(_BARE)
+            if not match:
+                self.error('Expected a value')
+
+            value = match.group()
+
+        if field in self.dates:
+            value = parse_date(value)
+
+        return value
+
+
+def parse(text, fields=None, dates=()):
+    """
+    Return the condition of a filter. Only fields are allowed, if
+    given, and the values of the fields in dates are read as dates.
+    Raises QueryError if text is not a filter.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf8')
+
+    try:
+        return Parser(text, fields, dates).parse()
+
+    except QueryError, error:
+        pass
+
+    # rules separated by commas, as older versions took them
+    try:
+        rules = [dict([part.lstrip().split(':')]) for part in text.split(',')]
+
+    except ValueError:
+        raise error
+
+    for rule in rules:
+        if fields is not None and rule.keys()[0].split('__')[0] not in fields:
+            raise error
+
+    try:
+        return compile_rules(rules)
+
+    except ValueError:
+        raise error
@@ -0,0 +1,215 @@
+"""
+Long-running gitissius daemon.
+
+Keeps the shelf, the issue index and the object readers in memory and
+runs the commands of thin clients (see client.py) on a Unix socket.
+Each connection carries one command:
+
+  client: {"args": [...], "cwd": "...", "columns": 80}
+  daemon: {"run": "local" | "stdin" | "daemon"}
+  client: its stdin, if asked for, then end of stream
+  daemon: the output of the command, a NUL, {"exit": status}
+
+Commands that prompt the user are answered with "local" and the client
+runs them itself.
+"""
+import os
+import sys
+import json
+import socket
+import traceback
+from StringIO import StringIO
+
+import common
+import gitshelve
+import commands
+import client
+
+class Server(object):
+    """
+    Serve gitissius commands on a Unix socket
+    """
+    def __init__(self, path):
+        self.path = path
+        self.sock = None
+        self.running = False
+
+    def listen(self):
+        """
+        Bind the socket. Returns False if another daemon serves it.
+        """
+        sock = client.connect(self.path)
+        if sock is not None:
+            sock.close()
+            return False
+
+        if os.path.exists(self.path):
+            # left behind by a daemon that was killed
+            os.remove(self.path)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0600)
+        self.sock.listen(16)
+
+        return True
+
+    def detach(self):
+        """
+        Continue in a background process. Returns True in the parent.
+        """
+        if os.fork():
+            self.sock.close()
+            return True
+
+        os.setsid()
+
+        null = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3):
+            os.dup2(null, fd)
+
+        os.close(null)
+
+        return False
+
+    def serve_forever(self):
+        self.running = True
+
+        try:
+            while self.running:
+                conn, address = self.sock.accept()
+
+                try:
+                    self.handle(conn)
+
+                except socket.error:
+                    # the client went away
+                    pass
+
+                except ValueError:
+                    # not a client of ours
+                    pass
+
+                finally:
+                    conn.close()
+
+        finally:
+            self.sock.close()
+            os.remove(self.path)
+
+    def refresh(self):
+        """
+        Reload the shelf and the issue index if the gitissius branch
+        moved since the last command, e.g. by a commit of another
+        process.
+        """
+        if common.git_repo.current_head() == common.git_repo.head:
+            return
+
+        common.git_repo.close()
+        common.git_repo = gitshelve.open(branch='gitissius')
+        common.issue_manager.update_db()
+
+    def handle(self, conn):
+        rfile = conn.makefile('rb')
+        wfile = conn.makefile('wb')
+
+        line = rfile.readline()
+        if not line:
+            # only checking whether we run
+            return
+
+        message = json.loads(line)
+
+        try:
+            if message.get('stop'):
+                self.running = False
+                self.reply(wfile, 'stopped')
+                return
+
+            args = message['args']
+            command = commands.get_command(args[0])
+
+            if command is None or not command.served or \
+               not os.path.isdir(message['cwd']):
+                self.reply(wfile, 'local')
+                return
+
+            int(message['columns'])
+            self.refresh()
+
+            try:
+                needs_stdin = command.needs_stdin(args[1:])
+
+            except SystemExit:
+                # bad options, reported when the command runs
+                needs_stdin = False
+
+        except Exception:
+            # a message of another version, or a repository we fail to
+            # read: the client runs the command itself
+            traceback.print_exc()
+            self.reply(wfile, 'local')
+            return
+
+        stdin = StringIO()
+        if needs_stdin:
+            self.reply(wfile, 'stdin')
+            stdin = StringIO(rfile.read())
+
+        else:
+            self.reply(wfile, 'daemon')
+
+        status = self.run(args, message, stdin, wfile)
+        wfile.write('\0' + json.dumps({'exit': status}) + '\n')
+
+        if not command.read_only:
+            # issues may have been changed in memory, committed or not
+            common.issue_manager.update_db()
+
+        wfile.flush()
+
+    def reply(self, wfile, run):
+        wfile.write(json.dumps({'run': run}) + '\n')
+        wfile.flush()
+
+    def run(self, args, message, stdin, wfile):
+        """
+        Run a command as if started by the client. Returns its exit
+        status.
+        """
+        saved = (os.getcwd(), os.environ.get('COLUMNS'),
+                 sys.stdin, sys.stdout, sys.stderr)
+
+        os.chdir(message['cwd'])
+        os.environ['COLUMNS'] = str(message['columns'])
+        sys.stdin, sys.stdout, sys.stderr = stdin, wfile, wfile
+        status = 0
+
+        try:
+            commands.execute(args[0], args[1:])
+
+        except SystemExit, error:
+            # as the interpreter would exit
+            if error.code is None or isinstance(error.code, int):
+                status = error.code or 0
+
+            else:
+                print >>sys.stderr, error.code
+                status = 1
+
+        except Exception:
+            traceback.print_exc()
+            status = 1
+
+        finally:
+            cwd, columns, sys.stdin, sys.stdout, sys.stderr = saved
+            os.chdir(cwd)
+
+            if columns is None:
+                del os.environ['COLUMNS']
+
+            else:
+                os.environ['COLUMNS'] = columns
+
+        return status
@@ -0,0 +1,244 @@
+"""
+Synchronization of the gitissius branch with remotes.
+
+The branch is never checked out: pulling fetches only the remote
+gitissius branch and merges it on the object level, so the working
+tree and the index of the user are never touched.
+"""
+import gitshelve
+import database
+
+BRANCH = 'gitissius'
+
+
+def remote_name(shelf):
+    """
+    Return the remote the gitissius branch tracks, 'origin' by default.
+    """
+    remote = shelf.git('config', 'branch.%s.remote' % BRANCH,
+                       ignore_errors=True)
+
+    return remote or 'origin'
+
+
+def remote_ref(remote):
+    return 'refs/remotes/%s/%s' % (remote, BRANCH)
+
+
+def is_checked_out(shelf):
+    """
+    Return True if HEAD points to the gitissius branch.
+    """
+    head = shelf.git('symbolic-ref', '-q', 'HEAD', ignore_errors=True)
+    return head == 'refs/heads/%s' % BRANCH
+
+
+def fetch(shelf, remote):
+    """
+    Fetch the gitissius branch of remote into its remote-tracking ref
+    and return its head, or None if remote has no gitissius branch.
+    """
+    try:
+        shelf.git('fetch', '--quiet', remote,
+                  '+refs/heads/%s:%s' % (BRANCH, remote_ref(remote)))
+
+    except gitshelve.GitError, error:
+        if "couldn't find remote ref" in (error.stderr or ''):
+            return None
+
+        raise
+
+    return shelf.rev_parse(remote_ref(remote))
+
+
+def remote_head(shelf, remote):
+    """
+    Ask remote for the head of its gitissius branch, without fetching
+    anything. Returns None if remote has no gitissius branch.
+    """
+    output = shelf.git('ls-remote', remote, 'refs/heads/%s' % BRANCH)
+    if not output:
+        return None
+
+    return output.split()[0]
+
+
+def tracking_head(shelf, remote):
+    """
+    Return the last known head of the gitissius branch of remote, or
+    None if it was never fetched or pushed.
+    """
+    try:
+        return shelf.rev_parse(remote_ref(remote))
+
+    except (gitshelve.GitError, ValueError):
+        return None
+
+
+def merge_base(shelf, first, second):
+    """
+    Return the best common ancestor of two commits, or None if their
+    histories are unrelated.
+    """
+    try:
+        return shelf.git('merge-base', first, second)
+
+    except gitshelve.GitError:
+        return None
+
+
+def is_ancestor(shelf, ancestor, commit):
+    """
+    Return True if ancestor is commit or one of its ancestors. Commits
+    not in the repository are nobody's ancestors.
+    """
+    try:
+        shelf.git('merge-base', '--is-ancestor', ancestor, commit)
+
+    except gitshelve.GitError:
+        return False
+
+    return True
+
+
+def changes(shelf, base, head):
+    """
+    Return the (path, old_blob, new_blob) changes from base to head.
+    With no base, everything in head counts as added.
+    """
+    if base is None:
+        return [(path, None, name)
+                for perm, kind, name, path in shelf.ls_tree(head)
+                if kind == 'blob']
+
+    return shelf.diff_trees(base, head)
+
+
+def merge(shelf, head, message):
+    """
+    Merge commit head into the branch of shelf.
+
+    Fast-forwards when possible. Otherwise only the paths changed
+    since the merge base are looked at, and the changes of the other
+    side are merged into the local tree by the database layer. The
+    result is committed with both heads as parents.
+
+    Returns 'up-to-date', 'fast-forward' or 'merged'.
+    """
+    local = shelf.head
+
+    if local == head:
+        return 'up-to-date'
+
+    base = None
+    if local:
+        base = merge_base(shelf, local, head)
+
+        if base == head:
+            # we already have everything
+            return 'up-to-date'
+
+    if not local or base == local:
+        shelf.update_head(head, 'gitissius: fast-forward')
+        shelf.read_repository()
+        return 'fast-forward'
+
+    database.merge_changes(shelf,
+                           changes(shelf, base, local),
+                           changes(shelf, base, head))
+
+    # even with no changes the merge has to be recorded
+    shelf.dirty = True
+    shelf.commit(message, parents=[local, head])
+
+    return 'merged'
+
+
+def pull(shelf, remote=None):
+    """
+    Fetch the gitissius branch from remote and merge it into ours.
+    Returns what happened, as merge() does, or None if the remote has
+    no gitissius branch.
+    """
+    remote = remote or remote_name(shelf)
+
+    head = fetch(shelf, remote)
+    if head is None:
+        return None
+
+    return merge(shelf, head, "Merged %s/%s" % (remote, BRANCH))
+
+
+def push(shelf, remote=None, upstream=None):
+    """
+    Push the gitissius branch, and nothing else, to remote.
+
+    upstream is the head of the remote branch if already known;
+    otherwise the remote-tracking ref is trusted, and the network is
+    not used at all when it equals our head.
+
+    Returns 'up-to-date', 'pushed' or 'rejected' when the remote has
+    changes we have not merged yet.
+    """
+    remote = remote or remote_name(shelf)
+    local = shelf.head
+
+    if upstream is None:
+        upstream = tracking_head(shelf, remote)
+
+    if not local or local == upstream:
+        return 'up-to-date'
+
+    try:
+        shelf.git('push', '--quiet', remote,
+                  'refs/heads/%s:refs/heads/%s' % (BRANCH, BRANCH))
+
+    except gitshelve.GitError, error:
+        if '[rejected]' in (error.stderr or ''):
+            return 'rejected'
+
+        raise
+
+    shelf.git('update-ref', remote_ref(remote), local)
+
+    return 'pushed'
+
+
+def update(shelf, remote=None):
+    """
+    Pull from and push to remote, asking it once for its head and
+    skipping each step that has nothing to do.
+
+    Returns the results of the pull and the push, as (pull(),
+    push()) would.
+    """
+    remote = remote or remote_name(shelf)
+
+    upstream = remote_head(shelf, remote)
+    tracking = tracking_head(shelf, remote)
+
+    if upstream is None:
+        pulled = None
+
+        # the branch is gone upstream, forget where it was
+        if tracking:
+            shelf.git('update-ref', '-d', remote_ref(remote))
+
+    elif shelf.head and (upstream == shelf.head or
+                         is_ancestor(shelf, upstream, shelf.head)):
+        # we already have everything upstream
+        pulled = 'up-to-date'
+
+        if upstream != tracking:
+            shelf.git('update-ref', remote_ref(remote), upstream)
+
+    elif upstream == tracking:
+        # fetched already, by git fetch or an earlier update, but not
+        # merged yet
+        pulled = merge(shelf, tracking, "Merged %s/%s" % (remote, BRANCH))
+
+    else:
+        pulled = merge(shelf, fetch(shelf, remote),
+                       "Merged %s/%s" % (remote, BRANCH))
+
+    return pulled, push(shelf, remote, upstream)
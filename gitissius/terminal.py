@@ -0,0 +1,27 @@
+"""
+Terminal helpers that need nothing but the standard library, so that
+the thin client can use them too.
+"""
+import os
+import sys
+
+def terminal_width():
+    """Return terminal width."""
+    width = 0
+    try:
+        import struct, fcntl, termios
+        s = struct.pack('HHHH', 0, 0, 0, 0)
+        x = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, s)
+        width = struct.unpack('HHHH', x)[1]
+
+    except:
+        pass
+
+    if width <= 0:
+        if os.environ.has_key("COLUMNS"):
+            width = int(os.getenv("COLUMNS"))
+
+        if width <= 0:
+            width = 80
+
+    return width
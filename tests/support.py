@@ -0,0 +1,146 @@
+"""
+Helpers of the tests that need a repository: each test runs in a new
+repository whose gitissius branch is open as common.git_repo.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+import subprocess
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'gitissius'))
+
+# the modules are imported as gitissius.py loads them, the client first,
+# then common, with logging set up before a command runs with another
+# stderr
+logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s',
+                    level=logging.INFO)
+
+import client
+import common
+import gitshelve
+import objectstore
+import database
+import sync
+import server
+import commands
+
+# commits and current_user get the same author everywhere
+os.environ.update({'GIT_CONFIG_NOSYSTEM': '1',
+                   'GIT_CONFIG_COUNT': '2',
+                   'GIT_CONFIG_KEY_0': 'user.name',
+                   'GIT_CONFIG_VALUE_0': 'Tester',
+                   'GIT_CONFIG_KEY_1': 'user.email',
+                   'GIT_CONFIG_VALUE_1': 'tester@example.com',
+                   })
+
+
+def git(*args, **kwargs):
+    """
+    Run git in kwargs['cwd'], or the current directory, and return its
+    output without the trailing newline.
+    """
+    proc = subprocess.Popen(('git',) + args, cwd=kwargs.get('cwd'),
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    out, err = proc.communicate(kwargs.get('input', ''))
+    if proc.returncode != 0:
+        raise AssertionError('git %s failed: %s' % (' '.join(args), err))
+
+    return out.rstrip('\n')
+
+
+def issue_data(issue_id, **values):
+    """
+    Return the data of an issue, as stored in its blob.
+    """
+    data = {'id': issue_id,
+            'title': u'Crash on start',
+            'status': u'new',
+            'type': u'bug',
+            'severity': u'low',
+            'assigned_to': u'',
+            'reported_from': u'Tester <tester@example.com>',
+            'created_on': u'2013-05-01T09:00:00',
+            'updated_on': u'2013-05-01T09:00:00',
+            'description': u'',
+            }
+    data.update(values)
+    return data
+
+
+def issue_path(issue_id):
+    return '%s/%s/issue' % (issue_id[:2], issue_id[2:])
+
+
+def comment_path(issue_id, comment_id):
+    return '%s/%s/comments/%s' % (issue_id[:2], issue_id[2:], comment_id)
+
+
+def add_issue(shelf, issue_id, **values):
+    """
+    Commit an issue to shelf.
+    """
+    shelf[issue_path(issue_id)] = json.dumps(issue_data(issue_id, **values),
+                                             indent=4)
+    shelf.commit('Added issue %s' % issue_id)
+
+
+class RepositoryTest(unittest.TestCase):
+    """
+    Runs each test in a new repository with an empty gitissius branch
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+        self.path = self.make_repository('work')
+        os.chdir(self.path)
+
+        database._blob_cache = None
+        common._commiters = None
+        self.open()
+
+    def tearDown(self):
+        common.git_repo.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def make_repository(self, name):
+        """
+        Return the path of a new repository with a commit on its
+        current branch and an empty gitissius branch.
+        """
+        path = os.path.join(self.directory, name)
+        git('init', '-q', path)
+        git('commit', '-q', '--allow-empty', '-m', 'Initial', cwd=path)
+
+        tree = git('mktree', input='', cwd=path)
+        commit = git('commit-tree', tree, '-m', 'Initialization of gitissius',
+                     cwd=path)
+        git('update-ref', 'refs/heads/gitissius', commit, cwd=path)
+        return path
+
+    def open(self):
+        """
+        Open the gitissius branch again, as a new command would.
+        """
+        common.git_repo = gitshelve.open(branch='gitissius')
+        common.issue_manager = database.IssueManager()
+
+    def execute(self, *args):
+        """
+        Run a command and return what it printed.
+        """
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            commands.execute(args[0], list(args[1:]))
+            return sys.stdout.getvalue()
+
+        finally:
+            sys.stdout = stdout
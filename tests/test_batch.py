@@ -0,0 +1,150 @@
+import os
+import json
+import unittest
+
+from support import RepositoryTest, git, add_issue, issue_path, common
+
+
+A = 'ab12' * 16
+B = 'ab34' * 16
+C = 'cd56' * 16
+
+
+class BatchTest(RepositoryTest):
+    def setUp(self):
+        super(BatchTest, self).setUp()
+        add_issue(common.git_repo, A, title=u'Committed')
+        self.open()
+
+        self.urandom = os.urandom
+
+    def tearDown(self):
+        os.urandom = self.urandom
+        super(BatchTest, self).tearDown()
+
+    def draw(self, *ids):
+        """
+        Make os.urandom return ids, in order, then random ones.
+        """
+        ids = list(ids)
+
+        def urandom(count):
+            if ids:
+                return ids.pop(0).decode('hex')
+
+            return self.urandom(count)
+
+        os.urandom = urandom
+
+    def batch(self, *operations):
+        path = os.path.join(self.directory, 'operations')
+        with open(path, 'w') as flp:
+            for operation in operations:
+                if not isinstance(operation, basestring):
+                    operation = json.dumps(operation)
+                flp.write(operation + '\n')
+
+        return self.execute('batch', path)
+
+    def commits(self):
+        return int(git('rev-list', '--count', 'gitissius'))
+
+    def files(self):
+        return git('ls-tree', '-r', '--name-only', 'gitissius').split('\n')
+
+    def test_one_commit(self):
+        commits = self.commits()
+        self.draw(C)
+
+        output = self.batch(
+            {'op': 'create', 'fields': {'title': 'New'}},
+            {'op': 'set-field', 'id': C[:6], 'field': 'severity',
+             'value': 'high'},
+            {'op': 'comment', 'id': A, 'description': 'Seen again'},
+            {'op': 'close', 'id': A[:6]})
+
+        self.assertTrue(output.startswith('Applied 4 operations in '))
+        self.assertEqual(self.commits(), commits + 1)
+        self.assertTrue(git('log', '-1', '--format=%s', 'gitissius')
+                        .startswith('Applied 4 operations'))
+
+        self.open()
+        self.assertEqual(common.issue_manager.get(C).get_value('severity'),
+                         'high')
+        issue = common.issue_manager.get(A)
+        self.assertEqual(issue.get_value('status'), 'closed')
+        self.assertEqual(len(issue.comments), 1)
+
+    def test_failing_line(self):
+        head = common.git_repo.head
+        files = self.files()
+
+        output = self.batch(
+            {'op': 'set-field', 'id': A, 'field': 'title', 'value': 'Lost'},
+            {'op': 'create', 'fields': {'title': 'Lost too'}},
+            {'op': 'comment', 'id': A, 'description': 'Lost as well'},
+            {'op': 'rename', 'id': A})
+
+        self.assertTrue(' > Line 4: KeyError' in output)
+        self.assertTrue(' > No changes committed' in output)
+        self.assertEqual(common.git_repo.head, head)
+        self.assertEqual(git('rev-parse', 'gitissius'), head)
+
+        # nothing of the batch is left to go with the next commit
+        add_issue(common.git_repo, C)
+        self.assertEqual(self.files(), sorted(files + [issue_path(C)]))
+
+        self.open()
+        self.assertEqual(common.issue_manager.get(A).get_value('title'),
+                         'Committed')
+
+    def test_bad_json(self):
+        commits = self.commits()
+        output = self.batch({'op': 'close', 'id': A}, '{"op": ')
+
+        self.assertTrue(' > Line 2: ValueError' in output)
+        self.assertEqual(self.commits(), commits)
+
+    def test_ambiguous_with_committed(self):
+        # an issue of the batch does not hide a committed one
+        commits = self.commits()
+        self.draw(B)
+
+        output = self.batch({'op': 'create', 'fields': {'title': 'New'}},
+                            {'op': 'close', 'id': 'ab'})
+
+        self.assertTrue(' > Line 2: Conflicting IDs' in output)
+        self.assertTrue('Committed' in output and 'New' in output)
+        self.assertEqual(self.commits(), commits)
+
+    def test_ambiguous_in_batch(self):
+        self.draw(C, 'cd78' * 16)
+
+        output = self.batch({'op': 'create', 'fields': {'title': 'One'}},
+                            {'op': 'create', 'fields': {'title': 'Two'}},
+                            {'op': 'close', 'id': 'cd'})
+
+        self.assertTrue(' > Line 3: Conflicting IDs' in output)
+
+    def test_unique_prefix(self):
+        self.draw(B)
+
+        output = self.batch({'op': 'create', 'fields': {'title': 'New'}},
+                            {'op': 'close', 'id': 'ab3'},
+                            {'op': 'set-field', 'id': 'ab1', 'field': 'title',
+                             'value': 'Renamed'})
+
+        self.assertTrue(output.startswith('Applied 3 operations in '))
+        self.open()
+        self.assertEqual(common.issue_manager.get(B).get_value('status'),
+                         'closed')
+        self.assertEqual(common.issue_manager.get(A).get_value('title'),
+                         'Renamed')
+
+    def test_not_found(self):
+        output = self.batch({'op': 'close', 'id': 'ef'})
+        self.assertTrue(' > Line 1: ID not found ef' in output)
+
+
+if __name__ == '__main__':
+    unittest.main()
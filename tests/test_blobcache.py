@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import shutil
+import marshal
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gitissius'))
+
+# common has to come first, it imports database once it is set up
+import common
+import blobcache
+
+
+def name(prefix, number):
+    return '%s%038x' % (prefix, number)
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, blobcache.CACHE_NAME)
+        self.read = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def blobs(self, names):
+        self.read.extend(names)
+        return [json.dumps({'name': name}) for name in names]
+
+    def parse(self, cache, names):
+        del self.read[:]
+        return cache.parse(names, self.blobs, json.loads)
+
+    def bucket(self, prefix, size=1):
+        return blobcache.Bucket(os.path.join(self.path, prefix), size)
+
+
+class BucketTest(CacheTest):
+    def setUp(self):
+        super(BucketTest, self).setUp()
+        os.mkdir(self.path)
+
+    def test_least_recently_used(self):
+        bucket = self.bucket('aa', 3)
+        for number in range(5):
+            bucket.set(name('aa', number), number)
+        bucket.save()
+
+        bucket = self.bucket('aa', 3)
+        self.assertEqual(sorted(bucket.entries),
+                         [name('aa', 2), name('aa', 3), name('aa', 4)])
+
+        # the oldest entry is used again and another one goes first
+        self.assertEqual(bucket.get(name('aa', 2)), 2)
+        bucket.set(name('aa', 5), 5)
+        bucket.save()
+
+        bucket = self.bucket('aa', 3)
+        self.assertEqual(sorted(bucket.entries),
+                         [name('aa', 2), name('aa', 4), name('aa', 5)])
+
+    def test_reads_are_not_written(self):
+        bucket = self.bucket('aa', 4)
+        for number in range(4):
+            bucket.set(name('aa', number), number)
+        bucket.save()
+
+        bucket = self.bucket('aa', 4)
+        self.assertEqual(bucket.get(name('aa', 3)), 3)
+        self.assertFalse(bucket.dirty)
+        self.assertRaises(KeyError, bucket.get, name('aa', 9))
+
+    def test_round_trip(self):
+        values = [{u'title': u'caf\xe9', u'labels': [u'a', None, 3, 2.5],
+                   u'nested': {u'empty': {}, u'flag': True}},
+                  [], u'', None, 10 ** 12]
+
+        bucket = self.bucket('aa', len(values))
+        for number, value in enumerate(values):
+            bucket.set(name('aa', number), value)
+        bucket.save()
+
+        bucket = self.bucket('aa', len(values))
+        for number, value in enumerate(values):
+            self.assertEqual(bucket.get(name('aa', number)), value)
+
+    def test_other_versions(self):
+        path = os.path.join(self.path, 'aa')
+        entries = {name('aa', 0): (1, u'old')}
+
+        for data in ['damaged', '',
+                     marshal.dumps((blobcache.CACHE_VERSION - 1, 4, entries))]:
+            with open(path, 'wb') as flp:
+                flp.write(data)
+
+            bucket = self.bucket('aa', 4)
+            self.assertEqual(bucket.entries, {})
+
+
+class BlobCacheTest(CacheTest):
+    def test_parse(self):
+        names = [name('aa', 1), name('bb', 2), name('aa', 3)]
+        cache = blobcache.BlobCache(self.path)
+
+        self.assertEqual(self.parse(cache, names),
+                         [{u'name': names[0]}, {u'name': names[1]},
+                          {u'name': names[2]}])
+        self.assertEqual(self.read, names)
+        self.assertEqual(sorted(os.listdir(self.path)), ['aa', 'bb'])
+
+        # from the buckets, by another process
+        cache = blobcache.BlobCache(self.path)
+        self.assertEqual(self.parse(cache, names + [name('cc', 4)])[:3],
+                         [{u'name': names[0]}, {u'name': names[1]},
+                          {u'name': names[2]}])
+        self.assertEqual(self.read, [name('cc', 4)])
+
+    def test_grows_with_lookups(self):
+        cache = blobcache.BlobCache(self.path, 256)
+        self.assertEqual(cache.bucket_size, 1)
+
+        self.parse(cache, [name('aa', 0)])
+        self.assertEqual(cache.bucket('aa').size, 1)
+
+        # a lookup of n blobs makes room for 2n
+        names = [name('%02x' % (number % 256), number)
+                 for number in range(1024)]
+        self.parse(cache, names)
+        self.assertEqual(cache.bucket_size, 8)
+        self.assertEqual(cache.bucket('aa').size, 8)
+        self.assertEqual(self.bucket('aa').size, 8)
+        self.assertEqual(len(self.bucket('aa').entries), 5)
+
+        # and does not shrink on small lookups later on
+        cache = blobcache.BlobCache(self.path, 256)
+        self.parse(cache, [name('aa', 2000)])
+        self.assertEqual(self.read, [name('aa', 2000)])
+        self.assertEqual(cache.bucket('aa').size, 8)
+        self.assertEqual(len(self.bucket('aa').entries), 6)
+
+        self.parse(cache, names)
+        self.assertEqual(self.read, [])
+
+    def test_evicts_beyond_size(self):
+        cache = blobcache.BlobCache(self.path, 256 * 2)
+        for number in range(3):
+            self.parse(cache, [name('aa', number)])
+
+        self.assertEqual(sorted(self.bucket('aa').entries),
+                         [name('aa', 1), name('aa', 2)])
+
+        cache = blobcache.BlobCache(self.path, 256 * 2)
+        self.parse(cache, [name('aa', 0), name('aa', 2)])
+        self.assertEqual(self.read, [name('aa', 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import sys
+import unittest
+
+from support import commands
+
+# gitissius.py, which commands/__init__.py gives the loaded modules
+import gitissius
+
+
+class UsageTest(unittest.TestCase):
+    def test_imports_no_command(self):
+        modules = set(sys.modules)
+        loaded = dict(commands._commands)
+
+        text = gitissius.usage(commands.available_commands)
+
+        self.assertEqual(set(sys.modules), modules)
+        self.assertEqual(commands._commands, loaded)
+        self.assertTrue('\tmyissues    : Show issues assigned to you '
+                        '(Aliases: my, mylist, m)\n' in text)
+        self.assertTrue('\tpush        : Push issues upstream '
+                        '(Aliases: None)\n' in text)
+
+    def test_registry(self):
+        for name, (module, aliases, description) in \
+                commands.registry.items():
+            self.assertEqual(commands.get_command(name).name, name)
+            self.assertTrue(description)
+
+            for alias in aliases:
+                self.assertEqual(commands.get_command(alias).name, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
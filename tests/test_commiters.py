@@ -0,0 +1,55 @@
+import os
+import json
+import unittest
+
+from support import RepositoryTest, git, common
+
+
+TESTER = 'Tester <tester@example.com>'
+
+
+class CommitersTest(RepositoryTest):
+    def setUp(self):
+        super(CommitersTest, self).setUp()
+        self.cache = os.path.join('.git', 'gitissius.commiters')
+
+    def commiters(self):
+        common._commiters = None
+        return common.get_commiters()
+
+    def cached_head(self):
+        with open(self.cache) as flp:
+            return json.load(flp)['head']
+
+    def test_incremental(self):
+        self.assertEqual(self.commiters(), set([TESTER]))
+        self.assertEqual(self.cached_head(), git('rev-parse', 'HEAD'))
+
+        git('commit', '-q', '--allow-empty', '-m', 'Other',
+            '--author', 'Other <other@example.com>')
+        self.assertEqual(self.commiters(),
+                         set([TESTER, 'Other <other@example.com>']))
+        self.assertEqual(self.cached_head(), git('rev-parse', 'HEAD'))
+
+    def check_unborn(self):
+        git('symbolic-ref', 'HEAD', 'refs/heads/unborn')
+
+        self.assertEqual(common._current_branch_head(), None)
+        self.assertEqual(self.commiters(), set())
+        self.assertFalse(os.path.exists(self.cache))
+
+        git('commit', '-q', '--allow-empty', '-m', 'First')
+        self.assertEqual(common._current_branch_head(),
+                         git('rev-parse', 'HEAD'))
+        self.assertEqual(self.commiters(), set([TESTER]))
+
+    def test_unborn(self):
+        self.check_unborn()
+
+    def test_unborn_without_store(self):
+        common.git_repo.get_store = lambda: None
+        self.check_unborn()
+
+
+if __name__ == '__main__':
+    unittest.main()
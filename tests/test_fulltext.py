@@ -0,0 +1,192 @@
+import os
+import sys
+import random
+import hashlib
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gitissius'))
+
+import fulltext
+
+
+HEAD = 'ab' * 20
+
+
+def issue(name):
+    return (name * 64)[:64]
+
+
+def blob(text):
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def update(index, removed=(), added=()):
+    """
+    Return index updated with removed texts and added (issue, text)
+    pairs.
+    """
+    data = fulltext.update(index, HEAD,
+                           [(blob(text), text) for text in removed],
+                           [(blob(text), issue(name), text)
+                            for name, text in added])
+    return fulltext.SearchIndex(data)
+
+
+def contents(index):
+    """
+    Return the postings of index by term, with the documents named by
+    their blob, to compare indexes whatever their history.
+    """
+    blobs = index.data[index._blobs_at:index._doc_issues_at]
+    result = {}
+    for number in range(index.term_count):
+        docs, counts, positions = index.postings(index.term_entry(number))
+
+        postings = []
+        start = 0
+        for doc, count in zip(docs, counts):
+            postings.append((blobs[doc * 20:doc * 20 + 20],
+                             index.issue_id(index.doc_issues[doc]),
+                             list(positions[start:start + count])))
+            start += count
+
+        result[index.term(number)] = sorted(postings)
+
+    return result
+
+
+def search(index, query):
+    return [(round(score, 9), issue_id) for score, issue_id
+            in index.search(fulltext.parse_query([query]))]
+
+
+class UpdateTest(unittest.TestCase):
+    def test_remove_and_add_again(self):
+        text = u'Crash on start'
+        index = update(None, added=[('a', text)])
+        self.assertEqual(index.find_doc(blob(text)), 0)
+
+        index = update(index, removed=[text])
+        self.assertEqual(index.find_doc(blob(text)), None)
+        self.assertEqual(index.live_count, 0)
+        self.assertEqual(search(index, 'crash'), [])
+        self.assertEqual(contents(index), {})
+
+        index = update(index, added=[('a', text)])
+        self.assertEqual(index.find_doc(blob(text)), 1)
+        self.assertEqual([issue_id for score, issue_id
+                          in search(index, 'crash')], [issue('a')])
+        self.assertEqual(contents(index),
+                         contents(update(None, added=[('a', text)])))
+
+    def test_remove_unknown(self):
+        index = update(None, added=[('a', u'one')])
+        self.assertEqual(contents(update(index, removed=[u'two'])),
+                         contents(index))
+
+    def test_phrases(self):
+        index = update(None, added=[('a', u'x y x y'), ('b', u'y x'),
+                                    ('c', u'x y'),
+                                    ('d', u'the quick brown fox')])
+        self.assertEqual(sorted(index.matches([u'x', u'y'])), [(0, 2), (2, 1)])
+        self.assertEqual(sorted(index.matches([u'y', u'x'])), [(0, 1), (1, 1)])
+        self.assertEqual(index.matches([u'quick', u'brown', u'fox']), [(3, 1)])
+        self.assertEqual(index.matches([u'quick', u'fox']), [])
+
+        # the positions of the other documents move as one is removed
+        index = update(index, removed=[u'x y x y'])
+        self.assertEqual(index.matches([u'x', u'y']), [(2, 1)])
+        self.assertEqual(index.matches([u'y', u'x']), [(1, 1)])
+        self.assertEqual(index.matches([u'quick', u'brown', u'fox']), [(3, 1)])
+
+    def test_compaction(self):
+        index = update(None, added=[('a', u'common words %d' % number)
+                                    for number in range(10)])
+        compacted = False
+        for version in range(40):
+            text = u'common words %d' % (version % 10)
+            index = update(index, removed=[text], added=[('a', text)])
+
+            postings = len(index.data) - index.size
+            self.assertTrue(index.garbage <= postings - index.garbage)
+            compacted = compacted or index.garbage == 0
+
+        self.assertTrue(compacted)
+        self.assertEqual(contents(index),
+                         contents(update(None, added=[
+                             ('a', u'common words %d' % number)
+                             for number in range(10)])))
+
+    def test_incremental(self):
+        words = u'crash start memory leak slow login typo fails on the'.split()
+        generator = random.Random(7)
+
+        texts = {}
+        index = None
+        for step in range(60):
+            removed = generator.sample(
+                sorted(texts), min(len(texts), generator.randint(0, 2)))
+            added = []
+            for number in range(generator.randint(0, 3)):
+                text = u'%s %d' % (u' '.join(generator.choice(words) for i in
+                                             range(generator.randint(1, 8))),
+                                   step * 10 + number)
+                added.append((generator.choice('abcdef'), text))
+
+            index = update(index, removed, added)
+            for text in removed:
+                del texts[text]
+
+            texts.update((text, name) for name, text in added)
+
+            scratch = update(None, added=[(name, text) for text, name
+                                          in sorted(texts.items())])
+            self.assertEqual(contents(index), contents(scratch))
+            self.assertEqual(index.live_count, scratch.live_count)
+            self.assertEqual(index.total_length, scratch.total_length)
+
+            for query in [u'crash', u'memory leak', u'"on the"',
+                          u'typo login']:
+                self.assertEqual(search(index, query), search(scratch, query),
+                                 query)
+
+
+class RankTest(unittest.TestCase):
+    def rank(self, documents, query):
+        index = update(None, added=documents)
+        return [issue_id[0] for score, issue_id in search(index, query)]
+
+    def test_count(self):
+        self.assertEqual(self.rank([('a', u'leak other'), ('b', u'leak leak'),
+                                    ('c', u'other other')], 'leak'),
+                         ['b', 'a'])
+
+    def test_length(self):
+        self.assertEqual(self.rank([('a', u'leak in a long description'),
+                                    ('b', u'leak here'),
+                                    ('c', u'nothing at all')], 'leak'),
+                         ['b', 'a'])
+
+    def test_rare_terms(self):
+        index = update(None, added=[('a', u'rare common'),
+                                    ('b', u'common filler'),
+                                    ('c', u'common filler')])
+        rare, = search(index, 'rare')
+        common = dict((issue_id, score)
+                      for score, issue_id in search(index, 'common'))
+        self.assertTrue(rare[0] > common[issue('a')])
+
+    def test_all_elements(self):
+        self.assertEqual(self.rank([('a', u'memory leak'), ('b', u'memory'),
+                                    ('c', u'leak')], 'memory leak'),
+                         ['a'])
+
+    def test_best_document(self):
+        # an issue scores by the best of its documents
+        self.assertEqual(self.rank([('a', u'leak leak'), ('a', u'other'),
+                                    ('b', u'leak other')], 'leak'),
+                         ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import json
+import unittest
+
+from support import RepositoryTest, add_issue, comment_path, common, database
+
+
+A = 'a1' * 32
+B = 'b2' * 32
+C = 'c3' * 32
+
+
+class IdTest(RepositoryTest):
+    def setUp(self):
+        super(IdTest, self).setUp()
+
+        add_issue(common.git_repo, A)
+        common.git_repo[comment_path(A, B)] = \
+            json.dumps({'id': B, 'issue_id': A, 'description': u'Hi',
+                        'reported_from': u'Tester <tester@example.com>',
+                        'created_on': u'2013-05-01T10:00:00'})
+        common.git_repo.commit('Added comment')
+        self.open()
+
+        self.urandom = os.urandom
+        self.drawn = []
+
+    def tearDown(self):
+        os.urandom = self.urandom
+        super(IdTest, self).tearDown()
+
+    def draw(self, *ids):
+        """
+        Make os.urandom return ids, in order.
+        """
+        ids = list(ids)
+
+        def urandom(count):
+            self.drawn.append(ids[0])
+            return ids.pop(0).decode('hex')
+
+        os.urandom = urandom
+
+    def test_random(self):
+        first = database.Issue(title=u'One').get_value('id')
+        second = database.Issue(title=u'Two').get_value('id')
+
+        self.assertEqual(len(first), 64)
+        self.assertNotEqual(first, second)
+
+    def test_issue_ids_are_not_reused(self):
+        self.draw(A, C)
+        self.assertEqual(database.Issue(title=u'New').get_value('id'), C)
+        self.assertEqual(self.drawn, [A, C])
+
+    def test_comment_ids_are_not_reused(self):
+        self.draw(B, C)
+        comment = database.Comment(issue_id=A)
+        self.assertEqual(comment.get_value('id'), C)
+        self.assertEqual(self.drawn, [B, C])
+
+    def test_comment_ids_only_differ_on_their_issue(self):
+        # the id of an issue, or of a comment on another issue, is free
+        self.draw(A)
+        self.assertEqual(database.Comment(issue_id=C).get_value('id'), A)
+
+        self.draw(B)
+        self.assertEqual(database.Comment(issue_id=C).get_value('id'), B)
+
+    def test_comments_do_not_load_issues(self):
+        database.Comment(issue_id=A)
+        self.assertEqual(common.issue_manager._issuedb, None)
+
+    def test_given_ids_are_kept(self):
+        self.draw()
+        self.assertEqual(database.Issue(id=A).get_value('id'), A)
+        self.assertEqual(self.drawn, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import sys
+import shutil
+import tempfile
+import datetime
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gitissius'))
+
+import issueindex
+
+
+HEAD = 'ab' * 20
+NAMES = ['id', 'status', 'title', 'created_on', 'updated_on']
+
+RECORDS = [
+    [u'a1', u'new', u'caf\xe9', u'2013-05-02T10:00:00',
+     datetime.datetime(2013, 5, 2, 10, 0)],
+    [u'b2', u'open', None, u'2013-05-01T09:00:00', None],
+    [u'c3', u'new', 5, u'2013-05-03T00:00:00', None],
+    [u'd4', None, [u'x', {u'y': 1}], None, None],
+    ]
+
+COMMENTS = [(u'b2', u'c9', u'2013-05-04T00:00:00'),
+            (u'a1', u'c8', None)]
+
+
+def format_index():
+    return issueindex.format_index(HEAD, NAMES, RECORDS, [1, 1, 1, 1],
+                                   COMMENTS, [1], [3])
+
+
+class RoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.index = issueindex.Index(format_index())
+
+    def test_header(self):
+        self.assertEqual(self.index.head, HEAD)
+        self.assertEqual(self.index.count, len(RECORDS))
+        self.assertEqual(self.index.columns, len(NAMES))
+
+    def test_values(self):
+        self.assertEqual(self.index.values(0), [u'a1', u'b2', u'c3', u'd4'])
+        self.assertEqual(self.index.values(1), [u'new', u'open', u'new', None])
+        self.assertEqual(self.index.values(2),
+                         [u'caf\xe9', None, 5, [u'x', {u'y': 1}]])
+        self.assertEqual(self.index.value(4, 0), u'2013-05-02T10:00:00')
+        self.assertEqual(list(self.index.row(2)), RECORDS[2])
+
+    def test_text(self):
+        column = self.index.column(2)
+        self.assertEqual(self.index.text(column[0]), 'caf\xc3\xa9')
+        self.assertEqual(self.index.text(column[1]), '')
+        self.assertEqual(self.index.text(column[2]), '5')
+
+    def test_comments(self):
+        self.assertEqual(self.index.comments(), sorted(COMMENTS))
+
+    def test_postings(self):
+        postings = self.index.postings(1)
+        values = dict((self.index.string(number),
+                       list(self.index.rows(start, count)))
+                      for number, start, count in postings)
+        self.assertEqual(values, {u'new': [0, 2], u'open': [1], None: [3]})
+        self.assertEqual(self.index.postings(2), None)
+
+    def test_order(self):
+        self.assertEqual(list(self.index.order(3)), [3, 1, 0, 2])
+        self.assertEqual(self.index.order(1), None)
+
+    def test_prefix_lengths(self):
+        self.assertEqual(list(self.index.prefix_lengths), [1, 1, 1, 1])
+
+
+class ReadIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = issueindex.index_path(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.path, 'wb') as flp:
+            flp.write(data)
+
+    def test_read(self):
+        self.write(format_index())
+        index = issueindex.read_index(self.path, NAMES)
+        self.assertEqual(index.values(0), [u'a1', u'b2', u'c3', u'd4'])
+
+    def test_missing(self):
+        self.assertEqual(issueindex.read_index(self.path, NAMES), None)
+
+        self.write('')
+        self.assertEqual(issueindex.read_index(self.path, NAMES), None)
+
+    def test_schema_changed(self):
+        self.write(format_index())
+        self.assertEqual(issueindex.read_index(self.path, NAMES + ['type']),
+                         None)
+        self.assertEqual(issueindex.read_index(self.path, NAMES[::-1]), None)
+
+    def test_version_changed(self):
+        data = format_index()
+        magic, version = issueindex.HEADER.unpack_from(data)[:2]
+        header = issueindex.HEADER.pack(
+            magic, version + 1, *issueindex.HEADER.unpack_from(data)[2:])
+        self.write(header + data[issueindex.HEADER.size:])
+        self.assertEqual(issueindex.read_index(self.path, NAMES), None)
+
+    def test_damaged(self):
+        data = format_index()
+        self.write('X' + data[1:])
+        self.assertEqual(issueindex.read_index(self.path, NAMES), None)
+
+        self.write(data[:issueindex.HEADER.size + 8])
+        self.assertEqual(issueindex.read_index(self.path, NAMES), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
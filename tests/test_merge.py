@@ -0,0 +1,89 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gitissius'))
+
+# common has to come first, it imports database once it is set up
+import common
+import database
+
+
+BASE = {'id': u'a1' * 32,
+        'title': u'Crash on start',
+        'status': u'new',
+        'type': u'bug',
+        'severity': u'low',
+        'assigned_to': u'',
+        'reported_from': u'A <a@example.com>',
+        'created_on': u'2013-05-01T09:00:00',
+        'updated_on': u'2013-05-01T09:00:00',
+        'description': u'',
+        }
+
+
+def changed(updated_on, **values):
+    data = dict(BASE, updated_on=updated_on)
+    data.update(values)
+    return data
+
+
+def merge(base, ours, theirs):
+    obj = database.merge_object(database.Issue, base, ours, theirs)
+    return dict((name, obj.get_value(name)) for name in BASE)
+
+
+class MergeValueTest(unittest.TestCase):
+    def test_one_side(self):
+        self.assertEqual(database.merge_value(u'a', u'b', u'a', None), u'b')
+        self.assertEqual(database.merge_value(u'a', u'a', u'b', None), u'b')
+        self.assertEqual(database.merge_value(u'a', u'b', u'b', True), u'b')
+
+    def test_both_sides(self):
+        self.assertEqual(database.merge_value(u'a', u'b', u'c', True), u'c')
+        self.assertEqual(database.merge_value(u'a', u'b', u'c', False), u'b')
+
+        # the same on every clone, whichever side is ours
+        self.assertEqual(database.merge_value(u'a', u'b', u'c', None), u'c')
+        self.assertEqual(database.merge_value(u'a', u'c', u'b', None), u'c')
+        self.assertEqual(database.merge_value(None, None, u'b', None), u'b')
+
+
+class MergeObjectTest(unittest.TestCase):
+    def test_different_fields(self):
+        ours = changed(u'2013-05-02T09:00:00', status=u'closed')
+        theirs = changed(u'2013-05-03T09:00:00', assigned_to=u'bob')
+
+        merged = merge(BASE, ours, theirs)
+        self.assertEqual(merged['status'], u'closed')
+        self.assertEqual(merged['assigned_to'], u'bob')
+        self.assertEqual(merged['updated_on'], u'2013-05-03T09:00:00')
+
+    def test_same_field(self):
+        older = changed(u'2013-05-02T09:00:00', title=u'Older',
+                        severity=u'high')
+        newer = changed(u'2013-05-03T09:00:00', title=u'Newer')
+
+        for ours, theirs in ((older, newer), (newer, older)):
+            merged = merge(BASE, ours, theirs)
+            self.assertEqual(merged['title'], u'Newer')
+            self.assertEqual(merged['severity'], u'high')
+            self.assertEqual(merged['updated_on'], u'2013-05-03T09:00:00')
+
+    def test_same_field_same_time(self):
+        first = changed(u'2013-05-02T09:00:00', title=u'First')
+        second = changed(u'2013-05-02T09:00:00', title=u'Second')
+
+        self.assertEqual(merge(BASE, first, second),
+                         merge(BASE, second, first))
+
+    def test_no_base(self):
+        # added on both sides with the same id
+        ours = changed(u'2013-05-02T09:00:00', title=u'Ours')
+        theirs = changed(u'2013-05-02T09:00:00', title=u'Theirs')
+
+        self.assertEqual(merge({}, ours, theirs)['title'], u'Theirs')
+
+
+if __name__ == '__main__':
+    unittest.main()
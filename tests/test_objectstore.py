@@ -0,0 +1,235 @@
+import os
+import unittest
+import binascii
+import subprocess
+
+from support import RepositoryTest, git, common, objectstore
+
+
+def cat_objects(shas):
+    """
+    Return {sha: (type, data)} of shas, as git cat-file reads them.
+    """
+    proc = subprocess.Popen(['git', 'cat-file', '--batch'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out = proc.communicate(''.join(sha + '\n' for sha in shas))[0]
+
+    objects = {}
+    pos = 0
+    while pos < len(out):
+        end = out.index('\n', pos)
+        sha, kind, size = out[pos:end].split(' ')
+        pos = end + 1 + int(size)
+        objects[sha] = (kind, out[end + 1:pos])
+        pos += 1
+
+    return objects
+
+
+class WriteTest(RepositoryTest):
+    """
+    Objects and refs written natively are those git writes
+    """
+    def setUp(self):
+        super(WriteTest, self).setUp()
+        self.store = objectstore.ObjectStore()
+
+    def tearDown(self):
+        self.store.close()
+        super(WriteTest, self).tearDown()
+
+    def test_write_object(self):
+        for data in ['', 'issue\n', '\0\xff' * 1000]:
+            sha = self.store.write_object('blob', data)
+            self.assertEqual(sha, git('hash-object', '--stdin', input=data))
+            self.assertEqual(git('cat-file', 'blob', sha), data.rstrip('\n'))
+
+        self.assertEqual(git('fsck', '--strict', '--no-dangling'), '')
+
+    def test_write_tree(self):
+        blob = self.store.write_object('blob', 'issue\n')
+        subtree = self.store.write_tree([('100644', 'issue', blob)])
+
+        # a directory sorts as if its name ended in a slash
+        entries = [('100644', 'a.b', blob), ('040000', 'a', subtree),
+                   ('100644', 'a-b', blob), ('100644', 'b', blob)]
+        sha = self.store.write_tree(entries)
+
+        listing = ''.join('%s %s %s\t%s\n' %
+                          (mode, 'tree' if mode == '040000' else 'blob',
+                           entry_sha, name)
+                          for mode, name, entry_sha in entries)
+        self.assertEqual(sha, git('mktree', input=listing))
+        self.assertEqual(self.store.write_tree([]), git('mktree', input=''))
+
+    def test_update_ref(self):
+        old = git('rev-parse', 'gitissius')
+        new = git('commit-tree', git('mktree', input=''), '-p', old,
+                  '-m', 'Next')
+        ident = common.git_repo.committer(new)
+
+        self.store.update_ref('refs/heads/gitissius', new, old, ident,
+                              'gitissius: commit')
+        self.assertEqual(git('rev-parse', 'gitissius'), new)
+        self.assertEqual(git('reflog', '-1', '--format=%H %gs', 'gitissius'),
+                         new + ' gitissius: commit')
+
+        # git appends the same entry
+        git('update-ref', '-m', 'gitissius: commit', 'refs/heads/gitissius',
+            old, new)
+        log = git('rev-parse', '--git-path', 'logs/refs/heads/gitissius')
+        with open(log) as flp:
+            ours, theirs = flp.read().splitlines()[-2:]
+
+        def fields(entry):
+            # the time of the commit and the current one differ
+            line, message = entry.split('\t')
+            line, seconds, zone = line.rsplit(' ', 2)
+            return line.split(' ', 2) + [message]
+
+        self.assertEqual(fields(ours),
+                         [old, new, 'Tester <tester@example.com>',
+                          'gitissius: commit'])
+        self.assertEqual(fields(theirs)[2:], fields(ours)[2:])
+
+    def test_update_ref_moved(self):
+        old = git('rev-parse', 'gitissius')
+        self.assertRaises(objectstore.UnsupportedObject,
+                          self.store.update_ref, 'refs/heads/gitissius',
+                          old, '0' * 40)
+        self.assertEqual(git('rev-parse', 'gitissius'), old)
+
+    def test_commit_reflog(self):
+        common.git_repo['issue'] = 'data'
+        common.git_repo.commit('Added issue')
+
+        self.assertEqual(git('reflog', '-1', '--format=%H %gs', 'gitissius'),
+                         common.git_repo.head + ' gitissius: commit')
+
+
+class ReadTest(RepositoryTest):
+    """
+    Objects read natively, packed or loose, are those git reads
+    """
+    def setUp(self):
+        super(ReadTest, self).setUp()
+
+        # versions of a file differing in a few lines make delta chains
+        lines = ['line %d of the description\n' % number
+                 for number in range(400)]
+        for version in range(30):
+            lines[version * 7 % 400] = 'changed in version %d\n' % version
+            lines.append('appended in version %d\n' % version)
+            with open('issue', 'w') as flp:
+                flp.write(''.join(lines))
+
+            git('add', 'issue')
+            git('commit', '-q', '-m', 'Version %d' % version)
+
+    def objects(self):
+        shas = git('cat-file', '--batch-all-objects',
+                   '--batch-check=%(objectname)').split('\n')
+        return cat_objects(shas)
+
+    def pack_kinds(self, store):
+        """
+        Return the number of objects of each type stored in the packs.
+        """
+        kinds = {}
+        for pack in store.packs:
+            for index in range(pack.count):
+                kind = (ord(pack.pack[pack._offset(index)]) >> 4) & 7
+                kinds[kind] = kinds.get(kind, 0) + 1
+
+        return kinds
+
+    def check_objects(self):
+        objects = self.objects()
+        self.assertTrue(len(objects) > 90)
+
+        store = objectstore.ObjectStore()
+        try:
+            for sha, expected in sorted(objects.items()):
+                self.assertEqual(store.read_object(sha), expected, sha)
+
+        finally:
+            store.close()
+
+    def test_ofs_delta(self):
+        git('gc', '-q', '--aggressive')
+
+        store = objectstore.ObjectStore()
+        try:
+            self.assertTrue(self.pack_kinds(store).get(
+                objectstore.OBJ_OFS_DELTA))
+
+        finally:
+            store.close()
+
+        self.check_objects()
+
+    def test_ref_delta(self):
+        git('-c', 'repack.useDeltaBaseOffset=false', 'repack', '-q', '-a',
+            '-d', '-f', '--depth=50', '--window=50')
+
+        store = objectstore.ObjectStore()
+        try:
+            kinds = self.pack_kinds(store)
+            self.assertTrue(kinds.get(objectstore.OBJ_REF_DELTA))
+            self.assertFalse(kinds.get(objectstore.OBJ_OFS_DELTA))
+
+        finally:
+            store.close()
+
+        self.check_objects()
+
+    def test_fanout(self):
+        git('gc', '-q')
+        shas = sorted(self.objects())
+
+        store = objectstore.ObjectStore()
+        try:
+            pack, = store.packs
+            self.assertEqual(pack.count, len(shas))
+
+            for sha in shas:
+                self.assertNotEqual(pack.find(binascii.unhexlify(sha)), None)
+
+            # missing shas at the ends of the table and next to present ones
+            for sha in ['00' * 20, 'ff' * 20, shas[0][:38] + 'ff',
+                        shas[-1][:2] + 'ff' * 19,
+                        shas[len(shas) // 2][:2] + '00' * 19]:
+                if sha not in shas:
+                    self.assertEqual(pack.find(binascii.unhexlify(sha)), None)
+
+            self.assertRaises(objectstore.UnsupportedObject,
+                              store.read_object, '00' * 20)
+
+        finally:
+            store.close()
+
+    def test_loose(self):
+        git('gc', '-q')
+
+        store = objectstore.ObjectStore()
+        try:
+            # written after packing, found next to the packs
+            sha = store.write_object('blob', 'loose\n')
+            self.assertEqual(store.read_object(sha), ('blob', 'loose\n'))
+
+            # packed once the packs were listed
+            git('tag', 'loose', sha)
+            git('repack', '-q', '-a', '-d')
+            git('prune-packed')
+            self.assertFalse(os.path.exists(
+                os.path.join('.git', 'objects', sha[:2], sha[2:])))
+            self.assertEqual(store.read_object(sha), ('blob', 'loose\n'))
+
+        finally:
+            store.close()
+
+        self.check_objects()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gitissius'))
+
+import query
+import planner
+import issueindex
+
+
+NAMES = ['id', 'status', 'assigned_to', 'title']
+POSITIONS = dict((name, position) for position, name in enumerate(NAMES))
+
+RECORDS = [
+    [u'a1', u'new', u'bob', u'memory leak'],
+    [u'b2', u'open', None, u'crash on start'],
+    [u'c3', u'closed', u'eve', u'slow login'],
+    [u'd4', u'new', None, u'memory usage'],
+    [u'e5', u'open', u'bob', u'login fails'],
+    [u'f6', u'closed', None, u'typo'],
+    ]
+
+
+class Record(object):
+    def __init__(self, values):
+        self.values = values
+
+    def get_value(self, name):
+        return self.values[POSITIONS[name]]
+
+
+def make_planner(indexed=('status', 'assigned_to')):
+    data = issueindex.format_index(None, NAMES, RECORDS,
+                                   [1] * len(RECORDS), [],
+                                   [POSITIONS[name] for name in indexed])
+    index = issueindex.Index(data)
+    return planner.Planner(index, POSITIONS, len(RECORDS),
+                           lambda row: Record(RECORDS[row]))
+
+
+def expected(condition):
+    return [row for row, values in enumerate(RECORDS)
+            if condition(Record(values))]
+
+
+FILTERS = [
+    'status = new',
+    'status:e',
+    'assigned_to__not:bob',
+    'not assigned_to = bob',
+    'assigned_to = ""',
+    'assigned_to > a',
+    'status in (new, open) and assigned_to__not:bob',
+    'status = closed or assigned_to = bob',
+    'status = new or assigned_to = bob',
+    'title:login and not status = open',
+    'title:memory or title:typo',
+    'status = new and status != new',
+    'status__not:closed, assigned_to:bob',
+    ]
+
+
+class PlannerTest(unittest.TestCase):
+    def check(self, text, planner):
+        condition = query.parse(text, NAMES)
+        step = planner.plan(condition)
+        self.assertEqual(list(step.run()), expected(condition), text)
+        return step
+
+    def test_indexed(self):
+        for text in FILTERS:
+            self.check(text, make_planner())
+
+    def test_not_indexed(self):
+        for text in FILTERS:
+            self.check(text, make_planner(indexed=()))
+
+    def test_without_index(self):
+        for text in FILTERS:
+            condition = query.parse(text, NAMES)
+            step = planner.Planner(None, POSITIONS, len(RECORDS),
+                                   lambda row: Record(RECORDS[row])
+                                   ).plan(condition)
+            self.assertTrue(isinstance(step, (planner.Scan, planner.Check)))
+            self.assertEqual(list(step.run()), expected(condition), text)
+
+    def test_null_postings(self):
+        # issues nobody is assigned to are looked up like any other value
+        step = self.check('assigned_to__not:bob', make_planner())
+        self.assertTrue(isinstance(step, planner.Lookup))
+        self.assertEqual(step.estimate, 4)
+
+    def test_plans(self):
+        step = self.check('title:login and status = open', make_planner())
+        self.assertTrue(isinstance(step, planner.Check))
+        self.assertFalse(step.on_index)
+        self.assertTrue(isinstance(step.children[0], planner.Lookup))
+
+        step = self.check('status = new or status = open', make_planner())
+        self.assertTrue(isinstance(step, planner.Union))
+
+        step = self.check('title:login or status = open', make_planner())
+        self.assertTrue(isinstance(step.children[0], planner.Scan))
+
+    def test_streaming(self):
+        # rows come out as they are checked
+        checked = []
+
+        def record(row):
+            checked.append(row)
+            return Record(RECORDS[row])
+
+        step = planner.Planner(None, POSITIONS, len(RECORDS), record
+                               ).plan(query.parse('title:o', NAMES))
+        rows = step.rows()
+        self.assertEqual(next(rows), 0)
+        self.assertEqual(checked, [0])
+        self.assertEqual(step.actual, 1)
+
+        self.assertEqual(list(rows), [1, 2, 3, 4, 5])
+        self.assertEqual(step.actual, 6)
+
+    def test_explain(self):
+        step = self.check('status = new and assigned_to = bob',
+                          make_planner())
+        lines = step.explain()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('check assigned_to = bob on '
+                                            'the index'))
+        self.assertTrue(lines[0].endswith('actual 1)'))
+        self.assertTrue(lines[1].startswith('  look up status = new'))
+
+
+if __name__ == '__main__':
+    unittest.main()
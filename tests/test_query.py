@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gitissius'))
+
+import query
+
+
+class Record(object):
+    def __init__(self, **values):
+        self.values = values
+
+    def get_value(self, name):
+        return self.values.get(name)
+
+
+FIELDS = ['title', 'status', 'assigned_to', 'created_on']
+DATES = ['created_on']
+
+
+def matches(text, **values):
+    return query.parse(text, FIELDS, DATES)(Record(**values))
+
+
+class ParseTest(unittest.TestCase):
+    def test_rules(self):
+        self.assertTrue(matches('status:new', status=u'new'))
+        self.assertTrue(matches('title:LEAK', title=u'memory leak'))
+        self.assertFalse(matches('status__exact:New', status=u'new'))
+        self.assertTrue(matches('title__startswith:mem', title=u'memory'))
+        self.assertFalse(matches('title__startswith:ory', title=u'memory'))
+
+    def test_not_on_empty_values(self):
+        # None reads as empty text, which __not accepts
+        self.assertTrue(matches('assigned_to__not:bob'))
+        self.assertFalse(matches('assigned_to:bob'))
+        self.assertFalse(matches('assigned_to__not:bob', assigned_to=u'bob'))
+
+    def test_precedence(self):
+        text = 'status = new or status = open and assigned_to = bob'
+        self.assertTrue(matches(text, status=u'new', assigned_to=u'eve'))
+        self.assertFalse(matches(text, status=u'open', assigned_to=u'eve'))
+        self.assertFalse(matches('(status = new or status = open) and '
+                                 'assigned_to = bob',
+                                 status=u'new', assigned_to=u'eve'))
+
+    def test_not(self):
+        self.assertTrue(matches('not status = closed', status=u'new'))
+        self.assertTrue(matches('not (status = closed or status = new)',
+                                status=u'open'))
+        self.assertFalse(matches('not not status = new', status=u'open'))
+
+    def test_operators(self):
+        self.assertTrue(matches('status in (new, open)', status=u'open'))
+        self.assertFalse(matches('status in (new, open)', status=u'closed'))
+        self.assertTrue(matches('status != new', status=u'open'))
+        self.assertTrue(matches('title ~ "^mem.*k$"', title=u'Memory leak'))
+        self.assertTrue(matches('assigned_to != bob'))
+        self.assertFalse(matches('assigned_to < bob'))
+
+    def test_quoted_values(self):
+        self.assertTrue(matches('title = "a, b (c)"', title=u'a, b (c)'))
+        self.assertTrue(matches("title = 'it\\'s'", title=u"it's"))
+        self.assertTrue(matches('title = "say \\"hi\\""', title=u'say "hi"'))
+
+    def test_dates(self):
+        values = {'created_on': u'2013-05-02T10:00:00'}
+        self.assertTrue(matches('created_on >= 2013-05-02', **values))
+        self.assertFalse(matches('created_on < 2013-05-02', **values))
+        self.assertTrue(matches('created_on < 2013-05-02T10:00:01', **values))
+        self.assertRaises(query.QueryError, query.parse,
+                          'created_on > yesterday', FIELDS, DATES)
+
+    def test_legacy_filters(self):
+        # values with spaces only parse as older versions took them
+        self.assertTrue(matches('title:memory leak,status:new',
+                                title=u'bad memory leak', status=u'new'))
+        self.assertFalse(matches('title:memory leak,status:new',
+                                 title=u'bad memory leak', status=u'open'))
+        self.assertTrue(matches('status__not:closed, title__exact:a bug',
+                                status=u'new', title=u'a bug'))
+        self.assertFalse(matches('status__not:closed, title__exact:a bug',
+                                 status=u'new', title=u'A bug'))
+
+    def test_errors(self):
+        for text in ['status = ', 'status = new and', '(status = new',
+                     'severity = high', 'status ~ "("',
+                     'status__not = new', 'status__sideways:new']:
+            self.assertRaises(query.QueryError, query.parse, text,
+                              FIELDS, DATES)
+
+    def test_description(self):
+        condition = query.parse('status = new and not title:"a b"', FIELDS)
+        self.assertEqual(str(condition), '(status = new and not title:"a b")')
+
+
+if __name__ == '__main__':
+    unittest.main()
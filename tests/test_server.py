@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import socket
+import unittest
+from StringIO import StringIO
+
+from support import RepositoryTest, add_issue, common, server
+
+
+A = 'a1' * 32
+
+
+class HandleTest(RepositoryTest):
+    def setUp(self):
+        super(HandleTest, self).setUp()
+        add_issue(common.git_repo, A, title=u'Served')
+        self.server = server.Server(os.path.join(self.directory, 'sock'))
+
+    def send(self, message):
+        """
+        Have the daemon handle message. Returns its reply and what
+        followed it.
+        """
+        # wrapped as accept() wraps connections
+        ours, theirs = map(lambda sock: socket.socket(_sock=sock),
+                           socket.socketpair())
+        ours.sendall(json.dumps(message) + '\n')
+        ours.shutdown(socket.SHUT_WR)
+
+        # tracebacks of bad messages are logged
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.server.handle(theirs)
+
+        finally:
+            sys.stderr = stderr
+            theirs.close()
+
+        rfile = ours.makefile('rb')
+        reply = json.loads(rfile.readline())['run']
+        rest = rfile.read()
+        ours.close()
+        return reply, rest
+
+    def message(self, *args):
+        return {'args': list(args), 'cwd': self.path, 'columns': 80}
+
+    def test_run(self):
+        reply, output = self.send(self.message('list'))
+        self.assertEqual(reply, 'daemon')
+
+        output, trailer = output.split('\0')
+        self.assertTrue('Served' in output)
+        self.assertEqual(json.loads(trailer), {'exit': 0})
+
+    def test_exit_status(self):
+        reply, output = self.send(self.message('list', '--sort', 'bogus'))
+        self.assertEqual(output, "Unknown sort key 'bogus'\n" +
+                                 '\0' + json.dumps({'exit': 1}) + '\n')
+
+    def test_bad_messages(self):
+        for message in [{}, [], ['list'], 'list', {'args': None},
+                        {'args': []}, {'args': [['list']]},
+                        {'args': ['list']},
+                        {'args': ['list'], 'cwd': self.path},
+                        {'args': ['list'], 'cwd': self.path,
+                         'columns': 'wide'},
+                        dict(self.message('list'), cwd='/nonexistent'),
+                        self.message('unknown'),
+                        self.message('new')]:
+            self.assertEqual(self.send(message), ('local', ''), message)
+
+    def test_refresh_fails(self):
+        def refresh():
+            raise OSError('the repository is gone')
+
+        self.server.refresh = refresh
+        self.assertEqual(self.send(self.message('list')), ('local', ''))
+
+    def test_stop(self):
+        self.server.running = True
+        self.assertEqual(self.send({'stop': True}), ('stopped', ''))
+        self.assertFalse(self.server.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
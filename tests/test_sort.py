@@ -0,0 +1,87 @@
+import sys
+import json
+import unittest
+
+from support import RepositoryTest, issue_data, issue_path, common
+
+
+SEVERITIES = [u'low', u'medium', u'high']
+SORT_KEYS = ['created_on', '-created_on', '-updated_on,title',
+             'severity', '-severity,created_on', 'title']
+PAGES = [(1, 0), (3, 0), (5, 2), (4, 10), (10, 16), (30, 0), (0, 3)]
+
+
+class SortTest(RepositoryTest):
+    def setUp(self):
+        super(SortTest, self).setUp()
+
+        # with ties on every sort key
+        for number in range(18):
+            issue_id = '%02x' % (number * 13) * 32
+            day = 1 + number % 5
+            common.git_repo[issue_path(issue_id)] = json.dumps(issue_data(
+                issue_id,
+                title=u'Issue %d' % (number % 7),
+                severity=SEVERITIES[number % 3],
+                created_on=u'2013-05-%02dT09:00:00' % day,
+                updated_on=u'2013-06-%02dT09:00:00' % (1 + number % 4)))
+
+        common.git_repo.commit('Added issues')
+
+        # the issue index is written on the first load, read on the next
+        self.open()
+        common.issue_manager.issuedb
+        self.open()
+
+    def ids(self, issues):
+        return [issue.get_value('id') for issue in issues]
+
+    def check_pages(self):
+        manager = common.issue_manager
+        for sort_key in SORT_KEYS:
+            everything = self.ids(manager.filter(sort_key=sort_key))
+            self.assertEqual(len(everything), 18)
+
+            for limit, offset in PAGES:
+                self.assertEqual(
+                    self.ids(manager.filter(sort_key=sort_key, limit=limit,
+                                            offset=offset)),
+                    everything[offset:offset + limit],
+                    (sort_key, limit, offset))
+
+    def test_index_order(self):
+        common.issue_manager.issuedb
+        self.assertNotEqual(common.issue_manager._index, None)
+        self.check_pages()
+
+    def test_heap(self):
+        common.issue_manager.issuedb
+        common.issue_manager._index = None
+        self.check_pages()
+
+    def test_unknown_sort_key(self):
+        self.assertRaises(ValueError, common.issue_manager.filter,
+                          sort_key='-created_on,bogus')
+
+    def test_list_errors(self):
+        # reported on stderr by the exit, not printed
+        with self.assertRaises(SystemExit) as context:
+            self.execute('list', '--sort', 'bogus')
+        self.assertEqual(context.exception.code, "Unknown sort key 'bogus'")
+
+        with self.assertRaises(SystemExit) as context:
+            self.execute('list', '--filter', 'status = new and')
+        self.assertTrue(context.exception.code.startswith(
+            'Wrong filter argument: '))
+
+        # the table has its own fields
+        with self.assertRaises(SystemExit) as context:
+            self.execute('list', '--fields', 'id,title')
+        self.assertEqual(context.exception.code,
+                         '--fields needs --format jsonl, csv or tsv')
+        self.assertEqual(self.execute('list', '--fields', 'id',
+                                      '--format', 'csv').count('\n'), 19)
+
+
+if __name__ == '__main__':
+    unittest.main()
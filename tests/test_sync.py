@@ -0,0 +1,186 @@
+import unittest
+
+from support import RepositoryTest, git, add_issue, common, gitshelve, sync
+
+
+A = 'a1' * 32
+B = 'b2' * 32
+
+
+class RemoteTest(RepositoryTest):
+    """
+    Tests with a bare remote, origin, holding the gitissius branch, and
+    another clone of it
+    """
+    def setUp(self):
+        super(RemoteTest, self).setUp()
+
+        self.remote = self.directory + '/remote.git'
+        git('init', '-q', '--bare', self.remote)
+        git('remote', 'add', 'origin', self.remote)
+        git('push', '-q', 'origin', 'gitissius')
+
+        self.other = self.make_repository('other')
+        git('remote', 'add', 'origin', self.remote, cwd=self.other)
+        git('fetch', '-q', 'origin', '+gitissius:gitissius', cwd=self.other)
+        self.other_shelf = gitshelve.open(branch='gitissius',
+                                          repository=self.other + '/.git')
+
+    def tearDown(self):
+        self.other_shelf.close()
+        super(RemoteTest, self).tearDown()
+
+    def push_other(self, issue_id, **values):
+        """
+        Commit an issue in the other clone and push it.
+        """
+        add_issue(self.other_shelf, issue_id, **values)
+        git('push', '-q', 'origin', 'gitissius', cwd=self.other)
+        return self.other_shelf.head
+
+    def remote_head(self):
+        return git('rev-parse', 'gitissius', cwd=self.remote)
+
+    def issues(self):
+        self.open()
+        return dict((issue_id, issue.get_value('title')) for issue_id, issue
+                    in common.issue_manager.issuedb.items())
+
+
+class PullTest(RemoteTest):
+    def test_fast_forward(self):
+        head = self.push_other(A, title=u'Theirs')
+
+        self.assertEqual(sync.pull(common.git_repo), 'fast-forward')
+        self.assertEqual(common.git_repo.head, head)
+        self.assertEqual(self.issues(), {A: u'Theirs'})
+
+    def test_up_to_date(self):
+        self.assertEqual(sync.pull(common.git_repo), 'up-to-date')
+
+    def test_merge(self):
+        add_issue(common.git_repo, A, title=u'Ours')
+        ours = common.git_repo.head
+        theirs = self.push_other(B, title=u'Theirs')
+        branch = git('symbolic-ref', 'HEAD')
+
+        self.assertEqual(sync.pull(common.git_repo), 'merged')
+        self.assertEqual(git('rev-parse', 'gitissius^1'), ours)
+        self.assertEqual(git('rev-parse', 'gitissius^2'), theirs)
+        self.assertEqual(self.issues(), {A: u'Ours', B: u'Theirs'})
+
+        # the branch of the user and the working tree are left alone
+        self.assertEqual(git('symbolic-ref', 'HEAD'), branch)
+        self.assertEqual(git('status', '--porcelain'), '')
+
+    def test_merge_same_issue(self):
+        add_issue(self.other_shelf, A)
+        git('push', '-q', 'origin', 'gitissius', cwd=self.other)
+        sync.pull(common.git_repo)
+
+        add_issue(common.git_repo, A, status=u'closed',
+                  updated_on=u'2013-05-02T09:00:00')
+        self.push_other(A, title=u'Renamed', updated_on=u'2013-05-03T09:00:00')
+
+        self.assertEqual(sync.pull(common.git_repo), 'merged')
+
+        self.open()
+        issue = common.issue_manager.get(A)
+        self.assertEqual(issue.get_value('status'), u'closed')
+        self.assertEqual(issue.get_value('title'), u'Renamed')
+
+    def test_no_remote_branch(self):
+        git('update-ref', '-d', 'refs/heads/gitissius', cwd=self.remote)
+        self.assertEqual(sync.pull(common.git_repo), None)
+
+    def test_refused_when_checked_out(self):
+        pulled = []
+        pull = sync.pull
+        sync.pull = lambda *args: pulled.append(args)
+        try:
+            git('symbolic-ref', 'HEAD', 'refs/heads/gitissius')
+            output = self.execute('pull')
+
+        finally:
+            sync.pull = pull
+
+        self.assertEqual(pulled, [])
+        self.assertTrue('checked out' in output)
+
+
+class UpdateTest(RemoteTest):
+    def setUp(self):
+        super(UpdateTest, self).setUp()
+
+        # the git commands sync runs
+        self.commands = []
+        run = common.git_repo.git
+
+        def record(*args, **kwargs):
+            self.commands.append(args)
+            return run(*args, **kwargs)
+
+        common.git_repo.git = record
+
+    def ran(self, command):
+        return [args for args in self.commands if args[0] == command]
+
+    def test_nothing_to_do(self):
+        self.assertEqual(sync.update(common.git_repo),
+                         ('up-to-date', 'up-to-date'))
+        self.assertEqual(self.ran('fetch'), [])
+        self.assertEqual(self.ran('push'), [])
+        self.assertEqual(len(self.ran('ls-remote')), 1)
+
+    def test_push_trusts_tracking_ref(self):
+        add_issue(common.git_repo, A)
+        self.assertEqual(sync.push(common.git_repo), 'pushed')
+        self.assertEqual(self.remote_head(), common.git_repo.head)
+
+        # no network at all
+        del self.commands[:]
+        self.assertEqual(sync.push(common.git_repo), 'up-to-date')
+        self.assertEqual(self.ran('push'), [])
+        self.assertEqual(self.ran('ls-remote'), [])
+
+    def test_diverged(self):
+        add_issue(common.git_repo, A, title=u'Ours')
+        self.push_other(B, title=u'Theirs')
+
+        self.assertEqual(sync.update(common.git_repo), ('merged', 'pushed'))
+
+        self.assertEqual(self.ran('fetch'),
+                         [('fetch', '--quiet', 'origin',
+                           '+refs/heads/gitissius:'
+                           'refs/remotes/origin/gitissius')])
+        self.assertEqual(self.ran('push'),
+                         [('push', '--quiet', 'origin',
+                           'refs/heads/gitissius:refs/heads/gitissius')])
+        self.assertEqual(self.remote_head(), common.git_repo.head)
+
+        # nothing but the gitissius branch is pushed
+        self.assertEqual(git('for-each-ref', '--format=%(refname)',
+                             cwd=self.remote), 'refs/heads/gitissius')
+        self.assertEqual(self.issues(), {A: u'Ours', B: u'Theirs'})
+
+    def test_fetched_but_not_merged(self):
+        head = self.push_other(B, title=u'Theirs')
+        git('fetch', '-q', 'origin')
+
+        self.assertEqual(sync.update(common.git_repo),
+                         ('fast-forward', 'up-to-date'))
+        self.assertEqual(common.git_repo.head, head)
+        self.assertEqual(self.ran('fetch'), [])
+
+    def test_ahead_of_remote(self):
+        add_issue(common.git_repo, A)
+        sync.push(common.git_repo)
+        add_issue(common.git_repo, B)
+
+        self.assertEqual(sync.update(common.git_repo),
+                         ('up-to-date', 'pushed'))
+        self.assertEqual(self.ran('fetch'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()